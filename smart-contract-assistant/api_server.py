@@ -1,23 +1,48 @@
 """
 FastAPI server for Smart Contract Assistant
 """
+import asyncio
+import json
 import logging
 import shutil
+import threading
+import time
+import uuid
+from contextlib import AsyncExitStack, asynccontextmanager
 from pathlib import Path
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from typing import List, Optional
+from fastapi import FastAPI, File, Request, UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
-from config import UPLOAD_DIR, API_PORT
+import metrics
+import tracing
+from config import (
+    UPLOAD_DIR, API_PORT, BULK_INGEST_ROOT,
+    EXTRACTION_POOL_KIND, EXTRACTION_WORKERS, EXTRACTION_MAX_PENDING,
+    INGEST_WORKERS, INGEST_MAX_PENDING, INFERENCE_WORKERS, INFERENCE_MAX_PENDING,
+    RESPONSE_CACHE_ENABLED, RERANK_ENABLED, TENANT_STORE_DIR, EMBEDDING_MODEL, WARM_UP_MODELS
+)
+from bulk_ingest import BulkIngestor
 from document_processor import DocumentProcessor
-from vector_store import VectorStoreManager
+from vector_store import AmbiguousDocumentError, VectorStoreManager, scope_filter
 from rag_chain import RAGChain
+from reranker import CrossEncoderReranker
+from summarizer import DocumentSummarizer
 from guardrails import Guardrails
+from ingestion import IngestionQueue
+from model_registry import get_embeddings, loaded_models
+from response_cache import ResponseCache
+from tenants import TenantStore, TenantStores
+from worker_pools import PoolBusyError, WorkerPool
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+created_at = time.perf_counter()
+
 app = FastAPI(title="Smart Contract Assistant API")
 
 # CORS
@@ -27,115 +52,586 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
+# Added last, so it is outermost and times the whole request
+app.add_middleware(tracing.TraceMiddleware)
 
 # Global instances
 doc_processor = DocumentProcessor()
 vector_store_manager = VectorStoreManager()
 rag_chain = None
-guardrails = Guardrails()
+summarizer = None
+rag_chain_lock = threading.Lock()
+guardrails = Guardrails(vector_store_manager=vector_store_manager)
+response_cache = ResponseCache(lambda: vector_store_manager.version) if RESPONSE_CACHE_ENABLED else None
+reranker = CrossEncoderReranker() if RERANK_ENABLED else None
+
+# The server is live as soon as it accepts requests and ready once warm_up()
+# has loaded the vector store (and, with WARM_UP_MODELS, the models)
+startup_state = {"status": "starting", "error": None, "timings": {}}
+
+# Worker pools keep blocking work off the event loop
+extraction_pool = WorkerPool("extraction", EXTRACTION_WORKERS, EXTRACTION_MAX_PENDING, kind=EXTRACTION_POOL_KIND)
+ingest_pool = WorkerPool("ingest", INGEST_WORKERS, INGEST_MAX_PENDING)
+inference_pool = WorkerPool("inference", INFERENCE_WORKERS, INFERENCE_MAX_PENDING)
+
+def apply_guardrails(answer: str, sources: List[Dict], manager: VectorStoreManager) -> Optional[Dict]:
+    """
+    Validate an answer against its sources, if guardrails are enabled
+    
+    `manager` is the store that served the answer; the sources' chunks are
+    read from it by id, so they are checked in full rather than as previews.
+    """
+    if not guardrails.enabled or not sources:
+        return None
+    contexts = [s.get("preview", "") for s in sources]
+    with tracing.span("guardrails"):
+        return guardrails.validate_response(answer, contexts, [s.get("chunk_id") for s in sources], manager)
+
+def with_guardrails(events: Iterator[Dict], manager: VectorStoreManager) -> Iterator[Dict]:
+    """Pass RAG stream events through, adding guardrail results after the done event"""
+    sources = []
+    for event in events:
+        if event["type"] == "sources":
+            sources = event["sources"]
+        yield event
+        if event["type"] == "done":
+            guardrail_results = apply_guardrails(event["answer"], sources, manager)
+            if guardrail_results is not None:
+                yield {"type": "guardrails", "guardrails": guardrail_results}
+
+async def ndjson(events: AsyncIterator[Dict]) -> AsyncIterator[str]:
+    """Serialize events as NDJSON lines"""
+    async for event in events:
+        yield json.dumps(event) + "\n"
+
+def save_upload(file: UploadFile, file_path: Path):
+    """Write an uploaded file to disk"""
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+def ensure_rag_chain():
+    """
+    Build the RAG chain and summarizer once the vector store exists
+    
+    Both are built a single time: the retriever searches the live store and
+    the LLM client is shared, so documents indexed later are visible without
+    a rebuild. The chain is published last, after it is complete, so
+    requests see either no chain or a ready one.
+    """
+    global rag_chain, summarizer
+    if rag_chain is not None or vector_store_manager.vector_store is None:
+        return
+    with rag_chain_lock:
+        if rag_chain is not None:
+            return
+        chain = RAGChain(vector_store_manager.get_retriever(), cache=response_cache, reranker=reranker)
+        summarizer = DocumentSummarizer(chain.llm, vector_store_manager)
+        rag_chain = chain
+
+ingestion_queue = IngestionQueue(
+    doc_processor,
+    vector_store_manager,
+    extraction_pool,
+    ingest_pool,
+    on_indexed=ensure_rag_chain
+)
+bulk_ingestor = BulkIngestor(doc_processor, vector_store_manager, on_indexed=ensure_rag_chain, ingest_pool=ingest_pool)
+# Running bulk ingestions, referenced so they are not garbage collected
+bulk_tasks = set()
+
+def build_tenant_chain(manager: VectorStoreManager) -> Tuple[RAGChain, DocumentSummarizer]:
+    """RAG chain and summarizer over a tenant's store, with their own caches"""
+    cache = ResponseCache(lambda: manager.version) if RESPONSE_CACHE_ENABLED else None
+    chain = RAGChain(manager.get_retriever(), cache=cache, reranker=reranker)
+    summary_cache = TENANT_STORE_DIR / manager.tenant / "summaries.json"
+    return chain, DocumentSummarizer(chain.llm, manager, cache_path=summary_cache)
+
+def open_tenant(name: str) -> TenantStore:
+    manager = VectorStoreManager(tenant=name, shared_with=vector_store_manager)
+    return TenantStore(name, manager, build_tenant_chain)
+
+tenant_stores = TenantStores(open_tenant, in_use=ingestion_queue.tenant_busy)
+
+# Numbers the components keep themselves, read when /metrics is scraped
+for pool in (extraction_pool, ingest_pool, inference_pool):
+    metrics.reading(
+        "worker_pool_pending", lambda pool=pool: pool.stats()["pending"],
+        description="Work queued or running in a pool", labels={"pool": pool.name}
+    )
+metrics.reading("ingestion_jobs_active", ingestion_queue.active_jobs, description="Ingestion jobs queued or running")
+for result in ("hits", "misses"):
+    metrics.reading(
+        "embedding_cache_lookups_total", lambda result=result: getattr(vector_store_manager.embeddings, result, None),
+        kind="counter", description="Embedding cache lookups by result", labels={"result": result}
+    )
+
+@asynccontextmanager
+async def tenant_store(tenant: Optional[str]) -> AsyncIterator[Optional[TenantStore]]:
+    """
+    A tenant's store, held open for the duration of a request; None for the main store
+    
+    Opening a store reads it from disk, so it happens off the event loop.
+    Invalid tenant names are answered with 400.
+    """
+    if not tenant:
+        yield None
+        return
+    try:
+        store = await run_in_threadpool(tenant_stores.acquire, tenant)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        yield store
+    finally:
+        await run_in_threadpool(tenant_stores.release, store)
+
+def resolve(store: Optional[TenantStore]) -> Tuple[Optional[RAGChain], Optional[DocumentSummarizer]]:
+    """The chain and summarizer serving a tenant's store, or the default ones"""
+    if store is None:
+        return rag_chain, summarizer
+    return store.rag_chain, store.summarizer
+
+def manager_for(store: Optional[TenantStore]) -> VectorStoreManager:
+    """The vector store manager of a tenant's store, or the main one"""
+    return store.vector_store_manager if store is not None else vector_store_manager
+
+async def checked_scope(
+    filename: Optional[str], document_id: Optional[str], section: Optional[str], manager: VectorStoreManager
+) -> Optional[Dict]:
+    """
+    scope_filter() for a request
+    
+    Answers 409 when the filename is shared by several documents and 404
+    when no chunk matches, rather than answering from an empty context.
+    """
+    if filename and not document_id:
+        try:
+            await run_in_threadpool(manager.check_unambiguous, filename)
+        except AmbiguousDocumentError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+    where = scope_filter(filename, document_id, section)
+    if where is not None and not await run_in_threadpool(manager.has_chunks, where):
+        scope = ", ".join(f"{name}={value!r}" for name, value in (
+            ("filename", filename), ("document_id", document_id), ("section", section)
+        ) if value)
+        raise HTTPException(status_code=404, detail=f"No chunks match {scope}")
+    return where
+
+async def held_until_done(events: AsyncIterator[Dict], stack: AsyncExitStack) -> AsyncIterator[Dict]:
+    """Stream events, leaving `stack` (which holds the tenant store) once the stream ends or is closed"""
+    async with stack:
+        async for event in events:
+            yield event
+
+def answer_question(
+    chain: RAGChain,
+    question: str,
+    use_history: bool = False,
+    history: List[dict] = None,
+    bypass_cache: bool = False,
+    where: Optional[Dict] = None,
+    manager: VectorStoreManager = vector_store_manager
+) -> Dict:
+    """Answer a question and apply guardrails against the store `manager` serves"""
+    # Use history if provided
+    if use_history and history:
+        result = chain.invoke_with_history(question, history, where=where)
+    else:
+        result = chain.invoke(question, use_cache=not bypass_cache, where=where)
+    
+    # Apply guardrails
+    guardrail_results = apply_guardrails(result["answer"], result.get("sources", []), manager)
+    if guardrail_results is not None:
+        result["guardrails"] = guardrail_results
+    
+    return result
+
+def warm_up():
+    """Load the vector store and models in the background while the server already accepts requests"""
+    timings = startup_state["timings"]
+    try:
+        start = time.perf_counter()
+        if vector_store_manager.load_vector_store():
+            ensure_rag_chain()
+            logger.info("Loaded existing vector store")
+        else:
+            logger.info("No existing vector store found")
+        timings["vector_store_s"] = round(time.perf_counter() - start, 2)
+        
+        if WARM_UP_MODELS:
+            start = time.perf_counter()
+            get_embeddings(EMBEDDING_MODEL).embed_query("warm up")
+            if reranker:
+                reranker.warm_up()
+            timings["models_s"] = round(time.perf_counter() - start, 2)
+        
+        timings["ready_after_s"] = round(time.perf_counter() - created_at, 2)
+        startup_state["status"] = "ready"
+        logger.info(f"Ready {timings['ready_after_s']}s after import")
+    except Exception as e:
+        logger.error(f"Startup failed: {e}", exc_info=True)
+        startup_state.update(status="failed", error=str(e))
+
+def require_ready():
+    """Answer 503 until startup has finished, so clients and load balancers retry later"""
+    status = startup_state["status"]
+    if status != "ready":
+        detail = "Server is starting up" if status == "starting" else f"Startup failed: {startup_state['error']}"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "1"})
+
+async def open_answer_stream(
+    question: str,
+    history: Optional[List[dict]] = None,
+    bypass_cache: bool = False,
+    filename: Optional[str] = None,
+    document_id: Optional[str] = None,
+    section: Optional[str] = None,
+    tenant: Optional[str] = None
+) -> AsyncIterator[Dict]:
+    """
+    Answer events, with guardrail results last, for /qa/stream and in-process clients
+    
+    Checks run before the first event, so failures surface as HTTP errors.
+    A tenant's store stays open until the stream ends.
+    """
+    require_ready()
+    
+    async with AsyncExitStack() as stack:
+        store = await stack.enter_async_context(tenant_store(tenant))
+        chain, _ = resolve(store)
+        if chain is None:
+            raise HTTPException(status_code=400, detail="No documents loaded. Please upload a document first.")
+        where = await checked_scope(filename, document_id, section, manager_for(store))
+        
+        inference_pool.check_capacity()
+        events = chain.stream(question, history, use_cache=not bypass_cache, where=where)
+        return held_until_done(inference_pool.iterate(with_guardrails(events, manager_for(store))), stack.pop_all())
+
+async def open_summary_stream(
+    filename: Optional[str] = None, document_id: Optional[str] = None, tenant: Optional[str] = None
+) -> AsyncIterator[Dict]:
+    """Summary events for /summarize/stream and in-process clients"""
+    require_ready()
+    
+    async with AsyncExitStack() as stack:
+        store = await stack.enter_async_context(tenant_store(tenant))
+        _, doc_summarizer = resolve(store)
+        if doc_summarizer is None:
+            raise HTTPException(status_code=400, detail="No documents loaded. Please upload a document first.")
+        await checked_scope(filename, document_id, None, manager_for(store))
+        
+        inference_pool.check_capacity()
+        events = doc_summarizer.stream(filename, document_id)
+        return held_until_done(inference_pool.iterate(events), stack.pop_all())
+
+@app.exception_handler(PoolBusyError)
+async def pool_busy_handler(request: Request, exc: PoolBusyError):
+    """Reject work when a pool is saturated so clients can back off"""
+    logger.warning(str(exc))
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
 @app.on_event("startup")
 async def startup():
-    """Initialize on startup"""
-    global rag_chain
-    # Try to load existing vector store
-    if vector_store_manager.load_vector_store():
-        retriever = vector_store_manager.get_retriever()
-        rag_chain = RAGChain(retriever)
-        logger.info("Loaded existing vector store")
-    else:
-        logger.info("No existing vector store found")
+    """Start warming up in the background so the server accepts requests right away"""
+    # In-process clients (the co-located UI) schedule their calls on this loop
+    app.state.loop = asyncio.get_running_loop()
+    app.state.warm_up = asyncio.create_task(run_in_threadpool(warm_up))
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop worker pools"""
+    for pool in (extraction_pool, ingest_pool, inference_pool):
+        pool.shutdown()
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: 503 until the vector store and models are loaded"""
+    content = {"status": startup_state["status"], "error": startup_state["error"], "timings": startup_state["timings"]}
+    return JSONResponse(status_code=200 if startup_state["status"] == "ready" else 503, content=content)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage latencies, request counts, tokens, retrieval and cache counters in the Prometheus text format"""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """Per-stage timings of a recent request, by the ID from its X-Trace-Id header"""
+    trace = tracing.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Trace not found: {trace_id}")
+    return trace
 
 @app.get("/health")
 async def health():
-    """Health check"""
+    """Health check with readiness and component statistics"""
     return {
         "status": "healthy",
-        "vector_store_loaded": rag_chain is not None
+        "ready": startup_state["status"] == "ready",
+        "startup": startup_state,
+        "vector_store_loaded": rag_chain is not None,
+        "pools": {pool.name: pool.stats() for pool in (extraction_pool, ingest_pool, inference_pool)},
+        "ingestion_jobs_active": ingestion_queue.active_jobs(),
+        "models_loaded": loaded_models(),
+        "response_cache": response_cache.stats() if response_cache else None,
+        "reranker": reranker.stats() if reranker else None,
+        "embedding_cache": vector_store_manager.embeddings.stats() if hasattr(vector_store_manager.embeddings, "stats") else None,
+        "query_batching": vector_store_manager.query_batcher.stats() if vector_store_manager.query_batcher else None,
+        "tenants": tenant_stores.stats()
     }
 
-@app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """Upload and process a document"""
-    global rag_chain
+async def queue_upload(filename: str, save: Callable[[Path], None], tenant: Optional[str] = None) -> Dict:
+    """Save a document with `save(path)` and queue it for processing, into a tenant's own store if given"""
+    require_ready()
     
     # Validate file type
-    if not file.filename.endswith((".pdf", ".docx")):
+    if not filename.endswith((".pdf", ".docx")):
         raise HTTPException(status_code=400, detail="Only PDF and DOCX files are supported")
     
-    try:
-        # Save file
-        file_path = UPLOAD_DIR / file.filename
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        logger.info(f"Processing file: {file.filename}")
-        
-        # Process document
-        chunks = doc_processor.process_file(file_path)
-        
-        # Add to vector store
-        if vector_store_manager.vector_store is None:
-            vector_store_manager.create_vector_store(chunks)
-        else:
-            vector_store_manager.add_documents(chunks)
-        
-        # Update RAG chain
-        retriever = vector_store_manager.get_retriever()
-        rag_chain = RAGChain(retriever)
+    # Reject before saving if the queue is full
+    ingestion_queue.check_capacity()
+    
+    # Once submitted, the job keeps the tenant's store open until it is done
+    async with tenant_store(tenant) as store:
+        try:
+            # Save file, in a directory of its own so same-named uploads do not overwrite each other
+            job_id = uuid.uuid4().hex
+            upload_dir = (UPLOAD_DIR / tenant if tenant else UPLOAD_DIR) / job_id
+            upload_dir.mkdir(parents=True, exist_ok=True)
+            file_path = upload_dir / Path(filename).name
+            with tracing.span("upload_save"):
+                await run_in_threadpool(save, file_path)
+            
+            # Process in the background
+            if store is not None:
+                job = ingestion_queue.submit(
+                    filename,
+                    file_path,
+                    tenant=tenant,
+                    vector_store_manager=store.vector_store_manager,
+                    on_indexed=store.ensure_chain,
+                    job_id=job_id
+                )
+            else:
+                job = ingestion_queue.submit(filename, file_path, job_id=job_id)
+            
+            return {
+                "message": "File uploaded and queued for processing",
+                "job_id": job.id,
+                "filename": filename,
+                "tenant": tenant,
+                "status": job.status
+            }
         
-        return {
-            "message": "File uploaded and processed successfully",
-            "filename": file.filename,
-            "chunks": len(chunks)
-        }
+        except PoolBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing file: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+@app.post("/upload", status_code=202)
+async def upload_file(file: UploadFile = File(...), tenant: Optional[str] = None):
+    """Upload a document and queue it for processing, into a tenant's own store if given"""
+    return await queue_upload(file.filename, lambda path: save_upload(file, path), tenant)
+
+@app.post("/ingest/bulk", status_code=202)
+async def bulk_ingest(path: Optional[str] = None, file: Optional[UploadFile] = File(None)):
+    """
+    Ingest a directory or zip archive in the background
     
+    Pass either `path`, a directory or zip under BULK_INGEST_ROOT on the
+    server, or upload a zip archive as `file`.
+    """
+    require_ready()
+    
+    if file is not None and not file.filename.lower().endswith(".zip"):
+        raise HTTPException(status_code=400, detail="Only zip archives can be uploaded for bulk ingestion")
+    if file is None:
+        if not path:
+            raise HTTPException(status_code=400, detail="Provide a path or a zip file")
+        target = Path(path).resolve()
+        if not target.is_relative_to(BULK_INGEST_ROOT.resolve()) or not target.exists():
+            raise HTTPException(status_code=400, detail=f"Path must be an existing directory or zip under {BULK_INGEST_ROOT}")
+    
+    if not bulk_ingestor.reserve():
+        raise PoolBusyError("A bulk ingestion is already running, try again later")
+    job = None
+    try:
+        if file is not None:
+            job = bulk_ingestor.create_job(Path(file.filename).name)
+            target = bulk_ingestor.job_dir(job) / Path(file.filename).name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            await run_in_threadpool(save_upload, file, target)
+            job.update(path=target)
+        else:
+            job = bulk_ingestor.create_job(target)
     except Exception as e:
-        logger.error(f"Error processing file: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+        if job is not None:
+            job.update(status="failed", error=str(e), finished_at=time.time())
+        bulk_ingestor.release()
+        raise
+    
+    task = asyncio.create_task(run_in_threadpool(bulk_ingestor.run, target, job, reserved=True))
+    bulk_tasks.add(task)
+    task.add_done_callback(bulk_tasks.discard)
+    return job.to_dict()
+
+@app.get("/ingest/bulk/{job_id}")
+async def bulk_ingest_status(job_id: str):
+    """Get the status and throughput of a bulk ingestion job"""
+    job = bulk_ingestor.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job.to_dict()
+
+@app.get("/jobs")
+async def list_jobs():
+    """List recent ingestion jobs"""
+    return {"jobs": ingestion_queue.list_jobs()}
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Get the status and progress of an ingestion job"""
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/progress")
+async def job_progress(job_id: str):
+    """Stream job snapshots as NDJSON until the job finishes"""
+    if ingestion_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    
+    async def snapshots():
+        async for snapshot in ingestion_queue.watch(job_id):
+            yield json.dumps(snapshot) + "\n"
+    
+    return StreamingResponse(snapshots(), media_type="application/x-ndjson")
 
 @app.post("/summarize")
-async def summarize_document(filename: Optional[str] = None):
-    """Summarize the uploaded document"""
-    if rag_chain is None:
-        raise HTTPException(status_code=400, detail="No documents loaded. Please upload a document first.")
+async def summarize_document(
+    filename: Optional[str] = None, document_id: Optional[str] = None, tenant: Optional[str] = None
+):
+    """Summarize a document with map-reduce over all of its chunks; defaults to the latest upload"""
+    require_ready()
     
-    try:
-        # Get summary by asking a summary question
-        summary_question = "Provide a comprehensive summary of this document, including key terms, parties involved, main obligations, and important dates."
-        result = rag_chain.invoke(summary_question)
+    async with tenant_store(tenant) as store:
+        _, doc_summarizer = resolve(store)
+        if doc_summarizer is None:
+            raise HTTPException(status_code=400, detail="No documents loaded. Please upload a document first.")
         
-        return {
-            "summary": result["answer"],
-            "sources": result.get("sources", [])
-        }
-    except Exception as e:
-        logger.error(f"Error generating summary: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+        try:
+            return await inference_pool.run(doc_summarizer.summarize, filename, document_id)
+        except PoolBusyError:
+            raise
+        except AmbiguousDocumentError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error generating summary: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.post("/qa")
-async def question_answer(question: str, use_history: bool = False, history: List[dict] = None):
-    """Answer a question with optional conversation history"""
-    if rag_chain is None:
-        raise HTTPException(status_code=400, detail="No documents loaded. Please upload a document first.")
+async def question_answer(
+    question: str,
+    use_history: bool = False,
+    history: List[dict] = None,
+    bypass_cache: bool = False,
+    filename: Optional[str] = None,
+    document_id: Optional[str] = None,
+    section: Optional[str] = None,
+    tenant: Optional[str] = None
+):
+    """
+    Answer a question with optional conversation history; set bypass_cache to skip cached answers
     
-    try:
-        # Use history if provided
-        if use_history and history:
-            result = rag_chain.invoke_with_history(question, history)
-        else:
-            result = rag_chain.invoke(question)
-        
-        # Apply guardrails
-        if guardrails.enabled and result.get("sources"):
-            context = "\n".join([s.get("preview", "") for s in result["sources"]])
-            guardrail_results = guardrails.validate_response(result["answer"], context)
-            result["guardrails"] = guardrail_results
+    filename, document_id and section limit retrieval to matching chunks;
+    tenant answers from that tenant's own store.
+    """
+    require_ready()
+    
+    async with tenant_store(tenant) as store:
+        chain, _ = resolve(store)
+        if chain is None:
+            raise HTTPException(status_code=400, detail="No documents loaded. Please upload a document first.")
         
-        return result
+        where = await checked_scope(filename, document_id, section, manager_for(store))
+        try:
+            return await inference_pool.run(
+                answer_question, chain, question, use_history, history, bypass_cache, where, manager_for(store)
+            )
+        except PoolBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Error answering question: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+@app.post("/qa/stream")
+async def question_answer_stream(
+    question: str,
+    use_history: bool = False,
+    history: List[dict] = None,
+    bypass_cache: bool = False,
+    filename: Optional[str] = None,
+    document_id: Optional[str] = None,
+    section: Optional[str] = None,
+    tenant: Optional[str] = None
+):
+    """
+    Stream an answer as NDJSON events
+    
+    Events arrive in order: sources, token (repeated), done, then guardrails.
+    Takes the same scope parameters as /qa.
+    """
+    events = await open_answer_stream(
+        question,
+        history if use_history else None,
+        bypass_cache=bypass_cache,
+        filename=filename,
+        document_id=document_id,
+        section=section,
+        tenant=tenant
+    )
+    return StreamingResponse(ndjson(events), media_type="application/x-ndjson")
+
+@app.post("/summarize/stream")
+async def summarize_document_stream(
+    filename: Optional[str] = None, document_id: Optional[str] = None, tenant: Optional[str] = None
+):
+    """
+    Stream a document summary as NDJSON events
+    
+    Sections are summarized first; tokens of the final combined summary are
+    streamed as they are generated, followed by a done event.
+    """
+    events = await open_summary_stream(filename, document_id, tenant)
+    return StreamingResponse(ndjson(events), media_type="application/x-ndjson")
+
+@app.post("/guardrails/validate")
+async def validate_answers(pairs: List[dict]):
+    """
+    Check many answers for grounding at once, e.g. for offline evaluation
+    
+    Each item has "answer", "contexts" (chunk texts) and optionally
+    "chunk_ids" so stored chunk embeddings are reused.
+    """
+    if any("answer" not in pair for pair in pairs):
+        raise HTTPException(status_code=400, detail="Every item needs an answer")
+    try:
+        return await inference_pool.run(guardrails.validate_batch, pairs)
+    except PoolBusyError:
+        raise
     except Exception as e:
-        logger.error(f"Error answering question: {e}", exc_info=True)
+        logger.error(f"Error validating answers: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 if __name__ == "__main__":
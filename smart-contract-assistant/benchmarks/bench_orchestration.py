@@ -0,0 +1,98 @@
+"""
+Micro-benchmark of per-request orchestration overhead in RAGChain
+
+The LLM is a fake chat model and retrieval returns fixed chunks, so the
+timings cover only prompt formatting, context building, LCEL dispatch and
+callbacks. Run from the project directory:
+
+    python benchmarks/bench_orchestration.py --iterations 2000
+
+With --max-p50-ms the script exits non-zero when any path is slower, so it
+can guard against orchestration regressions.
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from rag_chain import RAGChain
+
+ANSWER = "Either party may terminate the agreement with 30 days written notice."
+
+HISTORY = [
+    {"human": "Who are the parties?", "assistant": "The Client and the Contractor."},
+    {"human": "When does it start?", "assistant": "On the effective date in Section 1."}
+]
+
+class FixedRetriever:
+    """Retriever with the embed/search interface of StoreRetriever that returns fixed chunks"""
+    
+    def __init__(self, docs: List[Document]):
+        self.docs = docs
+    
+    def embed_query(self, query: str) -> List[float]:
+        return [0.0] * 384
+    
+    def search(self, embedding: List[float], k: int = None, query: str = None, where: Dict = None) -> List[Document]:
+        return list(self.docs)
+
+def sample_docs(count: int = 5, chars: int = 900) -> List[Document]:
+    text = ("The Contractor shall deliver the services described in Exhibit A. " * 20)[:chars]
+    return [
+        Document(page_content=text, metadata={"filename": "contract.pdf", "chunk_index": i * 2, "page": i + 1, "section": f"{i + 1}. Services"})
+        for i in range(count)
+    ]
+
+def measure(fn: Callable[[], object], iterations: int, warmup: int) -> Dict[str, float]:
+    """Latency percentiles of fn in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": round(samples[len(samples) // 2], 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="RAGChain orchestration overhead")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--max-p50-ms", type=float, help="Fail if any path's p50 exceeds this")
+    args = parser.parse_args()
+    
+    llm = FakeListChatModel(responses=[ANSWER])
+    chain = RAGChain(FixedRetriever(sample_docs()), llm=llm)
+    
+    paths = {
+        "llm_only": lambda: llm.invoke("question"),
+        "invoke": lambda: chain.invoke("What is the notice period?", use_cache=False),
+        "invoke_with_history": lambda: chain.invoke_with_history("What is the notice period?", HISTORY),
+        "stream": lambda: list(chain.stream("What is the notice period?", HISTORY, use_cache=False))
+    }
+    
+    failed = False
+    print(f"{'path':<22}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, fn in paths.items():
+        stats = measure(fn, args.iterations, args.warmup)
+        print(f"{name:<22}{stats['mean_ms']:>10}{stats['p50_ms']:>10}{stats['p95_ms']:>10}")
+        if args.max_p50_ms is not None and name != "llm_only" and stats["p50_ms"] > args.max_p50_ms:
+            failed = True
+    if failed:
+        print(f"Orchestration overhead above {args.max_p50_ms} ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Cold-start benchmark: import cost per mode and API time to live and ready
+
+Each measurement runs in a fresh interpreter, so nothing is cached in
+memory between runs (the OS page cache still is). Run from the project
+directory:
+
+    python benchmarks/bench_startup.py --runs 5
+
+"live" is when /health/live first answers, i.e. when the server accepts
+requests; "ready" is when /health/ready returns 200, after the vector store
+and models are loaded. With --max-ready-s the script exits non-zero when
+the median time to ready is slower.
+"""
+import argparse
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+# What each mode of main.py imports before it starts serving
+MODES = {
+    "main": "main",
+    "api": "api_server",
+    "ui": "gradio_ui"
+}
+
+def import_seconds(module: str) -> Optional[float]:
+    """Time to import a module in a fresh interpreter, None if it cannot be imported"""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=PROJECT_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _status(url: str) -> Optional[int]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+def api_cold_start(timeout: float) -> Dict[str, Optional[float]]:
+    """Seconds from process start until the API is live and until it is ready"""
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api_server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    live = ready = None
+    timings = None
+    try:
+        while time.perf_counter() - start < timeout and server.poll() is None:
+            if live is None and _status(f"{base}/health/live") == 200:
+                live = time.perf_counter() - start
+            if live is not None and _status(f"{base}/health/ready") == 200:
+                ready = time.perf_counter() - start
+                with urllib.request.urlopen(f"{base}/health/ready", timeout=1) as response:
+                    timings = json.load(response).get("timings")
+                break
+            time.sleep(0.02)
+    finally:
+        server.terminate()
+        server.wait()
+    return {"live_s": live, "ready_s": ready, "server_timings": timings}
+
+def _median(values: List[Optional[float]]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return round(statistics.median(values), 3) if values else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start time per mode")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300, help="Give up on a server start after this many seconds")
+    parser.add_argument("--max-ready-s", type=float, help="Fail if the median time to ready exceeds this")
+    args = parser.parse_args()
+    
+    print(f"{'import':<22}{'median s':>10}")
+    for mode, module in MODES.items():
+        seconds = _median([import_seconds(module) for _ in range(args.runs)])
+        print(f"{mode + ' (' + module + ')':<22}{seconds if seconds is not None else 'n/a':>10}")
+    
+    runs = [api_cold_start(args.timeout) for _ in range(args.runs)]
+    live, ready = _median([r["live_s"] for r in runs]), _median([r["ready_s"] for r in runs])
+    print(f"\n{'api server':<22}{'median s':>10}")
+    print(f"{'live':<22}{live if live is not None else 'n/a':>10}")
+    print(f"{'ready':<22}{ready if ready is not None else 'n/a':>10}")
+    print(f"server-side timings of the last run: {runs[-1]['server_timings']}")
+    
+    if args.max_ready_s is not None and (ready is None or ready > args.max_ready_s):
+        print(f"Time to ready above {args.max_ready_s} s")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+Component benchmark suite with machine-readable results and a baseline check
+
+Runs offline on a CPU-only machine: documents are generated, the LLM is a
+fake chat model with a fixed latency, and the vector store and guardrail
+benchmarks use deterministic fake embeddings unless --real-embeddings is
+given. Run from the project directory:
+
+    python benchmarks/bench_suite.py                  # run and compare with benchmarks/baseline.json
+    python benchmarks/bench_suite.py --save-baseline  # run and store the results as the baseline
+    python benchmarks/bench_suite.py --only vector_store --sizes 1000 10000
+
+Results are written as JSON to benchmarks/results/. Metrics ending in
+"_per_s" are better when higher and metrics ending in "_ms" when lower; any
+that is worse than the baseline by more than --tolerance is reported as a
+regression and the script exits non-zero. It also exits non-zero when there
+is no baseline to compare with.
+
+The committed baseline.json is a reference run; its "meta" records the
+machine it was measured on. Absolute numbers only compare on similar
+hardware, so re-record the baseline with --save-baseline on the machine
+that runs the check.
+"""
+import os
+
+# Measure the components themselves: no persistent embedding cache, no batching window, no model downloads
+os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+os.environ.setdefault("QUERY_BATCHING_ENABLED", "false")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import argparse
+import json
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from bench_orchestration import ANSWER, HISTORY, FixedRetriever, measure, sample_docs
+from config import EMBEDDING_MODEL, VECTOR_STORE_TYPE
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+RESULTS_DIR = BENCH_DIR / "results"
+
+EMBEDDING_DIM = 384  # Matches the default MiniLM model
+
+# Latency regressions smaller than this are treated as noise
+MIN_REGRESSION_MS = 0.2
+
+WORDS = (
+    "agreement party contractor client services payment invoice term termination notice breach remedy "
+    "liability indemnify confidential information warranty delivery schedule fee penalty governing law "
+    "dispute arbitration assignment subcontract insurance audit records intellectual property license"
+).split()
+
+def clause_text(rng: random.Random, words: int) -> str:
+    """Contract-like filler text of about `words` words"""
+    sentences, count = [], 0
+    while count < words:
+        length = rng.randint(8, 20)
+        sentence = " ".join(rng.choice(WORDS) for _ in range(length))
+        sentences.append(sentence.capitalize() + ".")
+        count += length
+    return " ".join(sentences)
+
+class FixedLatencyChatModel(FakeListChatModel):
+    """Fake chat model that takes `latency_ms` per call, like a warm local LLM with a short answer"""
+    
+    latency_ms: float = 0.0
+    
+    def _call(self, *args, **kwargs) -> str:
+        time.sleep(self.latency_ms / 1000)
+        return super()._call(*args, **kwargs)
+
+def make_pdf(path: Path, pages: int, rng: random.Random):
+    import fitz
+    doc = fitz.open()
+    for page_number in range(1, pages + 1):
+        page = doc.new_page()
+        text = f"ARTICLE {page_number}\n\n" + "\n\n".join(clause_text(rng, 90) for _ in range(4))
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=9)
+    doc.save(str(path))
+
+def make_docx(path: Path, pages: int, rng: random.Random):
+    from docx import Document as DocxDocument
+    doc = DocxDocument()
+    for page_number in range(1, pages + 1):
+        doc.add_heading(f"ARTICLE {page_number}", level=1)
+        for _ in range(4):
+            doc.add_paragraph(clause_text(rng, 90))
+        if page_number < pages:
+            doc.add_page_break()
+    doc.save(str(path))
+
+def bench_document_processor(args, workdir: Path) -> Dict[str, Dict]:
+    """Extraction and splitting throughput on generated PDF and DOCX files"""
+    from document_processor import DocumentProcessor
+    processor = DocumentProcessor()
+    results = {}
+    for kind, make in (("pdf", make_pdf), ("docx", make_docx)):
+        path = workdir / f"synthetic.{kind}"
+        make(path, args.pages, random.Random(0))
+        chunks = processor.process_file(path)  # Warm-up
+        stats = measure(lambda: processor.process_file(path), args.doc_iterations, 0)
+        results[f"document_processor.{kind}"] = {
+            "pages": args.pages,
+            "chunks": len(chunks),
+            "file_p50_ms": stats["p50_ms"],
+            "pages_per_s": round(args.pages / (stats["p50_ms"] / 1000), 1)
+        }
+    return results
+
+def bench_embeddings(args, workdir: Path) -> Dict[str, Dict]:
+    """Throughput of the real embedding model; skipped when it is not available offline"""
+    from model_registry import get_embeddings
+    embeddings = get_embeddings(EMBEDDING_MODEL)
+    rng = random.Random(1)
+    texts = [clause_text(rng, 150) for _ in range(args.embed_chunks)]
+    try:
+        embeddings.embed_documents(texts[:2])
+    except Exception as e:
+        return {"embeddings": {"skipped": f"{EMBEDDING_MODEL} not available: {e}"}}
+    
+    start = time.perf_counter()
+    embeddings.embed_documents(texts)
+    elapsed = time.perf_counter() - start
+    query = measure(lambda: embeddings.embed_query("What is the termination notice period?"), 50, 5)
+    return {
+        "embeddings": {
+            "model": EMBEDDING_MODEL,
+            "chunks_per_s": round(len(texts) / elapsed, 1),
+            "query_p50_ms": query["p50_ms"],
+            "query_p95_ms": query["p95_ms"]
+        }
+    }
+
+def _fake_or_real_embeddings(args):
+    if args.real_embeddings:
+        from model_registry import get_embeddings
+        return get_embeddings(EMBEDDING_MODEL)
+    return DeterministicFakeEmbedding(size=EMBEDDING_DIM)
+
+def bench_vector_store(args, workdir: Path) -> Dict[str, Dict]:
+    """Add throughput and dense/hybrid search latency at growing corpus sizes"""
+    from langchain_core.documents import Document
+    from bm25_index import BM25Index
+    from vector_store import VectorStoreManager
+    
+    manager = VectorStoreManager(args.backend)
+    manager.embeddings = _fake_or_real_embeddings(args)
+    manager.persist_directory = workdir / f"store_{args.backend}"
+    manager.bm25 = BM25Index(workdir / "bm25.sqlite3")
+    
+    rng = random.Random(2)
+    queries = [clause_text(rng, 8) for _ in range(args.queries)]
+    query_vectors = manager.embeddings.embed_documents(queries)
+    
+    results, size = {}, 0
+    for target in sorted(args.sizes):
+        added, add_seconds = 0, 0.0
+        while size < target:
+            batch = min(args.add_batch, target - size)
+            docs = [
+                Document(
+                    page_content=clause_text(rng, 120),
+                    metadata={"filename": f"doc{(size + i) // 50}.pdf", "chunk_index": (size + i) % 50, "chunk_id": f"bench-{size + i}"}
+                )
+                for i in range(batch)
+            ]
+            vectors = manager.embed_documents(docs)
+            start = time.perf_counter()
+            manager.index_documents(docs, vectors)
+            add_seconds += time.perf_counter() - start
+            size += batch
+            added += batch
+        
+        pairs = list(zip(queries, query_vectors))
+        dense = measure(lambda: [manager.dense_search(vector, 5) for _, vector in pairs], 1, 1)
+        hybrid = measure(lambda: [manager.hybrid_search(query, vector, 5) for query, vector in pairs], 1, 1)
+        results[f"vector_store.{args.backend}.{target}"] = {
+            "chunks": size,
+            "add_chunks_per_s": round(added / add_seconds, 1) if add_seconds else None,
+            "dense_search_mean_ms": round(dense["mean_ms"] / len(pairs), 3),
+            "hybrid_search_mean_ms": round(hybrid["mean_ms"] / len(pairs), 3)
+        }
+    return results
+
+def bench_rag_chain(args, workdir: Path) -> Dict[str, Dict]:
+    """RAGChain latency with a fixed-latency fake LLM, and the overhead on top of the LLM"""
+    from rag_chain import RAGChain
+    llm = FixedLatencyChatModel(responses=[ANSWER], latency_ms=args.llm_latency_ms)
+    chain = RAGChain(FixedRetriever(sample_docs()), llm=llm)
+    
+    results = {}
+    paths = {
+        "invoke": lambda: chain.invoke("What is the notice period?", use_cache=False),
+        "invoke_with_history": lambda: chain.invoke_with_history("What is the notice period?", HISTORY)
+    }
+    for name, fn in paths.items():
+        stats = measure(fn, args.chain_iterations, 5)
+        results[f"rag_chain.{name}"] = {
+            "p50_ms": stats["p50_ms"],
+            "p95_ms": stats["p95_ms"],
+            "overhead_p50_ms": round(stats["p50_ms"] - args.llm_latency_ms, 3)
+        }
+    return results
+
+def bench_guardrails(args, workdir: Path) -> Dict[str, Dict]:
+    """Guardrails.validate_response on a typical answer and five retrieved chunks"""
+    from guardrails import Guardrails
+    guardrails = Guardrails()
+    guardrails.embeddings = _fake_or_real_embeddings(args)
+    rng = random.Random(3)
+    contexts = [clause_text(rng, 150) for _ in range(5)]
+    answer = " ".join(clause_text(rng, 15) for _ in range(4))
+    stats = measure(lambda: guardrails.validate_response(answer, contexts), args.guardrail_iterations, 5)
+    return {"guardrails.validate_response": {"p50_ms": stats["p50_ms"], "p95_ms": stats["p95_ms"]}}
+
+BENCHMARKS: Dict[str, Callable] = {
+    "document_processor": bench_document_processor,
+    "embeddings": bench_embeddings,
+    "vector_store": bench_vector_store,
+    "rag_chain": bench_rag_chain,
+    "guardrails": bench_guardrails
+}
+
+def _worse_by(metric: str, baseline: float, current: float) -> Optional[float]:
+    """Relative slowdown of a metric (positive is worse), None if it has no direction"""
+    if metric.endswith("_per_s"):
+        return (baseline - current) / baseline if baseline else None
+    if metric.endswith("_ms"):
+        if current - baseline < MIN_REGRESSION_MS:
+            return min(0.0, (current - baseline) / baseline) if baseline else None
+        return (current - baseline) / baseline if baseline else None
+    return None
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Print a comparison table and return the regressed metrics"""
+    regressions = []
+    print(f"\n{'metric':<58}{'baseline':>12}{'current':>12}{'better by':>11}")
+    for name, metrics in results.items():
+        for metric, current in metrics.items():
+            previous = baseline.get(name, {}).get(metric)
+            if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)):
+                continue
+            worse = _worse_by(metric, previous, current)
+            if worse is None:
+                continue
+            flag = "  REGRESSION" if worse > tolerance else ""
+            print(f"{name + '.' + metric:<58}{previous:>12}{current:>12}{-worse:>+11.1%}{flag}")
+            if flag:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+def cpu_model() -> str:
+    """CPU model name, for telling apart runs on different machines"""
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+def main():
+    parser = argparse.ArgumentParser(description="Component benchmarks with baseline comparison")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Run only these benchmarks")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run's results as the baseline")
+    parser.add_argument("--output", type=Path, help="Results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown before a regression")
+    parser.add_argument("--backend", choices=["chroma", "faiss"], default=VECTOR_STORE_TYPE)
+    parser.add_argument("--real-embeddings", action="store_true", help="Use the real embedding model for store and guardrail benchmarks")
+    parser.add_argument("--pages", type=int, default=40, help="Pages per generated document")
+    parser.add_argument("--doc-iterations", type=int, default=5)
+    parser.add_argument("--embed-chunks", type=int, default=256)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000], help="Corpus sizes for the vector store benchmark")
+    parser.add_argument("--add-batch", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0)
+    parser.add_argument("--chain-iterations", type=int, default=100)
+    parser.add_argument("--guardrail-iterations", type=int, default=100)
+    args = parser.parse_args()
+    
+    workdir = Path(tempfile.mkdtemp(prefix="bench_"))
+    results: Dict[str, Dict] = {}
+    try:
+        for name in args.only or BENCHMARKS:
+            print(f"Running {name} ...", flush=True)
+            start = time.perf_counter()
+            results.update(BENCHMARKS[name](args, workdir))
+            print(f"  done in {time.perf_counter() - start:.1f}s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu": cpu_model(),
+            "cpu_count": os.cpu_count(),
+            "backend": args.backend,
+            "real_embeddings": args.real_embeddings,
+            "llm_latency_ms": args.llm_latency_ms
+        },
+        "results": results
+    }
+    print(json.dumps(results, indent=2))
+    
+    output = args.output or RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Results written to {output}")
+    
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Baseline saved to {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one", file=sys.stderr)
+        sys.exit(2)
+    
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    settings = ("backend", "real_embeddings", "llm_latency_ms")
+    if any(baseline["meta"].get(key) != report["meta"][key] for key in settings):
+        print(f"Warning: baseline was recorded with different settings ({', '.join(settings)})")
+    machine = ("cpu", "cpu_count")
+    if any(baseline["meta"].get(key) != report["meta"][key] for key in machine):
+        print(
+            f"Warning: baseline was measured on another machine "
+            f"({baseline['meta'].get('cpu')}, {baseline['meta'].get('cpu_count')} CPUs); "
+            "re-record it with --save-baseline for meaningful comparisons"
+        )
+    regressions = compare(results, baseline["results"], args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+if __name__ == "__main__":
+    main()
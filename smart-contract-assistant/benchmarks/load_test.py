@@ -0,0 +1,255 @@
+"""
+Concurrent load test of the API server with mixed user traffic
+
+Simulated users each loop over a weighted mix of operations, with a pause
+between requests: questions (streamed, so time to first token is
+measured), questions with conversation history, summaries and uploads of
+generated PDFs. Run the API against the Ollama stand-in for a
+reproducible setup:
+
+    python benchmarks/ollama_stub.py --port 11500 &
+    OLLAMA_BASE_URL=http://127.0.0.1:11500 python main.py --mode api &
+    python benchmarks/load_test.py --users 100 --duration 60
+
+The report gives throughput, error rate, latency p50/p95/p99 and time to
+first token per operation, and is written as JSON with --output.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+DEFAULT_MIX = "qa=0.6,qa_history=0.25,summarize=0.1,upload=0.05"
+
+TOPICS = [
+    "termination notice period", "payment terms", "liability cap", "confidentiality obligations",
+    "governing law", "dispute resolution", "assignment rights", "insurance requirements",
+    "intellectual property ownership", "delivery schedule", "late payment penalties", "audit rights"
+]
+TEMPLATES = [
+    "What does the contract say about {topic}?",
+    "Summarize the {topic} in clause {n}.",
+    "Are there any exceptions to the {topic}?",
+    "Who is responsible for the {topic} under section {n}?"
+]
+
+class Recorder:
+    """Outcomes of all requests, by operation"""
+    
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.ttfts: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Dict[str, int] = Counter()
+    
+    def record(self, op: str, status: str, latency_ms: float, ttft_ms: Optional[float] = None):
+        self.statuses[op][status] += 1
+        if status != "ok":
+            self.errors[op] += 1
+            return
+        self.latencies[op].append(latency_ms)
+        if ttft_ms is not None:
+            self.ttfts[op].append(ttft_ms)
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+def _summary(values: List[float]) -> Dict[str, Optional[float]]:
+    return {"p50": percentile(values, 0.5), "p95": percentile(values, 0.95), "p99": percentile(values, 0.99)}
+
+def question(rng: random.Random) -> str:
+    return rng.choice(TEMPLATES).format(topic=rng.choice(TOPICS), n=rng.randint(1, 40))
+
+def history(rng: random.Random) -> List[Dict]:
+    return [
+        {"human": question(rng), "assistant": "The contract addresses this in the relevant clause, subject to notice."}
+        for _ in range(rng.randint(1, 3))
+    ]
+
+def make_pdf(rng: random.Random) -> bytes:
+    """A small contract with unique text, so uploads are not skipped as duplicates"""
+    import fitz
+    doc = fitz.open()
+    for page_number in range(1, 4):
+        page = doc.new_page()
+        text = f"ARTICLE {page_number}\n\n" + " ".join(
+            f"The {rng.choice(TOPICS)} applies from day {rng.randint(1, 10000)}." for _ in range(30)
+        )
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=10)
+    return doc.tobytes()
+
+async def stream_events(client: httpx.AsyncClient, path: str, recorder: Recorder, op: str, **kwargs):
+    """Call an NDJSON endpoint, recording total latency and time to the first token event"""
+    start = time.perf_counter()
+    ttft = None
+    async with client.stream("POST", path, **kwargs) as response:
+        if response.status_code != 200:
+            await response.aread()
+            recorder.record(op, str(response.status_code), 0)
+            return
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["type"] == "token" and ttft is None:
+                ttft = (time.perf_counter() - start) * 1000
+            elif event["type"] == "error":
+                recorder.record(op, "stream_error", 0)
+                return
+    recorder.record(op, "ok", (time.perf_counter() - start) * 1000, ttft)
+
+async def run_op(op: str, client: httpx.AsyncClient, rng: random.Random, recorder: Recorder, args):
+    params = {"bypass_cache": args.bypass_cache}
+    if op == "qa":
+        if args.no_stream:
+            start = time.perf_counter()
+            response = await client.post("/qa", params={**params, "question": question(rng)})
+            status = "ok" if response.status_code == 200 else str(response.status_code)
+            recorder.record(op, status, (time.perf_counter() - start) * 1000)
+        else:
+            await stream_events(client, "/qa/stream", recorder, op, params={**params, "question": question(rng)})
+    elif op == "qa_history":
+        await stream_events(
+            client, "/qa/stream", recorder, op,
+            params={**params, "question": question(rng), "use_history": True},
+            json=history(rng)
+        )
+    elif op == "summarize":
+        await stream_events(client, "/summarize/stream", recorder, op)
+    elif op == "upload":
+        content = make_pdf(rng)
+        start = time.perf_counter()
+        response = await client.post("/upload", files={"file": (f"load_{rng.getrandbits(32):08x}.pdf", content)})
+        status = "ok" if response.status_code in (200, 202) else str(response.status_code)
+        recorder.record(op, status, (time.perf_counter() - start) * 1000)
+    else:
+        raise ValueError(f"Unknown operation: {op}")
+
+async def user(user_id: int, client: httpx.AsyncClient, mix: Dict[str, float], recorder: Recorder, deadline: float, args):
+    rng = random.Random(args.seed * 100003 + user_id)
+    await asyncio.sleep(rng.uniform(0, args.ramp_up))
+    ops, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        op = rng.choices(ops, weights)[0]
+        try:
+            await run_op(op, client, rng, recorder, args)
+        except httpx.TimeoutException:
+            recorder.record(op, "timeout", 0)
+        except httpx.HTTPError as e:
+            recorder.record(op, type(e).__name__, 0)
+        await asyncio.sleep(rng.expovariate(1000 / args.think_ms) if args.think_ms > 0 else 0)
+
+async def seed_document(client: httpx.AsyncClient, rng: random.Random):
+    """Upload one document and wait until it is indexed, so questions have something to search"""
+    response = await client.post("/upload", files={"file": ("load_seed.pdf", make_pdf(rng))})
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    async with client.stream("GET", f"/jobs/{job_id}/progress") as progress:
+        async for line in progress.aiter_lines():
+            job = json.loads(line) if line else {}
+            if job.get("status") == "failed":
+                raise RuntimeError(f"Seed document failed to index: {job['error']}")
+            if job.get("status") == "completed":
+                break
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 300):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if (await client.get("/health/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("API server did not become ready")
+
+def report(recorder: Recorder, elapsed: float) -> Dict:
+    ops = {}
+    for op in sorted(set(recorder.statuses)):
+        total = sum(recorder.statuses[op].values())
+        ops[op] = {
+            "requests": total,
+            "throughput_per_s": round(len(recorder.latencies[op]) / elapsed, 2),
+            "error_rate": round(recorder.errors[op] / total, 4) if total else 0.0,
+            "statuses": dict(recorder.statuses[op]),
+            "latency_ms": _summary(recorder.latencies[op]),
+            "ttft_ms": _summary(recorder.ttfts[op]) if recorder.ttfts[op] else None
+        }
+    total = sum(op["requests"] for op in ops.values())
+    errors = sum(recorder.errors.values())
+    return {
+        "duration_s": round(elapsed, 1),
+        "requests": total,
+        "throughput_per_s": round((total - errors) / elapsed, 2),
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "latency_ms": _summary([v for values in recorder.latencies.values() for v in values]),
+        "ttft_ms": _summary([v for values in recorder.ttfts.values() for v in values]),
+        "operations": ops
+    }
+
+def print_report(result: Dict):
+    print(f"\n{result['requests']} requests in {result['duration_s']}s: "
+          f"{result['throughput_per_s']} ok/s, error rate {result['error_rate']:.2%}")
+    print(f"{'operation':<12}{'reqs':>7}{'ok/s':>8}{'err':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'ttft p50':>10}{'ttft p95':>10}")
+    for name, op in result["operations"].items():
+        ttft = op["ttft_ms"] or {}
+        print(
+            f"{name:<12}{op['requests']:>7}{op['throughput_per_s']:>8}{op['error_rate']:>8.1%}"
+            f"{str(op['latency_ms']['p50']):>9}{str(op['latency_ms']['p95']):>9}{str(op['latency_ms']['p99']):>9}"
+            f"{str(ttft.get('p50')):>10}{str(ttft.get('p95')):>10}"
+        )
+        failures = {status: count for status, count in op["statuses"].items() if status != "ok"}
+        if failures:
+            print(f"{'':<12}failures: {failures}")
+
+async def run(args) -> Dict:
+    mix = {op: float(weight) for op, weight in (part.split("=") for part in args.mix.split(","))}
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    timeout = httpx.Timeout(args.timeout, connect=10)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout) as client:
+        await wait_ready(client)
+        if not args.no_seed:
+            await seed_document(client, random.Random(args.seed))
+        recorder = Recorder()
+        start = time.perf_counter()
+        deadline = start + args.ramp_up + args.duration
+        await asyncio.gather(*(user(i, client, mix, recorder, deadline, args) for i in range(args.users)))
+        return report(recorder, time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent mixed-traffic load test of the API server")
+    parser.add_argument("--url", default="http://127.0.0.1:8001")
+    parser.add_argument("--users", type=int, default=50, help="Concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of full load after ramp-up")
+    parser.add_argument("--ramp-up", type=float, default=10, help="Users start spread over this many seconds")
+    parser.add_argument("--think-ms", type=float, default=1000, help="Mean pause between a user's requests")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Operation weights, e.g. qa=0.7,qa_history=0.3")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--bypass-cache", action="store_true", help="Skip the response cache for every question")
+    parser.add_argument("--no-stream", action="store_true", help="Send plain questions to /qa instead of /qa/stream")
+    parser.add_argument("--no-seed", action="store_true", help="Do not upload a document before the test")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write the report as JSON")
+    parser.add_argument("--max-error-rate", type=float, help="Exit non-zero above this error rate")
+    args = parser.parse_args()
+    
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.output:
+        args.output.write_text(json.dumps(result, indent=2), encoding="utf-8")
+        print(f"Report written to {args.output}")
+    if args.max_error_rate is not None and result["error_rate"] > args.max_error_rate:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Stand-in for the Ollama chat API, for load tests without a real LLM
+
+Answers /api/chat and /api/generate with canned text after a configurable
+prompt-processing delay, then emits tokens at a fixed rate, streamed as
+NDJSON when the client asks for streaming (the Ollama default). Like
+Ollama, it runs at most --parallel requests at once and queues the rest.
+Point the API server at it with OLLAMA_BASE_URL:
+
+    python benchmarks/ollama_stub.py --port 11500 --ttft-ms 300 --tokens-per-s 30
+    OLLAMA_BASE_URL=http://127.0.0.1:11500 python main.py --mode api
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER = (
+    "According to the contract, either party may terminate the agreement by giving thirty days "
+    "written notice. The Contractor is paid monthly against approved invoices, and liability is "
+    "capped at the fees paid in the preceding twelve months. Confidential information must be "
+    "returned or destroyed when the agreement ends."
+)
+
+class OllamaStub:
+    """Timing model of an Ollama server: queueing, prompt processing, then token generation"""
+    
+    def __init__(
+        self,
+        ttft_ms: float,
+        prompt_ms_per_1k_tokens: float,
+        tokens_per_s: float,
+        answer_tokens: int,
+        parallel: int,
+        allow_streaming: bool = True
+    ):
+        self.ttft_ms = ttft_ms
+        self.prompt_ms_per_1k_tokens = prompt_ms_per_1k_tokens
+        self.tokens_per_s = tokens_per_s
+        self.answer_tokens = answer_tokens
+        self.allow_streaming = allow_streaming
+        self.parallel = parallel
+        self.active = 0
+        self.queued = 0
+        self.served = 0
+        self._slots = None  # Created inside the server's event loop
+        words = ANSWER.split()
+        self.tokens = [(" " if i else "") + words[i % len(words)] for i in range(answer_tokens)]
+    
+    @staticmethod
+    def prompt_tokens(messages: List[Dict]) -> int:
+        return sum(len(str(m.get("content", ""))) for m in messages) // 4
+    
+    def _chunk(self, model: str, content: str, chat: bool, done: bool, **extra) -> Dict:
+        chunk = {"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "done": done}
+        if chat:
+            chunk["message"] = {"role": "assistant", "content": content}
+        else:
+            chunk["response"] = content
+        chunk.update(extra)
+        return chunk
+    
+    async def generate(self, body: Dict, chat: bool) -> AsyncIterator[Dict]:
+        """Yield response chunks with Ollama's timing and final statistics"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.parallel)
+        model = body.get("model", "stub")
+        messages = body.get("messages") or [{"content": body.get("prompt", "")}]
+        prompt_tokens = self.prompt_tokens(messages)
+        
+        start = time.perf_counter()
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.active += 1
+        try:
+            load = time.perf_counter() - start
+            prompt_s = (self.ttft_ms + self.prompt_ms_per_1k_tokens * prompt_tokens / 1000) / 1000
+            await asyncio.sleep(prompt_s)
+            interval = 1 / self.tokens_per_s if self.tokens_per_s > 0 else 0
+            eval_start = time.perf_counter()
+            for token in self.tokens:
+                yield self._chunk(model, token, chat, False)
+                await asyncio.sleep(interval)
+            eval_s = time.perf_counter() - eval_start
+        finally:
+            self.active -= 1
+            self.served += 1
+            self._slots.release()
+        
+        yield self._chunk(
+            model, "", chat, True,
+            done_reason="stop",
+            total_duration=int((time.perf_counter() - start) * 1e9),
+            load_duration=int(load * 1e9),
+            prompt_eval_count=prompt_tokens,
+            prompt_eval_duration=int(prompt_s * 1e9),
+            eval_count=len(self.tokens),
+            eval_duration=int(eval_s * 1e9)
+        )
+    
+    async def respond(self, request: Request, chat: bool):
+        body = await request.json()
+        chunks = self.generate(body, chat)
+        if body.get("stream", True) and self.allow_streaming:
+            async def lines():
+                async for chunk in chunks:
+                    yield json.dumps(chunk) + "\n"
+            return StreamingResponse(lines(), media_type="application/x-ndjson")
+        
+        # Non-streaming: one response with the whole answer and the final statistics
+        content, final = "", None
+        async for chunk in chunks:
+            if chunk["done"]:
+                final = chunk
+            else:
+                content += chunk["message"]["content"] if chat else chunk["response"]
+        if chat:
+            final["message"]["content"] = content
+        else:
+            final["response"] = content
+        return JSONResponse(final)
+
+def create_app(stub: OllamaStub) -> FastAPI:
+    app = FastAPI(title="Ollama stub")
+    
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        return await stub.respond(request, chat=True)
+    
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        return await stub.respond(request, chat=False)
+    
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": "llama3.2:latest", "model": "llama3.2:latest"}]}
+    
+    @app.post("/api/show")
+    async def show():
+        return {"details": {"family": "llama"}, "capabilities": ["completion"]}
+    
+    @app.get("/api/version")
+    async def version():
+        return {"version": "0.0.0-stub"}
+    
+    @app.get("/stats")
+    async def stats():
+        return {"active": stub.active, "queued": stub.queued, "served": stub.served, "parallel": stub.parallel}
+    
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama chat API stand-in with configurable latency")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--ttft-ms", type=float, default=300, help="Fixed delay before the first token")
+    parser.add_argument("--prompt-ms-per-1k-tokens", type=float, default=200, help="Extra delay per 1000 prompt tokens")
+    parser.add_argument("--tokens-per-s", type=float, default=30, help="Generation rate; 0 emits all tokens at once")
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--parallel", type=int, default=4, help="Requests processed at once, like OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--no-streaming", action="store_true", help="Always answer with a single JSON response")
+    args = parser.parse_args()
+    
+    stub = OllamaStub(
+        args.ttft_ms, args.prompt_ms_per_1k_tokens, args.tokens_per_s, args.answer_tokens, args.parallel,
+        allow_streaming=not args.no_streaming
+    )
+    uvicorn.run(create_app(stub), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Incremental BM25 index for lexical retrieval alongside the vector store
+"""
+import json
+import logging
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Keeps clause numbers (4.2), amounts ($1,000.00), percentages and dates (2014-01-31) as single tokens
+TOKEN_PATTERN = re.compile(r"\$?\d+(?:[.,/-]\d+)*%?|\w+(?:['-]\w+)*")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word, number and amount tokens"""
+    return [token.rstrip(".,") for token in TOKEN_PATTERN.findall(text.lower())]
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[str]:
+    """Fuse several ranked id lists; each id scores the sum of 1 / (k + rank)"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] += 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+class BM25Index:
+    """
+    BM25 inverted index keyed by chunk id
+
+    Chunks are added and removed one at a time, so the index can follow the
+    vector store without rebuilding. Searches run on the in-memory postings;
+    each chunk's term frequencies are also kept in a SQLite table, written
+    as chunks change, so persisting a write costs the chunks it touched.
+    """
+    
+    def __init__(self, path: Path, k1: float = 1.5, b: float = 0.75):
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)  # term -> chunk id -> term frequency
+        self.doc_terms: Dict[str, Dict[str, int]] = {}  # chunk id -> term frequencies, for removal
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self._lock = threading.Lock()
+        self._conn = None  # Opened on first write or load
+    
+    def _db(self) -> sqlite3.Connection:
+        """Connection to the on-disk table, created on first use; the caller holds the lock"""
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, terms TEXT NOT NULL)")
+            self._conn.commit()
+        return self._conn
+    
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+    
+    def add(self, items: Iterable[Tuple[str, str]]):
+        """Add or replace (chunk id, text) pairs"""
+        rows = []
+        with self._lock:
+            for chunk_id, text in items:
+                self._remove(chunk_id)
+                terms = Counter(tokenize(text))
+                for term, count in terms.items():
+                    self.postings[term][chunk_id] = count
+                self.doc_terms[chunk_id] = dict(terms)
+                self.doc_lengths[chunk_id] = sum(terms.values())
+                self.total_length += self.doc_lengths[chunk_id]
+                rows.append((chunk_id, json.dumps(self.doc_terms[chunk_id])))
+            if rows:
+                self._db().executemany("INSERT OR REPLACE INTO chunks (id, terms) VALUES (?, ?)", rows)
+                self._conn.commit()
+    
+    def remove(self, chunk_ids: Iterable[str]):
+        """Remove chunks by id"""
+        chunk_ids = list(chunk_ids)
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._remove(chunk_id)
+            if chunk_ids:
+                self._db().executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+                self._conn.commit()
+    
+    def clear(self):
+        """Remove every chunk, also from disk"""
+        with self._lock:
+            self.postings = defaultdict(dict)
+            self.doc_terms, self.doc_lengths, self.total_length = {}, {}, 0
+            self._db().execute("DELETE FROM chunks")
+            self._conn.commit()
+    
+    def close(self):
+        """Close the on-disk table; the in-memory postings stay searchable"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+    
+    def _remove(self, chunk_id: str):
+        terms = self.doc_terms.pop(chunk_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings[term]
+            postings.pop(chunk_id, None)
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(chunk_id)
+    
+    def search(self, query: str, k: int, allowed: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """Top-k (chunk id, score) pairs for a query, optionally only among `allowed` chunk ids"""
+        with self._lock:
+            n = len(self.doc_lengths)
+            if n == 0:
+                return []
+            avg_length = self.total_length / n
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                if allowed is None:
+                    matches = postings.items()
+                elif len(allowed) < len(postings):
+                    # Scoped to fewer chunks than contain the term: look each of them up
+                    matches = ((chunk_id, postings[chunk_id]) for chunk_id in allowed if chunk_id in postings)
+                else:
+                    matches = ((chunk_id, tf) for chunk_id, tf in postings.items() if chunk_id in allowed)
+                for chunk_id, tf in matches:
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[chunk_id] / avg_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+    
+    def load(self) -> bool:
+        """Load the index from disk; returns False if there is none"""
+        if not self.path.exists():
+            return False
+        try:
+            with self._lock:
+                rows = self._db().execute("SELECT id, terms FROM chunks").fetchall()
+        except Exception as e:
+            logger.error(f"Error loading BM25 index: {e}")
+            return False
+        if not rows:
+            return False
+        
+        with self._lock:
+            self.doc_terms = {chunk_id: json.loads(terms) for chunk_id, terms in rows}
+            self.postings = defaultdict(dict)
+            self.doc_lengths = {}
+            for chunk_id, terms in self.doc_terms.items():
+                for term, count in terms.items():
+                    self.postings[term][chunk_id] = count
+                self.doc_lengths[chunk_id] = sum(terms.values())
+            self.total_length = sum(self.doc_lengths.values())
+        logger.info(f"Loaded BM25 index with {len(self)} chunks")
+        return True
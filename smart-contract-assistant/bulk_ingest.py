@@ -0,0 +1,308 @@
+"""
+Bulk ingestion of directories and zip archives
+"""
+import logging
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import (
+    UPLOAD_DIR, BULK_EXTRACTION_WORKERS, BULK_PAGES_PER_TASK, BULK_EMBED_BATCH_SIZE, JOB_HISTORY_SIZE
+)
+from document_processor import file_hash, page_ranges, read_blocks
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_SUFFIXES = (".pdf", ".docx")
+
+# Errors kept per job; the rest are only logged
+MAX_ERRORS = 50
+
+def collect_files(path: Path, extract_dir: Path = UPLOAD_DIR / "bulk") -> List[Tuple[Path, str]]:
+    """
+    Supported files in a directory (recursively), a zip archive, or a single file
+    
+    Returns (path, document name) pairs. Files in a directory are named by
+    their path from the directory's own folder, e.g. "contracts/clientA/lease.pdf",
+    and archive members by "<archive>/<member path>", so same-named files
+    in different folders are different documents while a revised file
+    keeps its name.
+    """
+    path = Path(path)
+    if path.is_dir():
+        files = sorted(p for p in path.rglob("*") if p.is_file() and p.suffix.lower() in SUPPORTED_SUFFIXES)
+        return [(p, p.relative_to(path.parent).as_posix()) for p in files]
+    if zipfile.is_zipfile(path):
+        target = Path(extract_dir) / path.stem
+        with zipfile.ZipFile(path) as archive:
+            members = [
+                member for member in archive.infolist()
+                if not member.is_dir() and Path(member.filename).suffix.lower() in SUPPORTED_SUFFIXES
+            ]
+            # ZipFile.extract strips absolute paths and ".." components
+            files = [Path(archive.extract(member, target)) for member in members]
+        logger.info(f"Extracted {len(files)} documents from {path.name}")
+        return [(p, p.relative_to(extract_dir).as_posix()) for p in sorted(files)]
+    if path.is_file() and path.suffix.lower() in SUPPORTED_SUFFIXES:
+        return [(path, path.name)]
+    raise ValueError(f"Not a directory, zip archive or supported file: {path}")
+
+def _extract_task(task: Tuple[Path, int, int]) -> Tuple[List, Optional[str]]:
+    """Extract the blocks of one page range in a worker process; errors are returned, not raised"""
+    file_path, start, end = task
+    try:
+        return read_blocks(file_path, start, end), None
+    except Exception as e:
+        return [], str(e)
+
+class BulkJob:
+    """Status and throughput of one bulk ingestion run"""
+    
+    def __init__(self, path: Path):
+        self.id = uuid.uuid4().hex
+        self.path = Path(path)
+        self.status = "queued"  # queued, running, completed, failed
+        self.files_total = 0
+        self.files_done = 0
+        self.files_skipped = 0
+        self.files_failed = 0
+        self.pages = 0
+        self.chunks = 0
+        self.chunks_embedded = 0
+        self.errors: List[str] = []
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+    
+    def update(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+    
+    def add_error(self, message: str):
+        logger.error(f"Bulk job {self.id}: {message}")
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(message)
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+    
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+    
+    def to_dict(self) -> Dict:
+        elapsed = self.elapsed
+        return {
+            "job_id": self.id,
+            "path": str(self.path),
+            "status": self.status,
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "files_skipped": self.files_skipped,
+            "files_failed": self.files_failed,
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "chunks_embedded": self.chunks_embedded,
+            "elapsed_seconds": round(elapsed, 1),
+            "pages_per_second": round(self.pages / elapsed, 1) if elapsed else 0.0,
+            "chunks_per_second": round(self.chunks / elapsed, 1) if elapsed else 0.0,
+            "errors": self.errors,
+            "error": self.error,
+            "created_at": self.created_at
+        }
+
+class BulkIngestor:
+    """
+    Ingest many documents at once
+
+    Page ranges are extracted in a process pool, a bounded number of tasks
+    ahead of the consumer. Each file's blocks are streamed into the splitter
+    in page order, and new chunks from many files are embedded and indexed
+    together in large batches. Files whose content is already indexed are
+    skipped. Store writes run in `ingest_pool` when given, the pool uploads
+    write through, so its worker count bounds all concurrent writers.
+    """
+    
+    def __init__(
+        self,
+        doc_processor,
+        vector_store_manager,
+        workers: int = BULK_EXTRACTION_WORKERS,
+        pages_per_task: int = BULK_PAGES_PER_TASK,
+        embed_batch_size: int = BULK_EMBED_BATCH_SIZE,
+        on_indexed: Optional[Callable[[], None]] = None,
+        ingest_pool=None
+    ):
+        self.doc_processor = doc_processor
+        self.vector_store_manager = vector_store_manager
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self.embed_batch_size = embed_batch_size
+        self.on_indexed = on_indexed
+        self.ingest_pool = ingest_pool
+        self.jobs: "OrderedDict[str, BulkJob]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+    
+    def reserve(self) -> bool:
+        """Claim the single run slot without waiting; pass `reserved=True` to run() or call release()"""
+        return self._lock.acquire(blocking=False)
+    
+    def release(self):
+        self._lock.release()
+    
+    def job_dir(self, job: BulkJob) -> Path:
+        """Directory for a job's uploaded and extracted files"""
+        return UPLOAD_DIR / "bulk" / job.id
+    
+    def create_job(self, path: Path) -> BulkJob:
+        """Register a job so its status can be queried before it starts"""
+        job = BulkJob(path)
+        self.jobs[job.id] = job
+        finished = [job_id for job_id, other in self.jobs.items() if other.finished]
+        for job_id in finished[:max(0, len(finished) - JOB_HISTORY_SIZE)]:
+            del self.jobs[job_id]
+        return job
+    
+    def get(self, job_id: str) -> Optional[BulkJob]:
+        return self.jobs.get(job_id)
+    
+    def run(self, path: Path, job: Optional[BulkJob] = None, reserved: bool = False) -> BulkJob:
+        """Ingest every supported file under a path; one run at a time"""
+        job = job or self.create_job(path)
+        if not reserved:
+            self._lock.acquire()
+        try:
+            job.update(status="running", started_at=time.time())
+            files = collect_files(path, self.job_dir(job))
+            job.update(files_total=len(files))
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                self._ingest(executor, files, job)
+            job.update(status="completed", finished_at=time.time())
+        except Exception as e:
+            logger.error(f"Bulk job {job.id} failed: {e}", exc_info=True)
+            job.update(status="failed", error=str(e), finished_at=time.time())
+        finally:
+            self._lock.release()
+        logger.info(f"Bulk job {job.id} finished: {job.to_dict()}")
+        return job
+    
+    def _new_files(
+        self, executor: ProcessPoolExecutor, files: List[Tuple[Path, str]], job: BulkJob
+    ) -> List[Tuple[Path, str, str]]:
+        """(path, document name, content hash) of files whose content is not indexed yet"""
+        todo, seen = [], set()
+        paths = [file_path for file_path, _ in files]
+        for (file_path, name), content_hash in zip(files, executor.map(file_hash, paths, chunksize=16)):
+            duplicate_of = self.vector_store_manager.find_by_content_hash(content_hash)
+            if duplicate_of is not None or content_hash in seen:
+                job.update(files_skipped=job.files_skipped + 1)
+                continue
+            seen.add(content_hash)
+            todo.append((file_path, name, content_hash))
+        return todo
+    
+    def _extracted(self, executor: ProcessPoolExecutor, tasks: List[Tuple[Path, int, int]]) -> Iterator:
+        """Results of extraction tasks in order, keeping a bounded number in flight"""
+        window = deque()
+        pending = iter(tasks)
+        for task in pending:
+            window.append(executor.submit(_extract_task, task))
+            if len(window) >= self.workers * 4:
+                break
+        while window:
+            result = window.popleft().result()
+            task = next(pending, None)
+            if task is not None:
+                window.append(executor.submit(_extract_task, task))
+            yield result
+    
+    def _ingest(self, executor: ProcessPoolExecutor, files: List[Tuple[Path, str]], job: BulkJob):
+        todo = self._new_files(executor, files, job)
+        
+        ranges = {}
+        for file_path, _, _ in todo:
+            try:
+                ranges[file_path] = page_ranges(file_path, self.pages_per_task)
+            except Exception as e:
+                ranges[file_path] = []
+                job.add_error(f"{file_path.name}: {e}")
+        tasks = [(file_path, start, end) for file_path, _, _ in todo for start, end in ranges[file_path]]
+        results = self._extracted(executor, tasks)
+        
+        batch = {"new": [], "unchanged": [], "stale": []}
+        indexed = set()  # Chunk ids of this run, never stale for a later file
+        for file_path, name, content_hash in todo:
+            errors = []
+            
+            def blocks():
+                for start, end in ranges[file_path]:
+                    page_blocks, error = next(results)
+                    if error:
+                        errors.append(error)
+                    job.update(pages=job.pages + end - start)
+                    yield from page_blocks
+            
+            block_stream = blocks()
+            chunks = []
+            try:
+                chunks = self.doc_processor.split_blocks(block_stream, file_path, content_hash, document_name=name)
+            except Exception as e:
+                errors.append(str(e))
+            for _ in block_stream:  # Drain results the splitter did not read
+                pass
+            if errors or not chunks:
+                job.update(files_failed=job.files_failed + 1)
+                if ranges[file_path]:  # Files without ranges were reported above
+                    job.add_error(f"{file_path.name}: {errors[0] if errors else 'no text extracted'}")
+                continue
+            
+            new_chunks, unchanged_chunks, stale_ids = self.vector_store_manager.diff_document(chunks)
+            indexed.update(chunk.metadata["chunk_id"] for chunk in chunks)
+            batch["new"].extend(new_chunks)
+            batch["unchanged"].extend(unchanged_chunks)
+            batch["stale"].extend(chunk_id for chunk_id in stale_ids if chunk_id not in indexed)
+            job.update(files_done=job.files_done + 1, chunks=job.chunks + len(chunks))
+            if len(batch["new"]) >= self.embed_batch_size:
+                self._flush(batch, job)
+        self._flush(batch, job)
+    
+    def _write(self, func: Callable, *args):
+        """Run a store write, in the shared ingest pool when there is one"""
+        if self.ingest_pool is None:
+            return func(*args)
+        return self.ingest_pool.call(func, *args)
+    
+    def _flush(self, batch: Dict[str, List], job: BulkJob):
+        """Embed and index the collected chunks of several files"""
+        if not any(batch.values()):
+            return
+        embedded_before = job.chunks_embedded
+        embeddings = self.vector_store_manager.embed_documents(
+            batch["new"],
+            batch_size=self.embed_batch_size,
+            progress_callback=lambda done: job.update(chunks_embedded=embedded_before + done)
+        )
+        self._write(self.vector_store_manager.apply_document_update, batch["new"], embeddings, batch["unchanged"], batch["stale"])
+        for chunks in batch.values():
+            chunks.clear()
+        if self.on_indexed:
+            self.on_indexed()
+        
+        stats = job.to_dict()
+        logger.info(
+            f"Bulk job {job.id}: {job.files_done}/{job.files_total} files, "
+            f"{job.pages} pages ({stats['pages_per_second']}/s), {job.chunks} chunks ({stats['chunks_per_second']}/s)"
+        )
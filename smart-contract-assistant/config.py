@@ -19,19 +19,104 @@ VECTOR_STORE_DIR.mkdir(exist_ok=True)
 # LLM Settings
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "ollama")  # ollama, huggingface, nvidia
 LLM_MODEL = os.getenv("LLM_MODEL", "llama3.2")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "16"))  # Idle keep-alive connections to the LLM server
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL")  # Defaults to the Ollama client's own (OLLAMA_HOST or localhost:11434)
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
 # Vector Store
 VECTOR_STORE_NAME = "contract_store"
-VECTOR_STORE_TYPE = "chroma"  # chroma or faiss
+VECTOR_STORE_TYPE = os.getenv("VECTOR_STORE_TYPE", "chroma")  # chroma or faiss
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")  # flat, ivf, pq (product-quantized) or sq8 (int8)
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "1024"))  # IVF clusters
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))  # IVF clusters searched per query
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "48"))  # PQ sub-vectors; must divide the embedding dimension
+FAISS_MMAP = os.getenv("FAISS_MMAP", "true").lower() == "true"  # Memory-map the index on load
+FAISS_EXACT_SCOPE_MAX = int(os.getenv("FAISS_EXACT_SCOPE_MAX", "20000"))  # Filtered searches over fewer chunks skip the index
+TENANT_STORE_DIR = VECTOR_STORE_DIR / "tenants"  # One store per tenant, in its own subdirectory
+TENANT_MAX_OPEN = int(os.getenv("TENANT_MAX_OPEN", "16"))  # Tenant stores kept open; least recently used are closed
 
 # Chunking
 CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
+CHUNK_OVERLAP = 200  # Only used when a single paragraph is longer than a chunk
+PDF_EXTRACT_TABLES = os.getenv("PDF_EXTRACT_TABLES", "false").lower() == "true"  # Table detection costs time per page
+
+# Embedding
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = VECTOR_STORE_DIR / "embedding_cache.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+QUERY_BATCHING_ENABLED = os.getenv("QUERY_BATCHING_ENABLED", "true").lower() == "true"  # Embed concurrent questions together
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))  # How long the first question waits for others
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
 
 # Retrieval
 TOP_K = 5
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")  # dense or hybrid (dense + BM25)
+HYBRID_CANDIDATES = 20  # Candidates taken from each ranking before fusion
+RRF_K = 60  # Reciprocal rank fusion constant
+
+# Prompt context (token budgets keep prompt size and LLM prefill time predictable)
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "2048"))  # Context, history and question together
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "512"))  # Most recent exchanges that fit are kept
+CHARS_PER_TOKEN = 4  # Token estimate used for budgeting
+
+# Reranking (cross-encoder rescoring of over-fetched candidates)
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))  # Candidates retrieved and rescored
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "3"))  # Chunks kept for the prompt
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "250"))  # Skip or truncate reranking beyond this; 0 disables
+
+# Guardrails (sentence-level grounding against the retrieved chunks)
+GUARDRAIL_SIMILARITY = float(os.getenv("GUARDRAIL_SIMILARITY", "0.4"))  # Cosine below which a sentence is unsupported
+GUARDRAIL_MIN_SUPPORTED = float(os.getenv("GUARDRAIL_MIN_SUPPORTED", "0.7"))  # Share of sentences that must be supported
+
+# Worker pools (blocking work runs off the event loop)
+EXTRACTION_POOL_KIND = os.getenv("EXTRACTION_POOL_KIND", "thread")  # thread or process
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "2"))
+EXTRACTION_MAX_PENDING = int(os.getenv("EXTRACTION_MAX_PENDING", "8"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))  # Serializes vector store writes
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "8"))
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "16"))
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", "64"))
+
+# Background ingestion jobs
+INGESTION_CONCURRENCY = int(os.getenv("INGESTION_CONCURRENCY", "2"))  # Files processed at once
+INGESTION_MAX_QUEUED = int(os.getenv("INGESTION_MAX_QUEUED", "32"))
+JOB_HISTORY_SIZE = 100  # Finished jobs kept for status queries
+
+# Bulk ingestion (directories and zip archives)
+BULK_INGEST_ROOT = Path(os.getenv("BULK_INGEST_ROOT", str(UPLOAD_DIR)))  # API may only ingest paths under here
+BULK_EXTRACTION_WORKERS = int(os.getenv("BULK_EXTRACTION_WORKERS", str(os.cpu_count() or 2)))
+BULK_PAGES_PER_TASK = int(os.getenv("BULK_PAGES_PER_TASK", "16"))  # PDF pages extracted per worker task
+BULK_EMBED_BATCH_SIZE = int(os.getenv("BULK_EMBED_BATCH_SIZE", "512"))  # New chunks embedded and indexed together
+
+# Response cache
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "false").lower() == "true"
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))  # Cosine threshold for semantic hits
+
+# Summarization (map-reduce over all chunks of a document)
+SUMMARY_GROUP_CHARS = int(os.getenv("SUMMARY_GROUP_CHARS", "6000"))  # Text per map call
+SUMMARY_REDUCE_FAN_IN = int(os.getenv("SUMMARY_REDUCE_FAN_IN", "8"))  # Partial summaries per reduce call
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))  # Parallel LLM calls
+SUMMARY_CACHE_PATH = VECTOR_STORE_DIR / "summaries.json"
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "1000"))  # Least recently used beyond this are dropped
 
 # API
 API_PORT = 8001
+WARM_UP_MODELS = os.getenv("WARM_UP_MODELS", "true").lower() == "true"  # Load models in the background at startup rather than on first request
 UI_PORT = 7864  # Changed to avoid port conflicts
+
+# Observability (per-stage metrics are always recorded and served on /metrics)
+TRACE_REQUESTS = os.getenv("TRACE_REQUESTS", "true").lower() == "true"  # Trace ID per request, in the X-Trace-Id header
+TRACE_HISTORY_SIZE = int(os.getenv("TRACE_HISTORY_SIZE", "1000"))  # Recent traces kept for /traces/{trace_id}
+
+# UI client (how the Gradio UI reaches the API when it runs separately)
+API_URL = os.getenv("API_URL", f"http://localhost:{API_PORT}")
+UI_API_TIMEOUT = float(os.getenv("UI_API_TIMEOUT", "120"))  # Seconds to wait for each read, write or pooled connection
+UI_API_CONNECT_TIMEOUT = float(os.getenv("UI_API_CONNECT_TIMEOUT", "5"))
+UI_API_MAX_CONNECTIONS = int(os.getenv("UI_API_MAX_CONNECTIONS", "20"))  # Keep-alive connections shared by all UI sessions
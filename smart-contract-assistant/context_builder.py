@@ -0,0 +1,178 @@
+"""
+Token-budgeted prompt context from retrieved chunks and conversation history
+"""
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from config import CONTEXT_MAX_TOKENS, HISTORY_MAX_TOKENS, CHARS_PER_TOKEN
+
+# Shortest suffix/prefix match treated as overlap between neighbouring chunks
+MIN_OVERLAP_CHARS = 20
+
+# A passage is cut to fit the remaining budget only if at least this much is left
+MIN_PASSAGE_TOKENS = 64
+
+NO_HISTORY = "No previous conversation."
+
+def count_tokens(text: str) -> int:
+    """Approximate token count; the local models' tokenizers are not available in-process"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def format_location(metadata: Dict) -> str:
+    """Where a chunk sits in its document: pages when known, else the chunk index"""
+    page, page_end = metadata.get("page"), metadata.get("page_end")
+    if page is None:
+        return f"Chunk {metadata.get('chunk_index', 'N/A')}"
+    if page_end is not None and page_end != page:
+        return f"Pages {page}-{page_end}"
+    return f"Page {page}"
+
+def _header(i: int, metadata: Dict) -> str:
+    return f"[Document {i} - {metadata.get('filename', 'Unknown')}, {format_location(metadata)}]"
+
+def format_docs(docs: List[Document]) -> str:
+    """Format retrieved documents as prompt context"""
+    return "\n\n".join([f"{_header(i + 1, doc.metadata)}\n{doc.page_content}" for i, doc in enumerate(docs)])
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of a that is a prefix of b"""
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    pos = a.find(probe, max(0, len(a) - len(b)))
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    return 0
+
+def _join(text: str, doc: Document, section: Optional[str]) -> str:
+    """Append a neighbouring chunk, dropping its repeated heading and overlapping text"""
+    body = doc.page_content
+    if section and doc.metadata.get("section") == section and body.startswith(section + "\n"):
+        body = body[len(section) + 1:]
+    overlap = _overlap(text, body)
+    return text + body[overlap:] if overlap else f"{text}\n{body}"
+
+def _truncate(text: str, tokens: int) -> str:
+    """Cut text to about `tokens` tokens at a word boundary"""
+    cut = text[:(tokens - 1) * CHARS_PER_TOKEN]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > len(cut) // 2 else cut) + " ..."
+
+class ContextBuilder:
+    """
+    Assemble the prompt context within a token budget
+
+    Retrieved chunks that are neighbours in the same document are merged in
+    document order, with overlapping text and repeated headings removed,
+    and exact duplicates are dropped. History is trimmed to its own budget,
+    newest exchanges first, and passages then fill what is left of
+    `max_tokens` in retrieval order.
+    """
+    
+    def __init__(self, max_tokens: int = CONTEXT_MAX_TOKENS, history_max_tokens: int = HISTORY_MAX_TOKENS):
+        self.max_tokens = max_tokens
+        self.history_max_tokens = history_max_tokens
+    
+    @staticmethod
+    def merge(docs: List[Document]) -> List[Tuple[Document, List[Document]]]:
+        """(passage, chunks it was built from) in order of each passage's best-ranked chunk"""
+        seen, runs = set(), {}
+        for rank, doc in enumerate(docs):
+            if doc.page_content in seen:
+                continue
+            seen.add(doc.page_content)
+            # Legacy chunks without a document id fall back to their filename
+            document = doc.metadata.get("document_id") or doc.metadata.get("filename")
+            runs.setdefault(document, []).append((rank, doc))
+        
+        merged = []
+        for ranked in runs.values():
+            ranked.sort(key=lambda item: (item[1].metadata.get("chunk_index") is None, item[1].metadata.get("chunk_index") or 0))
+            run = []
+            for rank, doc in ranked:
+                index = doc.metadata.get("chunk_index")
+                previous = run[-1][1].metadata.get("chunk_index") if run else None
+                if run and (index is None or previous is None or index != previous + 1):
+                    merged.append(run)
+                    run = []
+                run.append((rank, doc))
+            merged.append(run)
+        merged.sort(key=lambda run: min(rank for rank, _ in run))
+        
+        passages = []
+        for run in merged:
+            members = [doc for _, doc in run]
+            first, last = members[0], members[-1]
+            text = first.page_content
+            for doc in members[1:]:
+                text = _join(text, doc, first.metadata.get("section"))
+            metadata = dict(first.metadata)
+            pages = [doc.metadata.get("page_end", doc.metadata.get("page")) for doc in members]
+            if first.metadata.get("page") is not None and None not in pages:
+                metadata["page_end"] = max(pages)
+            if len(members) > 1:
+                metadata["chunk_end"] = last.metadata.get("chunk_index")
+            passages.append((Document(page_content=text, metadata=metadata), members))
+        return passages
+    
+    def format_history(self, history: List[Dict]) -> Tuple[str, int]:
+        """The most recent exchanges that fit the history budget, and their token count"""
+        lines, used = [], 0
+        for msg in reversed(history or []):
+            exchange = []
+            if msg.get("human"):
+                exchange.append(f"Human: {msg['human']}")
+            if msg.get("assistant"):
+                exchange.append(f"Assistant: {msg['assistant']}")
+            tokens = count_tokens("\n".join(exchange)) + 1
+            if not exchange or used + tokens > self.history_max_tokens:
+                break
+            lines[:0] = exchange
+            used += tokens
+        if not lines:
+            return NO_HISTORY, count_tokens(NO_HISTORY)
+        return "\n".join(lines), used
+    
+    def build(self, question: str, docs: List[Document], history: Optional[List[Dict]] = None) -> Dict:
+        """
+        Context, history text, the chunks actually used, and token counts
+
+        `history` is only formatted when given (the prompt has a history slot).
+        """
+        question_tokens = count_tokens(question)
+        history_text, history_tokens = self.format_history(history) if history is not None else (None, 0)
+        budget = max(0, self.max_tokens - question_tokens - history_tokens)
+        
+        selected, used_docs, used = [], [], 0
+        passages = self.merge(docs)
+        for passage, members in passages:
+            header_tokens = count_tokens(_header(len(selected) + 1, passage.metadata)) + 2
+            tokens = header_tokens + count_tokens(passage.page_content)
+            if used + tokens > budget:
+                remaining = budget - used - header_tokens
+                if remaining < MIN_PASSAGE_TOKENS:
+                    continue
+                passage = Document(page_content=_truncate(passage.page_content, remaining), metadata=passage.metadata)
+                tokens = header_tokens + count_tokens(passage.page_content)
+            selected.append(passage)
+            used_docs.extend(members)
+            used += tokens
+        
+        return {
+            "context": format_docs(selected),
+            "history": history_text,
+            "docs": used_docs,
+            "tokens": {
+                "context": used,
+                "history": history_tokens,
+                "question": question_tokens,
+                "total": used + history_tokens + question_tokens,
+                "budget": self.max_tokens,
+                "chunks_retrieved": len(docs),
+                "chunks_used": len(used_docs),
+                "passages": len(selected)
+            }
+        }
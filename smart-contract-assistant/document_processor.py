@@ -1,10 +1,10 @@
 """
 Simple document processor for PDF and DOCX files
 """
+import hashlib
 import logging
 from pathlib import Path
-from typing import List
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from typing import Iterable, List, Optional, Tuple
 from langchain_core.documents import Document
 
 try:
@@ -19,64 +19,192 @@ try:
 except ImportError:
     HAS_DOCX = False
 
-from config import CHUNK_SIZE, CHUNK_OVERLAP
+from config import PDF_EXTRACT_TABLES
+from structured_splitter import SECTION_SEPARATOR, ClauseSplitter, TextBlock, blocks_from_lines, blocks_from_text
 
 logger = logging.getLogger(__name__)
 
+def file_hash(file_path: Path) -> str:
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def document_id_for(name: str) -> str:
+    """
+    Stable document id derived from a document's name, so revisions share it
+    
+    Uploads are named by their filename; bulk-ingested files by their path
+    within the ingested directory or archive, so same-named files in
+    different folders stay separate documents.
+    """
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()[:16]
+
+def assign_chunk_ids(chunks: List[Document], document_id: str):
+    """
+    Give each chunk a deterministic id based on its text
+    
+    Identical text in the same document always gets the same id, so a
+    revised file only needs new embeddings for chunks whose text changed.
+    Repeated text within a document is numbered by occurrence.
+    """
+    seen = {}
+    for chunk in chunks:
+        text_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()[:16]
+        occurrence = seen.get(text_hash, 0)
+        seen[text_hash] = occurrence + 1
+        chunk.metadata["chunk_id"] = f"{document_id}-{text_hash}-{occurrence}"
+
+def page_ranges(file_path: Path, pages_per_task: int) -> List[Tuple[int, int]]:
+    """Split a file into [start, end) page ranges; DOCX files have no pages and form one range"""
+    file_path = Path(file_path)
+    if file_path.suffix.lower() != ".pdf":
+        return [(0, 1)]
+    if not HAS_PYMUPDF:
+        raise ValueError("PyMuPDF not installed. Install with: pip install pymupdf")
+    with fitz.open(file_path) as doc:
+        total = doc.page_count
+    return [(start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task)]
+
+def _table_text(rows: List[List[Optional[str]]]) -> str:
+    """One line per row, cells separated by " | "; repeated merged cells are kept once"""
+    lines = []
+    for row in rows:
+        cells = []
+        for cell in row:
+            cell = " ".join((cell or "").split())
+            if not cells or cell != cells[-1]:
+                cells.append(cell)
+        if any(cells):
+            lines.append(" | ".join(cells))
+    return "\n".join(lines)
+
+def pdf_blocks(file_path: Path, start: int = 0, end: Optional[int] = None, tables: bool = PDF_EXTRACT_TABLES) -> List[TextBlock]:
+    """Heading, paragraph and (optionally) table blocks of PDF pages [start, end), with 1-based page numbers"""
+    if not HAS_PYMUPDF:
+        raise ValueError("PyMuPDF not installed. Install with: pip install pymupdf")
+    blocks = []
+    with fitz.open(file_path) as doc:
+        end = doc.page_count if end is None else min(end, doc.page_count)
+        for number in range(start, end):
+            page = doc[number]
+            items = []  # (top, blocks) in reading order
+            table_areas = []
+            if tables and hasattr(page, "find_tables"):
+                for table in page.find_tables().tables:
+                    table_areas.append(fitz.Rect(table.bbox))
+                    text = _table_text(table.extract())
+                    if text:
+                        items.append((table.bbox[1], [TextBlock(text, number + 1, "table")]))
+            for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks", sort=True):
+                if block_type != 0 or any(area.intersects(fitz.Rect(x0, y0, x1, y1)) for area in table_areas):
+                    continue
+                # Lines of one layout block are a paragraph wrapped by the PDF layout
+                items.append((y0, blocks_from_lines(text.split("\n"), number + 1, join_lines=True)))
+            for _, page_blocks in sorted(items, key=lambda item: item[0]):
+                blocks.extend(page_blocks)
+    return blocks
+
+def docx_blocks(file_path: Path) -> List[TextBlock]:
+    """Heading, paragraph and table blocks of a DOCX in document order, preceded by its page header"""
+    if not HAS_DOCX:
+        raise ValueError("python-docx not installed. Install with: pip install python-docx")
+    doc = DocxDocument(file_path)
+    blocks = []
+    header = [p.text.strip() for p in doc.sections[0].header.paragraphs if p.text.strip()] if doc.sections else []
+    if header:
+        blocks.append(TextBlock("\n".join(header)))
+    for item in doc.iter_inner_content():
+        if hasattr(item, "rows"):
+            text = _table_text([[cell.text for cell in row.cells] for row in item.rows])
+            if text:
+                blocks.append(TextBlock(text, kind="table"))
+            continue
+        text = item.text.strip()
+        if not text:
+            continue
+        style = item.style.name if item.style is not None else ""
+        if style.startswith("Heading") or style == "Title":
+            blocks.append(TextBlock(text, kind="heading"))
+        else:
+            blocks.extend(blocks_from_text(text))
+    return blocks
+
+def read_blocks(file_path: Path, start: int = 0, end: Optional[int] = None) -> List[TextBlock]:
+    """Structured blocks of a supported file; start/end select PDF pages"""
+    file_path = Path(file_path)
+    suffix = file_path.suffix.lower()
+    if suffix == ".pdf":
+        return pdf_blocks(file_path, start, end)
+    elif suffix == ".docx":
+        return docx_blocks(file_path)
+    else:
+        raise ValueError(f"Unsupported file type: {suffix}")
+
 class DocumentProcessor:
     """Process PDF and DOCX files into chunks"""
     
     def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
-            length_function=len,
-        )
+        self.splitter = ClauseSplitter()
     
     def extract_text_pdf(self, file_path: Path) -> str:
         """Extract text from PDF"""
-        if HAS_PYMUPDF:
-            doc = fitz.open(file_path)
-            text = "\n".join([page.get_text() for page in doc])
-            doc.close()
-            return text
-        else:
-            raise ValueError("PyMuPDF not installed. Install with: pip install pymupdf")
+        return "\n".join(block.text for block in pdf_blocks(file_path))
     
     def extract_text_docx(self, file_path: Path) -> str:
-        """Extract text from DOCX"""
-        if HAS_DOCX:
-            doc = DocxDocument(file_path)
-            text = "\n".join([para.text for para in doc.paragraphs])
-            return text
-        else:
-            raise ValueError("python-docx not installed. Install with: pip install python-docx")
+        """Extract text from DOCX, including tables"""
+        return "\n".join(block.text for block in docx_blocks(file_path))
     
-    def process_file(self, file_path: Path) -> List[Document]:
-        """Process a file and return chunks"""
+    def extract_blocks(self, file_path: Path) -> List[TextBlock]:
+        """Extract headings, paragraphs and tables from a supported file"""
         file_path = Path(file_path)
-        suffix = file_path.suffix.lower()
-        
-        # Extract text
-        if suffix == ".pdf":
-            text = self.extract_text_pdf(file_path)
-        elif suffix == ".docx":
-            text = self.extract_text_docx(file_path)
-        else:
-            raise ValueError(f"Unsupported file type: {suffix}")
-        
-        if not text.strip():
+        blocks = read_blocks(file_path)
+        if not any(block.text.strip() for block in blocks):
             raise ValueError(f"No text extracted from {file_path.name}")
+        return blocks
+    
+    def split_blocks(
+        self,
+        blocks: Iterable[TextBlock],
+        file_path: Path,
+        content_hash: Optional[str] = None,
+        document_name: Optional[str] = None
+    ) -> List[Document]:
+        """
+        Split a stream of blocks into clause-aligned chunks
         
-        # Split into chunks
-        chunks = self.text_splitter.create_documents(
-            [text],
-            metadatas=[{"filename": file_path.name, "source": str(file_path)}]
-        )
-        
-        # Add chunk index
-        for i, chunk in enumerate(chunks):
-            chunk.metadata["chunk_index"] = i
+        Besides the file fields, chunk metadata holds the section path and
+        its last heading (so "4.1 Insurance" finds "ARTICLE IV > 4.1 Insurance"),
+        the first and last page (PDF only) and whether the chunk is a table.
+        `document_name` (the filename by default) is stored as the chunks'
+        filename and the document id is derived from it.
+        """
+        file_path = Path(file_path)
+        document_name = document_name or file_path.name
+        document_id = document_id_for(document_name)
+        base_metadata = {
+            "filename": document_name,
+            "source": str(file_path),
+            "document_id": document_id,
+            "content_hash": content_hash or file_hash(file_path)
+        }
+        chunks = []
+        for i, chunk in enumerate(self.splitter.split(blocks)):
+            metadata = {**base_metadata, "chunk_index": i, "content_type": chunk.content_type}
+            if chunk.section:
+                metadata["section"] = chunk.section
+                metadata["heading"] = chunk.section.rsplit(SECTION_SEPARATOR, 1)[-1]
+            if chunk.page_start is not None:
+                metadata["page"] = chunk.page_start
+                metadata["page_end"] = chunk.page_end
+            chunks.append(Document(page_content=chunk.text, metadata=metadata))
+        assign_chunk_ids(chunks, document_id)
         
         logger.info(f"Created {len(chunks)} chunks from {file_path.name}")
         return chunks
+    
+    def process_file(self, file_path: Path) -> List[Document]:
+        """Process a file and return chunks"""
+        return self.split_blocks(self.extract_blocks(file_path), file_path)
@@ -0,0 +1,158 @@
+"""
+Persistent embedding cache backed by SQLite
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+from config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of parameters per statement
+_SQL_BATCH = 500
+# Buffered last-used updates written at once when this many accumulate
+_TOUCH_BUFFER = 1000
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that stores vectors on disk, keyed by hash(model, text)
+
+    Re-embedding text the model has already seen is a single SQLite lookup.
+    The cache holds at most `max_entries` vectors and evicts the least
+    recently used ones beyond that. Lookups only read; their last-used
+    times are buffered and written with the next insert, before eviction.
+    """
+    
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        path: Path = EMBEDDING_CACHE_PATH,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logger.info(f"Embedding cache at {self.path} holds {self._count} vectors")
+    
+    def _key(self, text: str, kind: str) -> str:
+        # Queries and documents are keyed separately since some models embed them differently
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+    
+    def _write_touches(self):
+        """Write buffered last-used times; the caller holds the lock and commits"""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()]
+            )
+            self._touched.clear()
+    
+    def _get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Look up vectors and mark them as recently used"""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                    self._touched[key] = now
+            if len(self._touched) >= _TOUCH_BUFFER:
+                self._write_touches()
+                self._conn.commit()
+        return found
+    
+    def _put_many(self, items: Dict[str, List[float]]):
+        """Store vectors and evict the least recently used ones over the cap"""
+        now = time.time()
+        with self._lock:
+            self._write_touches()
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+            )
+            self._count += self._conn.total_changes - before
+            
+            excess = self._count - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._count -= excess
+                logger.info(f"Evicted {excess} vectors from embedding cache")
+            self._conn.commit()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text, "document") for text in texts]
+        cached = self._get_many(list(set(keys)))
+        
+        # Embed each missing text once, even if it repeats in the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._put_many(computed)
+            cached.update(computed)
+        
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+        return [cached[key] for key in keys]
+    
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text, "query")
+        cached = self._get_many([key])
+        if key in cached:
+            with self._lock:
+                self.hits += 1
+            return cached[key]
+        
+        with self._lock:
+            self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self._put_many({key: vector})
+        return vector
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters and cache size"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+            "entries": self._count,
+            "max_entries": self.max_entries
+        }
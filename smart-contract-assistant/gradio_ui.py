@@ -2,20 +2,24 @@
 Gradio UI for Smart Contract Assistant
 """
 import gradio as gr
-import requests
 import logging
 
+from config import HISTORY_MAX_TOKENS, CHARS_PER_TOKEN
+from ui_client import HTTPClient
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-API_URL = "http://localhost:8001"
+# How the UI reaches the API; create_interface can swap in an in-process client
+api = HTTPClient()
 
-def chat(message: str, history):
-    """Handle chat messages - convert to messages format"""
-    if not message.strip():
-        return "", history
+def _to_api_history(history) -> list:
+    """
+    Convert history from messages format to API format
     
-    # Convert history from messages format to API format
+    Only the newest exchanges that fit the server's history budget are
+    kept, since older ones would be dropped there anyway.
+    """
     history_list = []
     if history:
         for h in history:
@@ -27,77 +31,113 @@ def chat(message: str, history):
                 elif role == "assistant" and history_list:
                     history_list[-1]["assistant"] = content
     
+    budget, kept = HISTORY_MAX_TOKENS * CHARS_PER_TOKEN, 0
+    for i in range(len(history_list) - 1, -1, -1):
+        kept += len(history_list[i]["human"]) + len(history_list[i]["assistant"])
+        if kept > budget:
+            return history_list[i + 1:]
+    return history_list
+
+def _format_answer(answer: str, sources: list, guardrail_results: dict = None) -> str:
+    """Append sources and guardrail warnings to an answer"""
+    # Add sources
+    if sources:
+        answer += "\n\n**Sources:**\n"
+        for i, source in enumerate(sources[:3], 1):
+            location = f"Page {source['page']}" if source.get("page") else f"Chunk {source.get('chunk_index', 'N/A')}"
+            section = f", {source['section']}" if source.get("section") else ""
+            answer += f"{i}. {source.get('filename', 'Unknown')} ({location}{section})\n"
+    
+    # Add guardrail warnings if any
+    if guardrail_results and not guardrail_results.get("all_passed", True):
+        answer += "\n\n **Note:** Some validation checks failed. Please verify the answer."
+    
+    return answer
+
+async def chat(message: str, history):
+    """Handle chat messages - stream the answer in messages format"""
+    if not message.strip():
+        yield "", history
+        return
+    
+    history_list = _to_api_history(history)
+    if history is None:
+        history = []
+    
+    # Add user message and a placeholder for the streamed response
+    history.append({"role": "user", "content": message})
+    history.append({"role": "assistant", "content": ""})
+    
     try:
         # Call API with history
-        use_history = len(history_list) > 0
-        response = requests.post(
-            f"{API_URL}/qa",
-            params={"question": message, "use_history": use_history},
-            json=history_list if use_history else [],
-            timeout=60
-        )
+        answer = ""
+        sources = []
+        guardrail_results = None
+        async for event in api.answer(message, history_list):
+            if event["type"] == "sources":
+                sources = event["sources"]
+            elif event["type"] == "token":
+                answer += event["content"]
+                history[-1]["content"] = answer
+                yield "", history
+            elif event["type"] == "guardrails":
+                guardrail_results = event["guardrails"]
+            elif event["type"] == "error":
+                if "status_code" in event:
+                    answer = f"API Error: {event['status_code']}"
+                else:
+                    answer = f"Error: {event['error']}"
+                sources = []
         
-        if response.status_code == 200:
-            data = response.json()
-            answer = data.get("answer", "No answer received")
-            
-            # Add sources
-            if data.get("sources"):
-                answer += "\n\n**Sources:**\n"
-                for i, source in enumerate(data["sources"][:3], 1):
-                    answer += f"{i}. {source.get('filename', 'Unknown')} (Chunk {source.get('chunk_index', 'N/A')})\n"
-            
-            # Add guardrail warnings if any
-            if data.get("guardrails") and not data["guardrails"].get("all_passed", True):
-                answer += "\n\n **Note:** Some validation checks failed. Please verify the answer."
-            
-            if history is None:
-                history = []
-            
-            # Add user message
-            history.append({"role": "user", "content": message})
-            # Add assistant response
-            history.append({"role": "assistant", "content": answer})
-            
-            return "", history
-        else:
-            error = f"API Error: {response.status_code}"
-            if history is None:
-                history = []
-            history.append({"role": "user", "content": message})
-            history.append({"role": "assistant", "content": error})
-            return "", history
+        history[-1]["content"] = _format_answer(answer or "No answer received", sources, guardrail_results)
+        yield "", history
     
     except Exception as e:
         logger.error(f"Error: {e}", exc_info=True)
-        error_msg = f"Error: {str(e)}"
-        if history is None:
-            history = []
-        history.append({"role": "user", "content": message})
-        history.append({"role": "assistant", "content": error_msg})
-        return "", history
+        history[-1]["content"] = f"Error: {str(e)}"
+        yield "", history
 
-def upload_file(file):
-    """Handle file upload"""
+async def upload_file(file):
+    """Handle file upload, then follow the ingestion job until it finishes"""
     if file is None:
-        return "No file selected", ""
+        yield "No file selected", ""
+        return
     
     try:
-        with open(file.name, "rb") as f:
-            files = {"file": (file.name, f, "application/pdf" if file.name.endswith(".pdf") else "application/vnd.openxmlformats-officedocument.wordprocessingml.document")}
-            response = requests.post(f"{API_URL}/upload", files=files, timeout=120)
+        data = await api.upload(file.name)
+        if data.get("type") == "error":
+            yield f" Error: {data.get('status_code')}", data["error"]
+            return
+        
+        yield data.get("message", "Uploaded successfully"), f"**File:** {data.get('filename')}"
         
-        if response.status_code == 200:
-            data = response.json()
-            return f"{data.get('message', 'Uploaded successfully')}", f"**File:** {data.get('filename')}\n**Chunks:** {data.get('chunks', 0)}"
-        else:
-            return f" Error: {response.status_code}", str(response.text)
+        # Follow progress; the stream sends a snapshot at least every 10s
+        async for job in api.job_progress(data["job_id"]):
+            if job.get("type") == "error":
+                yield f" Error: {job.get('status_code')}", job.get("error", "")
+                return
+            info = f"**File:** {job['filename']}\n**Chunks embedded:** {job['chunks_embedded']}/{job['chunks_new']}"
+            if job["status"] == "completed" and job["skipped"]:
+                yield "File already indexed, nothing to do", f"**File:** {job['filename']}\n**Same content as:** {job['duplicate_of']}"
+            elif job["status"] == "completed":
+                yield "File uploaded and processed successfully", (
+                    f"**File:** {job['filename']}\n**Chunks:** {job['chunks_total']} "
+                    f"({job['chunks_new']} new, {job['chunks_unchanged']} unchanged, {job['chunks_removed']} removed)"
+                )
+            elif job["status"] == "failed":
+                yield f" Error: {job['error']}", info
+            else:
+                yield f"{job['stage'].capitalize()} ({job['progress']:.0%})", info
     except Exception as e:
         logger.error(f"Upload error: {e}", exc_info=True)
-        return f" Error: {str(e)}", ""
+        yield f" Error: {str(e)}", ""
 
-def create_interface():
-    """Create Gradio interface"""
+def create_interface(client=None):
+    """Create Gradio interface; `client` replaces the HTTP client, e.g. with an in-process one"""
+    global api
+    if client is not None:
+        api = client
+    
     with gr.Blocks() as app:
         gr.Markdown("# 📄 Smart Contract Assistant")
         
@@ -129,27 +169,26 @@ def create_interface():
                 def clear_chat():
                     return [], ""
                 
-                def summarize(history):
-                    """Summarize the document"""
+                async def summarize(history):
+                    """Summarize the document, rendering the summary as it streams"""
+                    if history is None:
+                        history = []
+                    history.append({"role": "assistant", "content": "**Document Summary:**\n\n"})
                     try:
-                        response = requests.post(f"{API_URL}/summarize", timeout=120)
-                        if response.status_code == 200:
-                            data = response.json()
-                            summary = data.get("summary", "Summary not available")
-                            if history is None:
-                                history = []
-                            history.append({"role": "assistant", "content": f"**Document Summary:**\n\n{summary}"})
-                            return history
-                        else:
-                            if history is None:
-                                history = []
-                            history.append({"role": "assistant", "content": f"Error: {response.status_code}"})
-                            return history
+                        summary = ""
+                        async for event in api.summarize():
+                            if event["type"] == "token":
+                                summary += event["content"]
+                                history[-1]["content"] = f"**Document Summary:**\n\n{summary}"
+                                yield history
+                            elif event["type"] == "error":
+                                history[-1]["content"] = f"Error: {event.get('status_code', event['error'])}"
+                        if not summary and not history[-1]["content"].startswith("Error"):
+                            history[-1]["content"] = "**Document Summary:**\n\nSummary not available"
+                        yield history
                     except Exception as e:
-                        if history is None:
-                            history = []
-                        history.append({"role": "assistant", "content": f"Error: {str(e)}"})
-                        return history
+                        history[-1]["content"] = f"Error: {str(e)}"
+                        yield history
                 
                 msg.submit(chat, inputs=[msg, chatbot], outputs=[msg, chatbot])
                 clear_btn.click(clear_chat, outputs=[chatbot, msg])
@@ -2,64 +2,102 @@
 Guardrails for safety and factuality checking
 """
 import logging
-from typing import Dict, List
-from langchain_core.embeddings import Embeddings
-from sentence_transformers import SentenceTransformer
+import re
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from config import EMBEDDING_MODEL, GUARDRAIL_SIMILARITY, GUARDRAIL_MIN_SUPPORTED
+from model_registry import get_embeddings
 
 logger = logging.getLogger(__name__)
 
+# Sentences with fewer words ("Yes.", "In summary:") are not checked for grounding
+MIN_SENTENCE_WORDS = 4
+
+GENERIC_PHRASES = [
+    "i don't know",
+    "i cannot answer",
+    "no information",
+    "not available",
+    "unable to provide"
+]
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences on terminal punctuation and line breaks"""
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
 class Guardrails:
-    """Simple guardrails for response validation"""
+    """
+    Response validation against the retrieved context
+    
+    Grounding is checked per sentence: answer sentences are embedded and
+    compared with every context chunk in one similarity matrix, and a
+    sentence whose best match is below `similarity_threshold` is flagged as
+    unsupported. Chunk vectors are read from the vector store by chunk id
+    when available, so only the answer and unknown chunks are embedded.
+    Pass the manager of the store that served an answer (e.g. a tenant's)
+    to check it against that store's chunks.
+    """
     
-    def __init__(self, embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        self.embedding_model = SentenceTransformer(embedding_model)
+    def __init__(
+        self,
+        embedding_model: str = EMBEDDING_MODEL,
+        vector_store_manager=None,
+        similarity_threshold: float = GUARDRAIL_SIMILARITY,
+        min_supported: float = GUARDRAIL_MIN_SUPPORTED
+    ):
+        self.embeddings = get_embeddings(embedding_model)
+        self.vector_store_manager = vector_store_manager
+        self.similarity_threshold = similarity_threshold
+        self.min_supported = min_supported
         self.enabled = True
     
-    def validate_response(self, answer: str, context: str) -> Dict:
-        """
-        Validate response against context for factuality
-        
-        Args:
-            answer: Generated answer
-            context: Source context from documents
-            
-        Returns:
-            Dictionary with validation results
-        """
-        if not self.enabled:
-            return {"all_passed": True, "checks": []}
-        
+    def _stored_vectors(self, chunk_ids: List[str], manager) -> Dict[str, List[float]]:
+        """Chunk embeddings already in the vector store"""
+        ids = list(dict.fromkeys(chunk_id for chunk_id in chunk_ids if chunk_id))
+        if not ids or manager is None or manager.vector_store is None:
+            return {}
+        try:
+            return manager.get_chunk_embeddings(ids)
+        except Exception as e:
+            logger.error(f"Error reading chunk embeddings: {e}", exc_info=True)
+            return {}
+    
+    def _stored_texts(self, chunk_ids: List[str], manager) -> Dict[str, str]:
+        """Full texts of chunks in the vector store, for contexts passed as previews"""
+        ids = list(dict.fromkeys(chunk_id for chunk_id in chunk_ids if chunk_id))
+        if not ids or manager is None or manager.vector_store is None:
+            return {}
+        try:
+            return {chunk_id: doc.page_content for chunk_id, doc in manager.get_documents(ids).items()}
+        except Exception as e:
+            logger.error(f"Error reading chunk texts: {e}", exc_info=True)
+            return {}
+    
+    def _checks(self, answer: str, sentences: List[str], best: np.ndarray) -> Dict:
         checks = []
         
-        # Check 1: Answer should reference context
-        answer_lower = answer.lower()
-        context_lower = context.lower()
-        
-        # Simple keyword overlap check
-        answer_words = set(answer_lower.split())
-        context_words = set(context_lower.split())
-        common_words = answer_words.intersection(context_words)
-        
-        relevance_score = len(common_words) / max(len(answer_words), 1)
-        has_relevance = relevance_score > 0.1
-        
+        # Check 1: Every substantive sentence should be supported by some chunk
+        unsupported = [sentence for sentence, score in zip(sentences, best) if score < self.similarity_threshold]
+        supported = 1 - len(unsupported) / len(sentences) if sentences else 1.0
+        is_grounded = supported >= self.min_supported
         checks.append({
-            "check": "context_relevance",
-            "passed": has_relevance,
-            "score": relevance_score,
-            "message": "Answer references context" if has_relevance else "Answer may not be grounded in context"
+            "check": "grounding",
+            "passed": is_grounded,
+            "score": round(float(supported), 3),
+            "message": "Answer is supported by the context" if is_grounded else "Some statements are not supported by the context",
+            "unsupported_sentences": unsupported
         })
         
         # Check 2: Answer should not be too generic
-        generic_phrases = [
-            "i don't know",
-            "i cannot answer",
-            "no information",
-            "not available",
-            "unable to provide"
-        ]
-        is_generic = any(phrase in answer_lower for phrase in generic_phrases)
-        
+        is_generic = any(phrase in answer.lower() for phrase in GENERIC_PHRASES)
         checks.append({
             "check": "specificity",
             "passed": not is_generic,
@@ -68,18 +106,90 @@ class Guardrails:
         
         # Check 3: Answer should not be empty
         has_content = len(answer.strip()) > 10
-        
         checks.append({
             "check": "has_content",
             "passed": has_content,
             "message": "Answer has content" if has_content else "Answer is too short"
         })
         
-        all_passed = all(check["passed"] for check in checks)
-        
         return {
-            "all_passed": all_passed,
+            "all_passed": all(check["passed"] for check in checks),
             "checks": checks,
-            "relevance_score": relevance_score
+            "relevance_score": round(float(best.mean()), 3) if len(best) else 0.0,
+            "sentence_scores": [round(float(score), 3) for score in best]
         }
-
+    
+    def validate_batch(self, pairs: List[Dict], vector_store_manager=None) -> List[Dict]:
+        """
+        Validate many answers at once
+        
+        Each pair has an "answer", its "contexts" (chunk texts) and optionally
+        the matching "chunk_ids". Chunks are looked up in `vector_store_manager`,
+        by default the one the guardrails were created with; those without a
+        stored vector are embedded from their full stored text, together with
+        the sentences of all answers, in a single batch.
+        """
+        if not self.enabled:
+            return [{"all_passed": True, "checks": []} for _ in pairs]
+        
+        manager = vector_store_manager or self.vector_store_manager
+        chunk_ids = [chunk_id for pair in pairs for chunk_id in pair.get("chunk_ids") or []]
+        stored = self._stored_vectors(chunk_ids, manager)
+        full_texts = self._stored_texts([chunk_id for chunk_id in chunk_ids if chunk_id not in stored], manager)
+        texts, vectors, plans = [], [], []
+        
+        def slot(text: str, vector: Optional[List[float]] = None) -> int:
+            # Index into the final matrix; texts without a vector are embedded below
+            if vector is None:
+                texts.append(text)
+                vectors.append(None)
+            else:
+                vectors.append(vector)
+            return len(vectors) - 1
+        
+        for pair in pairs:
+            sentences = [s for s in split_sentences(pair["answer"]) if len(s.split()) >= MIN_SENTENCE_WORDS]
+            contexts = pair.get("contexts") or []
+            chunk_ids = pair.get("chunk_ids") or [None] * len(contexts)
+            plans.append((
+                sentences,
+                [slot(sentence) for sentence in sentences],
+                [slot(full_texts.get(chunk_id, text), stored.get(chunk_id)) for text, chunk_id in zip(contexts, chunk_ids)]
+            ))
+        
+        if texts:
+            embedded = iter(self.embeddings.embed_documents(texts))
+            vectors = [vector if vector is not None else next(embedded) for vector in vectors]
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32)) if vectors else np.zeros((0, 0), dtype=np.float32)
+        
+        results = []
+        for pair, (sentences, sentence_rows, context_rows) in zip(pairs, plans):
+            if sentence_rows and context_rows:
+                best = (matrix[sentence_rows] @ matrix[context_rows].T).max(axis=1)
+            else:
+                best = np.zeros(len(sentence_rows), dtype=np.float32)
+            results.append(self._checks(pair["answer"], sentences, best))
+        return results
+    
+    def validate_response(
+        self,
+        answer: str,
+        context: Union[str, List[str]],
+        chunk_ids: Optional[List[str]] = None,
+        vector_store_manager=None
+    ) -> Dict:
+        """
+        Validate response against context for factuality
+        
+        Args:
+            answer: Generated answer
+            context: Source chunk texts (or one context string)
+            chunk_ids: Ids of the chunks, to reuse their stored embeddings
+            vector_store_manager: Store the chunks come from, if not the default one
+            
+        Returns:
+            Dictionary with validation results
+        """
+        contexts = [context] if isinstance(context, str) else context
+        pair = {"answer": answer, "contexts": contexts, "chunk_ids": chunk_ids}
+        return self.validate_batch([pair], vector_store_manager)[0]
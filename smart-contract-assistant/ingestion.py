@@ -0,0 +1,257 @@
+"""
+Background ingestion queue for uploaded documents
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+import tracing
+from config import INGESTION_CONCURRENCY, INGESTION_MAX_QUEUED, JOB_HISTORY_SIZE
+from document_processor import file_hash
+from worker_pools import PoolBusyError, WorkerPool
+
+logger = logging.getLogger(__name__)
+
+# Processing stages in order; each counts for an equal share of the progress
+STAGES = ["extract", "split", "embed", "index"]
+
+class IngestionJob:
+    """Status and progress of one uploaded file"""
+    
+    def __init__(self, filename: str, file_path: Path, tenant: Optional[str] = None, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.filename = filename
+        self.file_path = file_path
+        self.tenant = tenant
+        self.trace_id = tracing.current_id()  # Trace of the upload request; stage timings are added to it
+        self.status = "queued"  # queued, running, completed, failed
+        self.stage = "queued"
+        self.content_hash = None
+        self.skipped = False  # True when identical content is already indexed
+        self.duplicate_of = None
+        self.chunks_total = 0
+        self.chunks_new = 0
+        self.chunks_unchanged = 0
+        self.chunks_removed = 0
+        self.chunks_embedded = 0
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+    
+    def update(self, **fields):
+        """Update job fields and bump the modification time"""
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.updated_at = time.time()
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+    
+    @property
+    def progress(self) -> float:
+        """Overall progress between 0 and 1"""
+        if self.status == "completed":
+            return 1.0
+        if self.stage not in STAGES:
+            return 0.0
+        done = STAGES.index(self.stage)
+        if self.stage == "embed" and self.chunks_new:
+            done += self.chunks_embedded / self.chunks_new
+        return round(done / len(STAGES), 3)
+    
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "tenant": self.tenant,
+            "trace_id": self.trace_id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "content_hash": self.content_hash,
+            "skipped": self.skipped,
+            "duplicate_of": self.duplicate_of,
+            "chunks_total": self.chunks_total,
+            "chunks_new": self.chunks_new,
+            "chunks_unchanged": self.chunks_unchanged,
+            "chunks_removed": self.chunks_removed,
+            "chunks_embedded": self.chunks_embedded,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+
+class IngestionQueue:
+    """Process uploaded files in the background with bounded concurrency"""
+    
+    def __init__(
+        self,
+        doc_processor,
+        vector_store_manager,
+        extraction_pool: WorkerPool,
+        ingest_pool: WorkerPool,
+        on_indexed: Optional[Callable[[], None]] = None,
+        concurrency: int = INGESTION_CONCURRENCY,
+        max_queued: int = INGESTION_MAX_QUEUED
+    ):
+        self.doc_processor = doc_processor
+        self.vector_store_manager = vector_store_manager
+        self.extraction_pool = extraction_pool
+        self.ingest_pool = ingest_pool
+        self.on_indexed = on_indexed
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._semaphore = None  # Created on first use, inside the running event loop
+        self._tasks = set()
+    
+    def active_jobs(self) -> int:
+        """Number of queued or running jobs"""
+        return sum(1 for job in self.jobs.values() if not job.finished)
+    
+    def tenant_busy(self, tenant: str) -> bool:
+        """Whether a queued or running job writes to a tenant's store"""
+        return any(job.tenant == tenant and not job.finished for job in self.jobs.values())
+    
+    def check_capacity(self):
+        """Raise PoolBusyError if the queue is full"""
+        if self.active_jobs() >= self.max_queued:
+            raise PoolBusyError(f"Ingestion queue is full ({self.max_queued} jobs), try again later")
+    
+    def submit(
+        self,
+        filename: str,
+        file_path: Path,
+        tenant: Optional[str] = None,
+        vector_store_manager=None,
+        on_indexed: Optional[Callable[[], None]] = None,
+        job_id: Optional[str] = None
+    ) -> IngestionJob:
+        """
+        Queue a saved file for processing and return its job
+        
+        A tenant's file is indexed into that tenant's `vector_store_manager`
+        and `on_indexed` is called instead of the queue's defaults. Pass
+        `job_id` when the id was chosen before saving, e.g. for the file's path.
+        """
+        self.check_capacity()
+        job = IngestionJob(filename, file_path, tenant, job_id)
+        self.jobs[job.id] = job
+        self._prune()
+        
+        manager = vector_store_manager or self.vector_store_manager
+        task = asyncio.create_task(self._run(job, manager, on_indexed or self.on_indexed))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        logger.info(f"Queued {filename} as job {job.id}")
+        return job
+    
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+    
+    def list_jobs(self) -> List[Dict]:
+        """All known jobs, newest first"""
+        return [job.to_dict() for job in reversed(self.jobs.values())]
+    
+    async def watch(self, job_id: str, interval: float = 0.5, heartbeat: float = 10.0) -> AsyncIterator[Dict]:
+        """
+        Yield job snapshots whenever the job changes, until it finishes
+
+        A snapshot is also sent every `heartbeat` seconds so clients with a
+        read timeout stay connected during long stages.
+        """
+        job = self.jobs[job_id]
+        last_update = None
+        last_sent = 0.0
+        while True:
+            now = time.time()
+            if job.updated_at != last_update or now - last_sent >= heartbeat:
+                last_update = job.updated_at
+                last_sent = now
+                yield job.to_dict()
+            if job.finished:
+                break
+            await asyncio.sleep(interval)
+    
+    def _prune(self):
+        """Forget the oldest finished jobs beyond the history limit"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - JOB_HISTORY_SIZE)]:
+            del self.jobs[job_id]
+    
+    async def _run(self, job: IngestionJob, manager, on_indexed: Optional[Callable[[], None]]):
+        """Run all stages of a job"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                job.update(status="running", stage="extract")
+                with tracing.span("hash"):
+                    content_hash = await self.extraction_pool.run(file_hash, job.file_path)
+                job.update(content_hash=content_hash)
+                
+                # Skip files whose exact content is already indexed
+                duplicate_of = await self.ingest_pool.run(manager.find_by_content_hash, content_hash)
+                if duplicate_of is not None:
+                    job.update(status="completed", stage="done", skipped=True, duplicate_of=duplicate_of)
+                    logger.info(f"Job {job.id}: {job.filename} is unchanged (same content as {duplicate_of}), skipping")
+                    return
+                
+                with tracing.span("extract"):
+                    blocks = await self.extraction_pool.run(self.doc_processor.extract_blocks, job.file_path)
+                
+                job.update(stage="split")
+                with tracing.span("split"):
+                    chunks = await self.extraction_pool.run(self.doc_processor.split_blocks, blocks, job.file_path, content_hash)
+                
+                # Only chunks whose text changed need embeddings
+                new_chunks, unchanged_chunks, stale_ids = await self.ingest_pool.run(
+                    manager.diff_document, chunks
+                )
+                job.update(
+                    stage="embed",
+                    chunks_total=len(chunks),
+                    chunks_new=len(new_chunks),
+                    chunks_unchanged=len(unchanged_chunks),
+                    chunks_removed=len(stale_ids)
+                )
+                with tracing.span("embed_documents"):
+                    embeddings = await self.ingest_pool.run(
+                        manager.embed_documents,
+                        new_chunks,
+                        progress_callback=lambda done: job.update(chunks_embedded=done)
+                    )
+                
+                job.update(stage="index")
+                with tracing.span("store_insert"):
+                    await self.ingest_pool.run(self._index, manager, on_indexed, new_chunks, embeddings, unchanged_chunks, stale_ids)
+                
+                job.update(status="completed", stage="done")
+                logger.info(
+                    f"Job {job.id} indexed {job.filename} in {time.perf_counter() - start:.1f}s: "
+                    f"{len(new_chunks)} new, {len(unchanged_chunks)} unchanged, {len(stale_ids)} removed chunks"
+                )
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}", exc_info=True)
+                job.update(status="failed", error=str(e))
+    
+    @staticmethod
+    def _index(
+        manager,
+        on_indexed: Optional[Callable[[], None]],
+        new_chunks: List,
+        embeddings: List[List[float]],
+        unchanged_chunks: List,
+        stale_ids: List[str]
+    ):
+        """Apply a document update to the store and notify listeners"""
+        manager.apply_document_update(new_chunks, embeddings, unchanged_chunks, stale_ids)
+        if on_indexed:
+            on_indexed()
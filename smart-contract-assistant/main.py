@@ -1,44 +1,77 @@
 """
 Main entry point for Smart Contract Assistant
+
+Each mode imports only what it runs: the UI does not load the API server,
+LangChain or the vector store, and the API server loads its vector store
+and models in the background after it starts listening. In 'both' mode the
+UI calls the API in-process instead of over HTTP.
 """
 import argparse
+import json
 import threading
-import uvicorn
-from api_server import app
-from gradio_ui import create_interface
 from config import API_PORT, UI_PORT
 
+def run_api():
+    import uvicorn
+    from api_server import app
+    uvicorn.run(app, host="0.0.0.0", port=API_PORT)
+
+def run_ui(in_process: bool = False):
+    from gradio_ui import create_interface
+    client = None
+    if in_process:
+        from ui_client import LocalClient
+        client = LocalClient()
+    ui_app = create_interface(client)
+    ui_app.launch(server_name="0.0.0.0", server_port=UI_PORT, share=False)
+
 def main():
     parser = argparse.ArgumentParser(description="Smart Contract Assistant")
     parser.add_argument(
         "--mode", 
-        choices=["api", "ui", "both"], 
+        choices=["api", "ui", "both", "migrate", "ingest"], 
         default="both",
-        help="Run mode: 'api' (backend only), 'ui' (frontend only), or 'both' (default)"
+        help="Run mode: 'api' (backend only), 'ui' (frontend only), 'both' (default), 'migrate' (copy the vector store between backends), or 'ingest' (bulk-ingest --path)"
     )
+    parser.add_argument("--path", help="Directory, zip archive or file to ingest in 'ingest' mode")
+    parser.add_argument("--source", choices=["chroma", "faiss"], default="chroma", help="Backend to migrate from")
+    parser.add_argument("--target", choices=["chroma", "faiss"], default="faiss", help="Backend to migrate to")
     args = parser.parse_args()
     
-    if args.mode == "api":
+    if args.mode == "ingest":
+        if not args.path:
+            parser.error("--path is required in ingest mode")
+        from bulk_ingest import BulkIngestor
+        from document_processor import DocumentProcessor
+        from vector_store import VectorStoreManager
+        manager = VectorStoreManager()
+        manager.load_vector_store()
+        print(f" Ingesting {args.path}")
+        job = BulkIngestor(DocumentProcessor(), manager).run(args.path)
+        print(json.dumps(job.to_dict(), indent=2))
+    
+    elif args.mode == "migrate":
+        from vector_store import VectorStoreManager
+        print(f" Migrating vector store from {args.source} to {args.target}")
+        total = VectorStoreManager(args.target).migrate_from(args.source)
+        print(f" Migrated {total} chunks; set VECTOR_STORE_TYPE={args.target} to use them")
+    
+    elif args.mode == "api":
         print(f" Starting API server on http://localhost:{API_PORT}")
-        uvicorn.run(app, host="0.0.0.0", port=API_PORT)
+        run_api()
     
     elif args.mode == "ui":
         print(f" Starting Gradio UI on http://localhost:{UI_PORT}")
-        ui_app = create_interface()
-        ui_app.launch(server_name="0.0.0.0", server_port=UI_PORT, share=False)
+        run_ui()
     
     else:  # both
         print(f" Starting API server on http://localhost:{API_PORT}")
-        api_thread = threading.Thread(
-            target=lambda: uvicorn.run(app, host="0.0.0.0", port=API_PORT),
-            daemon=True
-        )
+        api_thread = threading.Thread(target=run_api, daemon=True)
         api_thread.start()
         
         print(f" Starting Gradio UI on http://localhost:{UI_PORT}")
         print(f" Open http://localhost:{UI_PORT} in your browser")
-        ui_app = create_interface()
-        ui_app.launch(server_name="0.0.0.0", server_port=UI_PORT, share=False)
+        run_ui(in_process=True)
 
 if __name__ == "__main__":
     main()
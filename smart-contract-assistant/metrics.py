@@ -0,0 +1,222 @@
+"""
+In-process metrics: histograms, counters and read-on-demand values shared across modules
+
+Metrics are identified by name plus optional labels, e.g. the histogram
+"stage_duration_ms" with {"stage": "search"}, and can be rendered in the
+Prometheus text exposition format for the /metrics endpoint.
+"""
+import bisect
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+
+# Default buckets for latencies in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Histogram:
+    """
+    Counts of observations per bucket, with their sum
+
+    Buckets are upper bounds; values above the last one fall in an
+    overflow bucket. Quantiles are estimated as the upper bound of the
+    bucket that contains them (the largest value seen for the overflow
+    bucket).
+    """
+    
+    kind = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        buckets: Sequence[float] = LATENCY_BUCKETS_MS,
+        description: str = "",
+        labels: Optional[Dict[str, str]] = None
+    ):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile, None when empty"""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            seen += count
+            if seen >= rank:
+                return bound if bound != float("inf") else round(self.max, 3)
+        return round(self.max, 3)
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            cumulative, total = {}, 0
+            for bound, count in zip(self.buckets + [float("inf")], self.counts):
+                total += count
+                cumulative["+Inf" if bound == float("inf") else str(bound)] = total
+            return {
+                "count": self.count,
+                "sum": round(self.sum, 3),
+                "mean": round(self.sum / self.count, 3) if self.count else 0.0,
+                "max": round(self.max, 3),
+                "p50": self.quantile(0.5),
+                "p95": self.quantile(0.95),
+                "p99": self.quantile(0.99),
+                "buckets": cumulative
+            }
+    
+    def samples(self) -> List[str]:
+        """Prometheus sample lines: cumulative buckets, sum and count"""
+        with self._lock:
+            lines, total = [], 0
+            for bound, count in zip(self.buckets + [float("inf")], self.counts):
+                total += count
+                labels = _format_labels({**self.labels, "le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {total}")
+            labels = _format_labels(self.labels)
+            lines.append(f"{self.name}_sum{labels} {_format_value(round(self.sum, 3))}")
+            lines.append(f"{self.name}_count{labels} {self.count}")
+            return lines
+
+class Counter:
+    """A total that only goes up, e.g. tokens sent to the LLM"""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, description: str = "", labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self.value = 0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+    
+    def snapshot(self) -> Dict:
+        return {"value": self.value}
+    
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels)} {_format_value(self.value)}"]
+
+class Reading:
+    """
+    A value read from elsewhere when metrics are collected
+
+    For numbers a component already keeps, like a cache's hit count or a
+    pool's pending work, so they are not counted twice. `kind` is "gauge"
+    or "counter".
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        read: Callable[[], Optional[float]],
+        kind: str = "gauge",
+        description: str = "",
+        labels: Optional[Dict[str, str]] = None
+    ):
+        self.name = name
+        self.read = read
+        self.kind = kind
+        self.description = description
+        self.labels = dict(labels or {})
+    
+    def snapshot(self) -> Dict:
+        return {"value": self.read()}
+    
+    def samples(self) -> List[str]:
+        value = self.read()
+        if value is None:
+            return []
+        return [f"{self.name}{_format_labels(self.labels)} {_format_value(value)}"]
+
+_metrics: Dict[str, object] = {}
+_lock = threading.Lock()
+
+def _register(name: str, labels: Optional[Dict[str, str]], create: Callable[[], object]):
+    key = name + _format_labels(labels or {})
+    with _lock:
+        if key not in _metrics:
+            _metrics[key] = create()
+        return _metrics[key]
+
+def histogram(
+    name: str,
+    buckets: Sequence[float] = LATENCY_BUCKETS_MS,
+    description: str = "",
+    labels: Optional[Dict[str, str]] = None
+) -> Histogram:
+    """Get a histogram by name and labels, creating it on first use"""
+    return _register(name, labels, lambda: Histogram(name, buckets, description, labels))
+
+def counter(name: str, description: str = "", labels: Optional[Dict[str, str]] = None) -> Counter:
+    """Get a counter by name and labels, creating it on first use"""
+    return _register(name, labels, lambda: Counter(name, description, labels))
+
+def reading(
+    name: str,
+    read: Callable[[], Optional[float]],
+    kind: str = "gauge",
+    description: str = "",
+    labels: Optional[Dict[str, str]] = None
+) -> Reading:
+    """Register a value to read at collection time, replacing any earlier one of the same name and labels"""
+    metric = Reading(name, read, kind, description, labels)
+    with _lock:
+        _metrics[name + _format_labels(labels or {})] = metric
+    return metric
+
+def snapshot(names: Optional[List[str]] = None) -> Dict[str, Dict]:
+    """Snapshots of all metrics, or of the named ones, keyed by name and labels"""
+    return {
+        key: metric.snapshot()
+        for key, metric in list(_metrics.items())
+        if names is None or key in names or metric.name in names
+    }
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    families: Dict[str, List] = {}
+    for metric in list(_metrics.values()):
+        families.setdefault(metric.name, []).append(metric)
+    
+    lines = []
+    for name in sorted(families):
+        members = families[name]
+        description = next((m.description for m in members if m.description), "")
+        if description:
+            lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {members[0].kind}")
+        for metric in members:
+            try:
+                lines.extend(metric.samples())
+            except Exception:
+                # A failing reading must not break the whole scrape
+                continue
+    return "\n".join(lines) + "\n"
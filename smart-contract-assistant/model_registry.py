@@ -0,0 +1,89 @@
+"""
+Process-wide registry of embedding and reranking models
+
+Each model is loaded lazily, once per process, and the same instance is
+shared by every consumer (vector store, guardrails, reranker, ...).
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+from langchain_core.embeddings import Embeddings
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+logger = logging.getLogger(__name__)
+
+_models: Dict[Tuple[str, str], object] = {}
+_load_stats: Dict[str, Dict] = {}
+_lock = threading.Lock()
+
+def _resident_memory_mb() -> float:
+    """Resident memory of this process in MB, or 0 if unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+def _cross_encoder(model_name: str):
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name, device="cpu")
+
+_FACTORIES: Dict[str, Callable[[str], object]] = {
+    "embedding": lambda model_name: HuggingFaceEmbeddings(model_name=model_name),
+    "cross-encoder": _cross_encoder
+}
+
+def _load(model_name: str, kind: str = "embedding"):
+    """Load a model once; later calls return the same instance"""
+    key = (kind, model_name)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    
+    with _lock:
+        if key not in _models:
+            memory_before = _resident_memory_mb()
+            start = time.perf_counter()
+            _models[key] = _FACTORIES[kind](model_name)
+            _load_stats[model_name] = {
+                "kind": kind,
+                "load_seconds": round(time.perf_counter() - start, 2),
+                "memory_mb": round(_resident_memory_mb() - memory_before, 1)
+            }
+            logger.info(
+                f"Loaded {kind} model {model_name} in {_load_stats[model_name]['load_seconds']}s "
+                f"(+{_load_stats[model_name]['memory_mb']} MB resident)"
+            )
+        return _models[key]
+
+class SharedEmbeddings(Embeddings):
+    """Embeddings that use the shared model instance, loading it on first use"""
+    
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+    
+    @property
+    def model(self) -> HuggingFaceEmbeddings:
+        return _load(self.model_name)
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.embed_query(text)
+
+def get_embeddings(model_name: str) -> SharedEmbeddings:
+    """Get embeddings backed by the shared instance of a model"""
+    return SharedEmbeddings(model_name)
+
+def get_cross_encoder(model_name: str):
+    """Get the shared CrossEncoder for a model, loading it if needed"""
+    return _load(model_name, "cross-encoder")
+
+def loaded_models() -> Dict[str, Dict]:
+    """Load time and memory of each model loaded so far"""
+    return dict(_load_stats)
@@ -0,0 +1,105 @@
+"""
+Micro-batching of concurrent query embeddings
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+from config import QUERY_BATCH_WINDOW_MS, QUERY_BATCH_MAX_SIZE
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = metrics.histogram(
+    "query_embedding_batch_size", (1, 2, 4, 8, 16, 32, 64, 128), "Queries per batched forward pass"
+)
+QUEUE_WAIT = metrics.histogram(
+    "query_embedding_queue_wait_ms", description="Time a query waited before its batch was embedded"
+)
+EMBED_TIME = metrics.histogram(
+    "query_embedding_batch_ms", description="Duration of one batched forward pass"
+)
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that batches concurrent embed_query calls
+
+    A worker thread collects the queries that arrive within `window_ms` of
+    the first waiting one (up to `max_batch`), embeds them in one forward
+    pass and hands each caller its vector. Queries go through the wrapped
+    model's embed_documents, which is the same forward pass as embed_query
+    for symmetric models such as the default MiniLM. Document embedding is
+    passed straight through.
+    """
+    
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        window_ms: float = QUERY_BATCH_WINDOW_MS,
+        max_batch: int = QUERY_BATCH_MAX_SIZE
+    ):
+        self.embeddings = embeddings
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+    
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+                self._worker.start()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future.result()
+    
+    def _collect(self) -> list:
+        """Block for the first query, then take the ones arriving within the window"""
+        first = self._queue.get()
+        batch = [first]
+        deadline = first[2] + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.perf_counter()
+            for _, _, enqueued in batch:
+                QUEUE_WAIT.observe((start - enqueued) * 1000)
+            BATCH_SIZE.observe(len(batch))
+            
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                vectors = dict(zip(texts, self.embeddings.embed_documents(texts)))
+            except Exception as e:
+                logger.error(f"Error embedding a batch of {len(texts)} queries: {e}", exc_info=True)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            EMBED_TIME.observe((time.perf_counter() - start) * 1000)
+            for text, future, _ in batch:
+                future.set_result(vectors[text])
+    
+    def stats(self) -> Dict:
+        """Batch-size, queue-wait and forward-pass histograms"""
+        return metrics.snapshot([BATCH_SIZE.name, QUEUE_WAIT.name, EMBED_TIME.name])
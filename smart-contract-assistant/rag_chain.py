@@ -1,61 +1,119 @@
 """
 RAG chain for question answering with document retrieval
 """
+import json
 import logging
-from typing import Dict, List
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
 
-from config import LLM_PROVIDER, LLM_MODEL
+import metrics
+import tracing
+from config import LLM_PROVIDER, LLM_MODEL, LLM_MAX_CONNECTIONS, OLLAMA_BASE_URL
+from context_builder import ContextBuilder, count_tokens
 
 logger = logging.getLogger(__name__)
 
-class RAGChain:
-    """RAG chain for question answering"""
-    
-    def __init__(self, retriever):
-        self.retriever = retriever
-        self.llm = self._init_llm()
-        self.chain = self._build_chain()
+# Token counts are estimates (see context_builder.count_tokens)
+PROMPT_TOKENS = metrics.counter("llm_prompt_tokens_total", "Tokens of context, history and question sent to the LLM")
+COMPLETION_TOKENS = metrics.counter("llm_completion_tokens_total", "Tokens of answers generated by the LLM")
+CHUNKS_RETRIEVED = metrics.counter("retrieval_chunks_total", "Chunks returned by search, after reranking")
+CHUNKS_USED = metrics.counter("retrieval_chunks_used_total", "Retrieved chunks that fit in the prompt")
+CACHE_LOOKUPS = {
+    result: metrics.counter("response_cache_lookups_total", "Answer cache lookups by result", {"result": result})
+    for result in ("exact_hit", "semantic_hit", "miss")
+}
+
+_llm = None
+_llm_lock = threading.Lock()
+
+def format_sources(docs: List[Document]) -> List[Dict]:
+    """Format retrieved documents as source citations"""
+    return [
+        {
+            "filename": doc.metadata.get("filename", "Unknown"),
+            "chunk_index": doc.metadata.get("chunk_index", "N/A"),
+            "chunk_id": doc.metadata.get("chunk_id"),
+            "page": doc.metadata.get("page"),
+            "section": doc.metadata.get("section"),
+            "preview": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
+        }
+        for doc in docs
+    ]
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+def create_llm():
+    """Create an LLM client for the configured provider"""
+    provider = LLM_PROVIDER.lower()
     
-    def _init_llm(self):
-        """Initialize LLM based on provider"""
-        provider = LLM_PROVIDER.lower()
-        
-        if provider == "ollama":
+    if provider == "ollama":
+        try:
+            from langchain_ollama import ChatOllama
+            import httpx
+            # One keep-alive connection pool shared by all requests. Open connections
+            # are not capped here: the inference pool bounds concurrent requests, and
+            # a worker waiting for a connection held by a paused stream can deadlock.
+            limits = httpx.Limits(max_connections=None, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+            return ChatOllama(model=LLM_MODEL, base_url=OLLAMA_BASE_URL, client_kwargs={"limits": limits})
+        except ImportError:
             try:
-                from langchain_ollama import ChatOllama
+                from langchain_community.chat_models import ChatOllama
+                if OLLAMA_BASE_URL:
+                    return ChatOllama(model=LLM_MODEL, base_url=OLLAMA_BASE_URL)
                 return ChatOllama(model=LLM_MODEL)
             except ImportError:
-                try:
-                    from langchain_community.chat_models import ChatOllama
-                    return ChatOllama(model=LLM_MODEL)
-                except ImportError:
-                    logger.error("Ollama not available. Install: pip install langchain-ollama")
-                    raise
-        
-        elif provider == "huggingface":
-            try:
-                from langchain_community.llms import HuggingFacePipeline
-                # This requires more setup - fallback to Ollama
-                logger.warning("HuggingFace LLM requires more setup. Using Ollama fallback.")
-                from langchain_community.chat_models import ChatOllama
-                return ChatOllama(model="llama3.2")
-            except Exception as e:
-                logger.error(f"HuggingFace LLM error: {e}")
-                raise
-        
-        elif provider == "nvidia":
-            try:
-                from langchain_nvidia_ai_endpoints import ChatNVIDIA
-                return ChatNVIDIA(model=LLM_MODEL)
-            except Exception as e:
-                logger.error(f"NVIDIA LLM error: {e}")
+                logger.error("Ollama not available. Install: pip install langchain-ollama")
                 raise
-        
-        else:
-            raise ValueError(f"Unknown LLM provider: {provider}")
+    
+    elif provider == "huggingface":
+        try:
+            from langchain_community.llms import HuggingFacePipeline
+            # This requires more setup - fallback to Ollama
+            logger.warning("HuggingFace LLM requires more setup. Using Ollama fallback.")
+            from langchain_community.chat_models import ChatOllama
+            return ChatOllama(model="llama3.2")
+        except Exception as e:
+            logger.error(f"HuggingFace LLM error: {e}")
+            raise
+    
+    elif provider == "nvidia":
+        try:
+            from langchain_nvidia_ai_endpoints import ChatNVIDIA
+            return ChatNVIDIA(model=LLM_MODEL)
+        except Exception as e:
+            logger.error(f"NVIDIA LLM error: {e}")
+            raise
+    
+    else:
+        raise ValueError(f"Unknown LLM provider: {provider}")
+
+def get_llm():
+    """The process-wide LLM client, created on first use"""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = create_llm()
+                logger.info(f"Created {LLM_PROVIDER} client for {LLM_MODEL}")
+    return _llm
+
+class RAGChain:
+    """RAG chain for question answering"""
+    
+    def __init__(self, retriever, cache=None, reranker=None, context_builder=None, llm=None):
+        self.retriever = retriever
+        self.cache = cache  # Optional ResponseCache for questions without history
+        self.reranker = reranker  # Optional CrossEncoderReranker; over-fetches and keeps the best chunks
+        self.context_builder = context_builder or ContextBuilder()
+        self.llm = llm or get_llm()
+        # Both chains are compiled once; per request only their inputs change
+        self.chain = self._build_chain()
+        self.history_chain = self._build_history_chain()
     
     def _build_chain(self):
         """Build the RAG chain"""
@@ -71,39 +129,132 @@ Question: {question}
 Answer:""")
         ])
         
-        def format_docs(docs):
-            return "\n\n".join([
-                f"[Document {i+1} - {doc.metadata.get('filename', 'Unknown')}, Chunk {doc.metadata.get('chunk_index', i)}]\n{doc.page_content}"
-                for i, doc in enumerate(docs)
-            ])
+        return prompt | self.llm | StrOutputParser()
+    
+    def _embed(self, question: str, timings: Dict[str, float]) -> Optional[List[float]]:
+        """Embed the question, if the retriever has a separate embed step"""
+        if not hasattr(self.retriever, "embed_query"):
+            return None
+        start = time.perf_counter()
+        embedding = self.retriever.embed_query(question)
+        timings["embed_ms"] = tracing.record("embed_query", _elapsed_ms(start))
+        return embedding
+    
+    def _search(
+        self, question: str, embedding: Optional[List[float]], timings: Dict[str, float], where: Optional[Dict] = None
+    ) -> List[Document]:
+        """Search with the precomputed embedding, or let a plain retriever do both steps, then rerank"""
+        start = time.perf_counter()
+        if embedding is not None:
+            k = self.reranker.candidates if self.reranker else None
+            docs = self.retriever.search(embedding, k=k, query=question, where=where)
+        else:
+            docs = self.retriever.invoke(question)
+        timings["search_ms"] = tracing.record("search", _elapsed_ms(start))
         
-        chain = (
-            {"context": self.retriever | format_docs, "question": RunnablePassthrough()}
-            | prompt
-            | self.llm
-            | StrOutputParser()
-        )
+        if self.reranker:
+            start = time.perf_counter()
+            docs = self.reranker.rerank(question, docs)
+            timings["rerank_ms"] = tracing.record("rerank", _elapsed_ms(start))
+        CHUNKS_RETRIEVED.inc(len(docs))
+        return docs
+    
+    def _retrieve(self, question: str) -> Tuple[List[Document], Dict[str, float]]:
+        """Retrieve documents once, timing the embed and search steps"""
+        timings = {}
+        embedding = self._embed(question, timings)
+        return self._search(question, embedding, timings), timings
+    
+    @staticmethod
+    def _cache_key(question: str, where: Optional[Dict]) -> str:
+        """Scoped answers are cached apart from unscoped ones"""
+        return question if not where else f"{question}\n[scope] {json.dumps(where, sort_keys=True)}"
+    
+    def _cache_lookup(
+        self, question: str, embedding: Optional[List[float]] = None, where: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """
+        Look up a cached answer, exact match first
         
-        return chain
+        Called once without an embedding and, if that misses, again with the
+        query embedding for a semantic match (unscoped questions only).
+        """
+        if embedding is None:
+            cached, match = self.cache.get(self._cache_key(question, where)), "exact"
+        elif where:
+            cached = None
+            self.cache.record_miss()
+        else:
+            cached, match = self.cache.get_similar(embedding), "semantic"
+            if cached is None:
+                self.cache.record_miss()
+        if cached is None:
+            if embedding is not None:
+                CACHE_LOOKUPS["miss"].inc()
+            return None
+        CACHE_LOOKUPS[f"{match}_hit"].inc()
+        return {**cached, "question": question, "cached": match}
     
-    def invoke_with_history(self, question: str, history: List[Dict] = None) -> Dict:
-        """Answer a question with conversation history"""
-        history = history or []
+    def _prompt_inputs(
+        self, question: str, docs: List[Document], history: Optional[List[Dict]], timings: Dict[str, float]
+    ) -> Tuple[Dict, List[Document], Dict]:
+        """Prompt inputs within the token budget, the chunks they use, and token counts"""
+        start = time.perf_counter()
+        built = self.context_builder.build(question, docs, history)
+        inputs = {"context": built["context"], "question": question}
+        if history is not None:
+            inputs["history"] = built["history"]
+        timings["prompt_ms"] = tracing.record("prompt", _elapsed_ms(start))
+        PROMPT_TOKENS.inc(built["tokens"]["total"])
+        CHUNKS_USED.inc(built["tokens"]["chunks_used"])
+        return inputs, built["docs"], built["tokens"]
+    
+    def _answer(
+        self,
+        chain,
+        question: str,
+        history: Optional[List[Dict]] = None,
+        use_cache: bool = False,
+        where: Optional[Dict] = None
+    ) -> Dict:
+        """Retrieve once and feed the same documents to the prompt and the sources"""
+        use_cache = use_cache and self.cache is not None
+        start_total = time.perf_counter()
+        if use_cache:
+            cached = self._cache_lookup(question, where=where)
+            if cached is not None:
+                return {**cached, "timings": {"total_ms": _elapsed_ms(start_total)}}
+        
+        timings = {}
+        embedding = self._embed(question, timings)
+        if use_cache and embedding is not None:
+            cached = self._cache_lookup(question, embedding, where)
+            if cached is not None:
+                timings["total_ms"] = _elapsed_ms(start_total)
+                return {**cached, "timings": timings}
+        docs = self._search(question, embedding, timings, where)
+        inputs, docs, tokens = self._prompt_inputs(question, docs, history, timings)
         
-        # Format history for prompt
-        history_text = "No previous conversation."
-        if history:
-            formatted = []
-            for msg in history[-5:]:  # Last 5 exchanges
-                human = msg.get("human", "")
-                assistant = msg.get("assistant", "")
-                if human:
-                    formatted.append(f"Human: {human}")
-                if assistant:
-                    formatted.append(f"Assistant: {assistant}")
-            history_text = "\n".join(formatted)
+        start = time.perf_counter()
+        answer = chain.invoke(inputs)
+        timings["generate_ms"] = tracing.record("llm_total", _elapsed_ms(start))
+        timings["total_ms"] = _elapsed_ms(start_total)
+        COMPLETION_TOKENS.inc(count_tokens(str(answer)))
+        logger.info(f"RAG timings: {timings}, tokens: {tokens}")
         
-        # Build prompt with history
+        result = {
+            "answer": str(answer),
+            "sources": format_sources(docs),
+            "question": question,
+            "timings": timings,
+            "tokens": tokens
+        }
+        if use_cache:
+            self.cache.put(self._cache_key(question, where), result, None if where else embedding)
+        return result
+    
+    def _build_history_chain(self):
+        """Build the RAG chain with conversation history"""
         prompt_with_history = ChatPromptTemplate.from_messages([
             ("system", """You are a helpful assistant that answers questions about contracts and legal documents.
 Answer based ONLY on the provided context and previous conversation. If the context doesn't contain enough information, say so.
@@ -119,40 +270,12 @@ Question: {question}
 Answer:""")
         ])
         
-        def format_docs(docs):
-            return "\n\n".join([
-                f"[Document {i+1} - {doc.metadata.get('filename', 'Unknown')}, Chunk {doc.metadata.get('chunk_index', i)}]\n{doc.page_content}"
-                for i, doc in enumerate(docs)
-            ])
-        
-        chain_with_history = (
-            {
-                "history": lambda x: history_text,
-                "context": self.retriever | format_docs,
-                "question": RunnablePassthrough()
-            }
-            | prompt_with_history
-            | self.llm
-            | StrOutputParser()
-        )
-        
+        return prompt_with_history | self.llm | StrOutputParser()
+    
+    def invoke_with_history(self, question: str, history: List[Dict] = None, where: Optional[Dict] = None) -> Dict:
+        """Answer a question with conversation history"""
         try:
-            answer = chain_with_history.invoke(question)
-            docs = self.retriever.invoke(question)
-            sources = [
-                {
-                    "filename": doc.metadata.get("filename", "Unknown"),
-                    "chunk_index": doc.metadata.get("chunk_index", "N/A"),
-                    "preview": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
-                }
-                for doc in docs
-            ]
-            
-            return {
-                "answer": str(answer),
-                "sources": sources,
-                "question": question
-            }
+            return self._answer(self.history_chain, question, history or [], where=where)
         except Exception as e:
             logger.error(f"Error in RAG chain with history: {e}", exc_info=True)
             return {
@@ -162,28 +285,10 @@ Answer:""")
                 "error": str(e)
             }
     
-    def invoke(self, question: str) -> Dict:
-        """Answer a question"""
+    def invoke(self, question: str, use_cache: bool = True, where: Optional[Dict] = None) -> Dict:
+        """Answer a question, reusing a cached answer unless use_cache is False; `where` scopes retrieval"""
         try:
-            # Get answer
-            answer = self.chain.invoke(question)
-            
-            # Get sources
-            docs = self.retriever.invoke(question)
-            sources = [
-                {
-                    "filename": doc.metadata.get("filename", "Unknown"),
-                    "chunk_index": doc.metadata.get("chunk_index", "N/A"),
-                    "preview": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
-                }
-                for doc in docs
-            ]
-            
-            return {
-                "answer": str(answer),
-                "sources": sources,
-                "question": question
-            }
+            return self._answer(self.chain, question, use_cache=use_cache, where=where)
         except Exception as e:
             logger.error(f"Error in RAG chain: {e}", exc_info=True)
             return {
@@ -192,3 +297,70 @@ Answer:""")
                 "question": question,
                 "error": str(e)
             }
+    
+    def stream(
+        self, question: str, history: List[Dict] = None, use_cache: bool = True, where: Optional[Dict] = None
+    ) -> Iterator[Dict]:
+        """
+        Stream an answer as it is generated
+        
+        Yields a "sources" event first, then one "token" event per LLM chunk,
+        then a "done" event with the full answer and timings. A cached answer
+        arrives as a single token event. Failures are reported as a final
+        "error" event.
+        """
+        chain = self.history_chain if history else self.chain
+        use_cache = use_cache and self.cache is not None and not history
+        
+        try:
+            start_total = time.perf_counter()
+            timings = {}
+            cached = self._cache_lookup(question, where=where) if use_cache else None
+            embedding = None
+            if cached is None:
+                embedding = self._embed(question, timings)
+                if use_cache and embedding is not None:
+                    cached = self._cache_lookup(question, embedding, where)
+            if cached is not None:
+                timings["total_ms"] = _elapsed_ms(start_total)
+                yield {"type": "sources", "sources": cached["sources"]}
+                yield {"type": "token", "content": cached["answer"]}
+                yield {"type": "done", "answer": cached["answer"], "question": question, "timings": timings, "cached": cached["cached"]}
+                return
+            
+            docs = self._search(question, embedding, timings, where)
+            inputs, docs, tokens = self._prompt_inputs(question, docs, history or None, timings)
+            yield {"type": "sources", "sources": format_sources(docs)}
+            
+            start = time.perf_counter()
+            parts = []
+            for token in chain.stream(inputs):
+                if not parts:
+                    timings["first_token_ms"] = tracing.record("llm_first_token", _elapsed_ms(start))
+                parts.append(token)
+                yield {"type": "token", "content": token}
+            timings["generate_ms"] = tracing.record("llm_total", _elapsed_ms(start))
+            timings["total_ms"] = _elapsed_ms(start_total)
+            logger.info(f"RAG stream timings: {timings}")
+            
+            answer = "".join(parts)
+            COMPLETION_TOKENS.inc(count_tokens(answer))
+            if use_cache:
+                self.cache.put(self._cache_key(question, where), {
+                    "answer": answer,
+                    "sources": format_sources(docs),
+                    "question": question,
+                    "timings": timings,
+                    "tokens": tokens
+                }, None if where else embedding)
+            
+            yield {
+                "type": "done",
+                "answer": answer,
+                "question": question,
+                "timings": timings,
+                "tokens": tokens
+            }
+        except Exception as e:
+            logger.error(f"Error in RAG stream: {e}", exc_info=True)
+            yield {"type": "error", "error": str(e)}
\ No newline at end of file
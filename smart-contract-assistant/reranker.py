@@ -0,0 +1,126 @@
+"""
+Cross-encoder reranking of retrieved chunks
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from config import (
+    RERANK_MODEL, RERANK_CANDIDATES, RERANK_TOP_K, RERANK_BATCH_SIZE, RERANK_BUDGET_MS
+)
+from model_registry import get_cross_encoder
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest measurement in the per-pair cost estimate
+COST_SMOOTHING = 0.3
+
+class CrossEncoderReranker:
+    """
+    Rescore over-fetched candidates with a cross-encoder and keep the best k
+
+    The retriever fetches `candidates` chunks; each (question, chunk) pair is
+    scored by a small cross-encoder on the CPU. To stay within `budget_ms`,
+    the measured cost per pair is used to score only as many of the top
+    first-stage candidates as fit, and scoring stops between batches once
+    the budget is spent. When not even k candidates fit, or the model cannot
+    be loaded, the first-stage order is kept.
+    """
+    
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL,
+        candidates: int = RERANK_CANDIDATES,
+        top_k: int = RERANK_TOP_K,
+        batch_size: int = RERANK_BATCH_SIZE,
+        budget_ms: float = RERANK_BUDGET_MS
+    ):
+        self.model_name = model_name
+        self.candidates = candidates
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.available = True
+        self.ms_per_pair: Optional[float] = None
+        self.reranked = 0
+        self.truncated = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+    
+    def _model(self):
+        """The shared cross-encoder, or None if it cannot be loaded"""
+        if not self.available:
+            return None
+        try:
+            return get_cross_encoder(self.model_name)
+        except Exception as e:
+            logger.error(f"Reranking disabled, cannot load {self.model_name}: {e}", exc_info=True)
+            self.available = False
+            return None
+    
+    def warm_up(self) -> bool:
+        """Load the cross-encoder now instead of on the first query"""
+        return self._model() is not None
+    
+    def _affordable(self, n: int) -> int:
+        """How many of n candidates can be scored within the budget"""
+        if self.budget_ms <= 0 or self.ms_per_pair is None:
+            return n
+        return min(n, int(self.budget_ms / self.ms_per_pair))
+    
+    def _record(self, pairs: int, elapsed_ms: float):
+        cost = elapsed_ms / pairs
+        with self._lock:
+            if self.ms_per_pair is None:
+                self.ms_per_pair = cost
+            else:
+                self.ms_per_pair += COST_SMOOTHING * (cost - self.ms_per_pair)
+    
+    def rerank(self, question: str, docs: List[Document], k: Optional[int] = None) -> List[Document]:
+        """The k best documents for a question, most relevant first"""
+        k = min(k or self.top_k, len(docs))
+        model = self._model() if docs else None
+        if model is None:
+            return docs[:k]
+        
+        limit = self._affordable(len(docs))
+        if limit < k:
+            self.skipped += 1
+            # Relax the estimate so one slow call does not disable reranking for good
+            self.ms_per_pair *= 1 - COST_SMOOTHING
+            logger.info(f"Skipping rerank: {len(docs)} candidates at {self.ms_per_pair:.1f} ms each exceed {self.budget_ms} ms")
+            return docs[:k]
+        
+        scores = []
+        start = time.perf_counter()
+        for i in range(0, limit, self.batch_size):
+            batch = docs[i:min(i + self.batch_size, limit)]
+            scores.extend(model.predict([(question, doc.page_content) for doc in batch], batch_size=self.batch_size))
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if self.budget_ms > 0 and elapsed_ms > self.budget_ms and len(scores) < limit:
+                break
+        self._record(len(scores), (time.perf_counter() - start) * 1000)
+        
+        if len(scores) < len(docs):
+            self.truncated += 1
+        self.reranked += 1
+        # Unscored candidates keep their first-stage order behind the scored ones
+        order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        return ([docs[i] for i in order] + docs[len(scores):])[:k]
+    
+    def stats(self) -> Dict:
+        """Counters and the current per-pair cost estimate"""
+        return {
+            "model": self.model_name,
+            "available": self.available,
+            "candidates": self.candidates,
+            "top_k": self.top_k,
+            "budget_ms": self.budget_ms,
+            "ms_per_pair": round(self.ms_per_pair, 2) if self.ms_per_pair is not None else None,
+            "reranked": self.reranked,
+            "truncated": self.truncated,
+            "skipped": self.skipped
+        }
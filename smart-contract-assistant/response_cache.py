@@ -0,0 +1,130 @@
+"""
+Cache of RAG answers keyed by question, scoped to the vector store version
+"""
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from config import (
+    RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_SEMANTIC, RESPONSE_CACHE_SIMILARITY
+)
+
+logger = logging.getLogger(__name__)
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?.! ")
+
+class ResponseCache:
+    """
+    LRU cache of answers with a time-to-live
+
+    Exact lookups match on the normalized question. Semantic lookups, when
+    enabled, reuse the query embedding and match the most similar cached
+    question above a cosine similarity threshold. Entries are tied to the
+    vector store version, so indexing new documents invalidates them.
+    """
+    
+    def __init__(
+        self,
+        version_fn: Callable[[], int],
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        semantic: bool = RESPONSE_CACHE_SEMANTIC,
+        similarity_threshold: float = RESPONSE_CACHE_SIMILARITY
+    ):
+        self.version_fn = version_fn
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+    
+    def _expired(self, entry: Dict) -> bool:
+        return time.time() - entry["created_at"] > self.ttl_seconds
+    
+    def get(self, question: str) -> Optional[Dict]:
+        """Look up an answer by normalized question text"""
+        key = (self.version_fn(), normalize_question(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry["result"]
+    
+    def get_similar(self, embedding: List[float]) -> Optional[Dict]:
+        """Look up the answer to the most similar cached question"""
+        if not self.semantic:
+            return None
+        version = self.version_fn()
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if key[0] == version and entry["embedding"] is not None and not self._expired(entry)
+            ]
+            if not candidates:
+                return None
+            query = _unit(embedding)
+            similarities = np.stack([entry["embedding"] for _, entry in candidates]) @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            return entry["result"]
+    
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+    
+    def put(self, question: str, result: Dict, embedding: Optional[List[float]] = None):
+        """Store an answer for the current vector store version"""
+        version = self.version_fn()
+        with self._lock:
+            # Entries from older store versions can never be hit again
+            for key in [key for key in self._entries if key[0] != version]:
+                del self._entries[key]
+            
+            self._entries[(version, normalize_question(question))] = {
+                "result": result,
+                "embedding": _unit(embedding) if embedding is not None else None,
+                "created_at": time.time()
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict:
+        """Hit counters and size"""
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "semantic": self.semantic
+        }
+
+def _unit(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
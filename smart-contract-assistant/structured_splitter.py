@@ -0,0 +1,170 @@
+"""
+Structure-aware splitting of contracts into clause-aligned chunks
+"""
+import re
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from config import CHUNK_SIZE, CHUNK_OVERLAP
+
+# Longest line still treated as a heading
+MAX_HEADING_CHARS = 100
+# Longest section path; a longer run of headings is split
+MAX_SECTION_CHARS = 2 * MAX_HEADING_CHARS
+# Joins consecutive headings into a section path, e.g. "ARTICLE IV > 4.1 Insurance"
+SECTION_SEPARATOR = " > "
+
+_KEYWORD_HEADING = re.compile(
+    r"^(?:ARTICLE|Article|SECTION|Section|CLAUSE|Clause|SCHEDULE|Schedule|EXHIBIT|Exhibit|"
+    r"APPENDIX|Appendix|ANNEX|Annex)\s+(?:\d+(?:\.\d+)*|[IVXLC]+|[A-Z])\b"
+)
+_NUMBERED_HEADING = re.compile(r"^\d{1,3}(?:\.\d{1,3})*\.?\s+([A-Z].*?)[.:]?$")
+_CAPS_HEADING = re.compile(r"^[A-Z0-9][A-Z0-9 .,;:&'()/-]+$")
+_MINOR_WORDS = {"a", "an", "and", "as", "at", "by", "for", "in", "of", "on", "or", "the", "to", "with"}
+
+class TextBlock(NamedTuple):
+    """A paragraph, heading or table, with the page it is on (None when the format has no pages)"""
+    text: str
+    page: Optional[int] = None
+    kind: str = "text"  # text, heading or table
+
+class Chunk(NamedTuple):
+    text: str
+    section: Optional[str]
+    page_start: Optional[int]
+    page_end: Optional[int]
+    content_type: str  # text or table
+
+def is_heading(line: str) -> bool:
+    """Whether a line looks like a section or clause heading, e.g. "4. Insurance" or "ARTICLE IV" """
+    line = line.strip()
+    if not line or len(line) > MAX_HEADING_CHARS:
+        return False
+    if _KEYWORD_HEADING.match(line):
+        return True
+    numbered = _NUMBERED_HEADING.match(line)
+    if numbered:
+        # "4. Insurance" or "19. Proprietary Information." but not "2. The Client shall pay."
+        words = [word for word in numbered.group(1).split() if word.lower() not in _MINOR_WORDS]
+        return all(word[0].isupper() or not word[0].isalpha() for word in words)
+    return bool(_CAPS_HEADING.match(line)) and sum(char.isalpha() for char in line) >= 3
+
+def blocks_from_lines(lines: Iterable[str], page: Optional[int] = None, join_lines: bool = False) -> List[TextBlock]:
+    """
+    Turn lines into heading and text blocks
+
+    With `join_lines` consecutive non-heading lines form one paragraph (for
+    text wrapped by PDF layout); otherwise every line is its own paragraph.
+    """
+    blocks, paragraph = [], []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if is_heading(line):
+            if paragraph:
+                blocks.append(TextBlock(" ".join(paragraph), page))
+                paragraph = []
+            blocks.append(TextBlock(line, page, "heading"))
+        elif join_lines:
+            paragraph.append(line)
+        else:
+            blocks.append(TextBlock(line, page))
+    if paragraph:
+        blocks.append(TextBlock(" ".join(paragraph), page))
+    return blocks
+
+def blocks_from_text(text: str, page: Optional[int] = None) -> List[TextBlock]:
+    """Blocks from plain text with one paragraph per line"""
+    return blocks_from_lines(text.split("\n"), page)
+
+class ClauseSplitter:
+    """
+    Pack blocks into chunks that follow the document's structure
+
+    A heading always starts a new chunk and becomes the section of every
+    chunk under it; consecutive headings form a path such as
+    "ARTICLE IV > 4.1 Insurance", and headings with nothing under them
+    still get a chunk. Continuation chunks repeat the section so they stand
+    on their own. Paragraphs are packed whole up to `chunk_size`, so chunks end
+    on clause boundaries; only a paragraph longer than a chunk is cut with
+    the character splitter. Tables become separate chunks, split by rows
+    with the header row repeated.
+    """
+    
+    def __init__(self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+        self.chunk_size = chunk_size
+        self.fallback = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+        )
+    
+    @staticmethod
+    def _chunk(section: Optional[str], body: List[str], pages: List[int], content_type: str = "text") -> Chunk:
+        text = "\n".join([section] + body) if section else "\n".join(body)
+        return Chunk(text, section, min(pages) if pages else None, max(pages) if pages else None, content_type)
+    
+    def _table_chunks(self, block: TextBlock, section: Optional[str]) -> Iterator[Chunk]:
+        pages = [block.page] if block.page is not None else []
+        rows = block.text.split("\n")
+        header, body, size = rows[0], [rows[0]], len(rows[0])
+        for row in rows[1:]:
+            if size + len(row) + 1 > self.chunk_size and len(body) > 1:
+                yield self._chunk(section, body, pages, "table")
+                body, size = [header], len(header)
+            body.append(row)
+            size += len(row) + 1
+        yield self._chunk(section, body, pages, "table")
+    
+    def split(self, blocks: Iterable[TextBlock]) -> Iterator[Chunk]:
+        """Chunks in document order; blocks are consumed as a stream"""
+        section, heading_pages, after_heading = None, [], False
+        body, pages, size = [], [], 0
+        for block in blocks:
+            text = block.text.strip()
+            if not text:
+                continue
+            
+            if block.kind == "heading":
+                if body:
+                    yield self._chunk(section, body, pages)
+                heading = text[:MAX_HEADING_CHARS]
+                if after_heading and len(section) + len(SECTION_SEPARATOR) + len(heading) > MAX_SECTION_CHARS:
+                    yield self._chunk(section, [], heading_pages)
+                    after_heading = False
+                if after_heading:
+                    section = f"{section}{SECTION_SEPARATOR}{heading}"
+                else:
+                    section, heading_pages = heading, []
+                if block.page is not None:
+                    heading_pages.append(block.page)
+                after_heading = True
+                body, pages, size = [], [], len(section)
+                continue
+            
+            after_heading = False
+            if block.kind == "table":
+                if body:
+                    yield self._chunk(section, body, pages)
+                    body, pages, size = [], [], len(section or "")
+                yield from self._table_chunks(block, section)
+                continue
+            
+            if body and size + len(text) + 1 > self.chunk_size:
+                yield self._chunk(section, body, pages)
+                body, pages, size = [], [], len(section or "")
+            if size + len(text) + 1 > self.chunk_size:
+                # A single paragraph longer than a chunk
+                for piece in self.fallback.split_text(text):
+                    yield self._chunk(section, [piece], [block.page] if block.page is not None else [])
+                continue
+            body.append(text)
+            size += len(text) + 1
+            if block.page is not None:
+                pages.append(block.page)
+        if body:
+            yield self._chunk(section, body, pages)
+        elif after_heading:
+            yield self._chunk(section, [], heading_pages)
@@ -0,0 +1,210 @@
+"""
+Map-reduce summarization over every chunk of a document
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from config import (
+    LLM_MODEL, SUMMARY_CACHE_PATH, SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_GROUP_CHARS, SUMMARY_MAX_CONCURRENCY,
+    SUMMARY_REDUCE_FAN_IN
+)
+
+logger = logging.getLogger(__name__)
+
+MAP_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are a helpful assistant that summarizes contracts and legal documents.
+Summarize ONLY the provided text. Keep key terms, parties involved, obligations, amounts and dates."""),
+    ("user", """Text from {filename}:
+{text}
+
+Summary:""")
+])
+
+REDUCE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are a helpful assistant that summarizes contracts and legal documents.
+Combine the partial summaries below into one comprehensive summary of the document, including key terms,
+parties involved, main obligations, and important dates. Do not add information that is not in the summaries."""),
+    ("user", """Partial summaries of {filename}:
+{summaries}
+
+Combined summary:""")
+])
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+class DocumentSummarizer:
+    """
+    Summarize a whole document with map-reduce
+
+    Chunks are grouped into sections of about `group_chars` characters and
+    summarized in parallel (map). Partial summaries are then combined
+    `fan_in` at a time until one remains (reduce). Finished summaries are
+    cached on disk by document content hash, up to `cache_max_entries`.
+    """
+    
+    def __init__(
+        self,
+        llm,
+        vector_store_manager,
+        cache_path: Path = SUMMARY_CACHE_PATH,
+        max_concurrency: int = SUMMARY_MAX_CONCURRENCY,
+        group_chars: int = SUMMARY_GROUP_CHARS,
+        fan_in: int = SUMMARY_REDUCE_FAN_IN,
+        cache_max_entries: int = SUMMARY_CACHE_MAX_ENTRIES
+    ):
+        self.vector_store_manager = vector_store_manager
+        self.map_chain = MAP_PROMPT | llm | StrOutputParser()
+        self.reduce_chain = REDUCE_PROMPT | llm | StrOutputParser()
+        self.cache_path = Path(cache_path)
+        self.max_concurrency = max_concurrency
+        self.group_chars = group_chars
+        self.fan_in = max(2, fan_in)  # Reducing fewer than two summaries at a time never finishes
+        self.cache_max_entries = cache_max_entries
+        self._lock = threading.Lock()
+        self._cache = self._load_cache()
+    
+    def _load_cache(self) -> "OrderedDict[str, str]":
+        """Saved summaries, least recently used first"""
+        if not self.cache_path.exists():
+            return OrderedDict()
+        try:
+            return OrderedDict(json.loads(self.cache_path.read_text(encoding="utf-8")))
+        except Exception as e:
+            logger.error(f"Error loading summary cache: {e}")
+            return OrderedDict()
+    
+    def _cached(self, key: str) -> Optional[str]:
+        with self._lock:
+            summary = self._cache.get(key)
+            if summary is not None:
+                self._cache.move_to_end(key)
+            return summary
+    
+    @staticmethod
+    def _cache_key(chunks: List[Document]) -> str:
+        """Model plus the document's content hash (or a hash of the chunk text when chunks lack a single one)"""
+        content_hashes = {chunk.metadata.get("content_hash") for chunk in chunks}
+        content_hash = content_hashes.pop() if len(content_hashes) == 1 else None
+        if not content_hash:
+            content_hash = hashlib.sha256("\0".join(chunk.page_content for chunk in chunks).encode("utf-8")).hexdigest()
+        return f"{LLM_MODEL}:{content_hash}"
+    
+    def _group(self, chunks: List[Document]) -> List[str]:
+        """Join consecutive chunks into sections of about group_chars characters"""
+        groups, current, size = [], [], 0
+        for chunk in chunks:
+            if current and size + len(chunk.page_content) > self.group_chars:
+                groups.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(chunk.page_content)
+            size += len(chunk.page_content)
+        if current:
+            groups.append("\n\n".join(current))
+        return groups
+    
+    def _map_reduce(self, filename: str, chunks: List[Document], timings: Dict) -> List[str]:
+        """
+        Summarize groups in parallel, then reduce until at most `fan_in` remain
+
+        The caller runs the last reduce, so it can be streamed.
+        """
+        config = {"max_concurrency": self.max_concurrency}
+        start = time.perf_counter()
+        summaries = self.map_chain.batch(
+            [{"filename": filename, "text": group} for group in self._group(chunks)], config=config
+        )
+        timings["map_ms"] = _elapsed_ms(start)
+        
+        start = time.perf_counter()
+        while len(summaries) > self.fan_in:
+            batches = [summaries[i:i + self.fan_in] for i in range(0, len(summaries), self.fan_in)]
+            summaries = self.reduce_chain.batch(
+                [{"filename": filename, "summaries": "\n\n".join(batch)} for batch in batches], config=config
+            )
+        timings["reduce_ms"] = _elapsed_ms(start)
+        return summaries
+    
+    def _prepare(self, filename: Optional[str], document_id: Optional[str] = None):
+        # One document only: a filename (or the latest default) is resolved to its id first
+        if not document_id:
+            document_id = self.vector_store_manager.resolve_document_id(filename)
+        chunks = self.vector_store_manager.get_document_chunks(filename, document_id)
+        filename = chunks[0].metadata.get("filename", "Unknown")
+        return filename, chunks, self._cache_key(chunks)
+    
+    def _store(self, key: str, summary: str):
+        """Cache a summary, drop the least recently used ones over the cap and save"""
+        with self._lock:
+            self._cache[key] = summary
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+            tmp_path = self.cache_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(self._cache), encoding="utf-8")
+            tmp_path.replace(self.cache_path)
+    
+    def summarize(self, filename: Optional[str] = None, document_id: Optional[str] = None) -> Dict:
+        """Summarize a document by filename or id; defaults to the most recently indexed one"""
+        start_total = time.perf_counter()
+        filename, chunks, key = self._prepare(filename, document_id)
+        cached = self._cached(key)
+        if cached is not None:
+            return {"summary": cached, "filename": filename, "chunks": len(chunks), "cached": True}
+        
+        timings = {}
+        summaries = self._map_reduce(filename, chunks, timings)
+        if len(summaries) > 1:
+            summary = self.reduce_chain.invoke({"filename": filename, "summaries": "\n\n".join(summaries)})
+        else:
+            summary = summaries[0]
+        timings["total_ms"] = _elapsed_ms(start_total)
+        logger.info(f"Summarized {filename} ({len(chunks)} chunks): {timings}")
+        
+        self._store(key, summary)
+        return {"summary": summary, "filename": filename, "chunks": len(chunks), "cached": False, "timings": timings}
+    
+    def stream(self, filename: Optional[str] = None, document_id: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Stream a summary as events
+
+        The map and intermediate reduce steps run first; tokens of the final
+        reduce are streamed as "token" events, followed by a "done" event.
+        """
+        try:
+            start_total = time.perf_counter()
+            filename, chunks, key = self._prepare(filename, document_id)
+            summary = self._cached(key)
+            if summary is not None:
+                yield {"type": "token", "content": summary}
+                yield {"type": "done", "answer": summary, "filename": filename, "cached": True}
+                return
+            
+            timings = {}
+            summaries = self._map_reduce(filename, chunks, timings)
+            if len(summaries) > 1:
+                parts = []
+                for token in self.reduce_chain.stream({"filename": filename, "summaries": "\n\n".join(summaries)}):
+                    parts.append(token)
+                    yield {"type": "token", "content": token}
+                summary = "".join(parts)
+            else:
+                summary = summaries[0]
+                yield {"type": "token", "content": summary}
+            timings["total_ms"] = _elapsed_ms(start_total)
+            
+            self._store(key, summary)
+            yield {"type": "done", "answer": summary, "filename": filename, "cached": False, "timings": timings}
+        except Exception as e:
+            logger.error(f"Error streaming summary: {e}", exc_info=True)
+            yield {"type": "error", "error": str(e)}
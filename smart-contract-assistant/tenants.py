@@ -0,0 +1,163 @@
+"""
+Per-tenant vector stores, opened lazily and closed when least recently used
+"""
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from config import TENANT_MAX_OPEN
+
+logger = logging.getLogger(__name__)
+
+_TENANT_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def validate_tenant(name: str) -> str:
+    """Tenant names become directory names, so only simple names are allowed"""
+    if not _TENANT_NAME.match(name or ""):
+        raise ValueError(f"Invalid tenant name: {name!r} (use up to 64 letters, digits, '-' or '_')")
+    return name
+
+class TenantStore:
+    """
+    One tenant's vector store with the RAG chain and summarizer over it
+
+    The chain is built once the store holds documents and then reused,
+    like the main store's.
+    """
+    
+    def __init__(self, name: str, vector_store_manager, build_chain: Callable):
+        self.name = name
+        self.vector_store_manager = vector_store_manager
+        self.build_chain = build_chain  # manager -> (rag_chain, summarizer)
+        self.rag_chain = None
+        self.summarizer = None
+        self.users = 0  # Requests holding the store, counted by TenantStores
+        self._lock = threading.Lock()
+        vector_store_manager.load_vector_store()
+        self.ensure_chain()
+    
+    def ensure_chain(self):
+        """Build the chain and summarizer the first time the store has documents"""
+        if self.rag_chain is not None or self.vector_store_manager.vector_store is None:
+            return
+        with self._lock:
+            if self.rag_chain is None:
+                rag_chain, self.summarizer = self.build_chain(self.vector_store_manager)
+                self.rag_chain = rag_chain
+    
+    def close(self):
+        """Release the store's connections; it cannot be used afterwards"""
+        self.vector_store_manager.close()
+
+class TenantStores:
+    """
+    Open tenant stores, keyed by tenant name, in least recently used order
+
+    Stores are opened on first use, outside the registry lock, so opening
+    one tenant's store does not hold up requests for the others; concurrent
+    requests for a tenant being opened wait for it. Requests hold a store
+    between acquire() and release().
+    
+    Beyond `max_open`, the least recently used stores are dropped, except
+    those `in_use` reports busy (e.g. with an ingestion job writing to them).
+    A dropped store is closed once no request holds it and it is not busy;
+    the next request for the tenant opens it again.
+    """
+    
+    def __init__(
+        self,
+        open_store: Callable[[str], TenantStore],
+        max_open: int = TENANT_MAX_OPEN,
+        in_use: Optional[Callable[[str], bool]] = None
+    ):
+        self.open_store = open_store
+        self.max_open = max_open
+        self.in_use = in_use or (lambda name: False)
+        self.opened = 0
+        self.evicted = 0
+        self._stores: "OrderedDict[str, TenantStore]" = OrderedDict()
+        self._opening: Dict[str, Future] = {}  # Stores being opened, by tenant
+        self._closing: List[TenantStore] = []  # Dropped stores still held or busy
+        self._lock = threading.Lock()
+    
+    def acquire(self, name: str) -> TenantStore:
+        """
+        The open store of a tenant, opening it if needed; raises ValueError for invalid names
+        
+        The store stays open until it is given back with release().
+        """
+        validate_tenant(name)
+        with self._lock:
+            store = self._stores.get(name)
+            if store is not None:
+                self._stores.move_to_end(name)
+                store.users += 1
+                return store
+            opening = self._opening.get(name)
+            if opening is None:
+                self._opening[name] = future = Future()
+        if opening is not None:
+            store = opening.result()
+            with self._lock:
+                store.users += 1
+            return store
+        
+        try:
+            store = self.open_store(name)
+        except BaseException as e:
+            with self._lock:
+                del self._opening[name]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._opening[name]
+            self._stores[name] = store
+            store.users += 1
+            self.opened += 1
+            self._evict()
+            closable = self._closable()
+            logger.info(f"Opened vector store for tenant {name} ({len(self._stores)} open)")
+        future.set_result(store)
+        self._close(closable)
+        return store
+    
+    def release(self, store: TenantStore):
+        """Give back a store from acquire(), closing it if it was dropped meanwhile"""
+        with self._lock:
+            store.users -= 1
+            closable = self._closable()
+        self._close(closable)
+    
+    def _evict(self):
+        for name in list(self._stores)[:-1]:
+            if len(self._stores) <= self.max_open:
+                return
+            if not self.in_use(name):
+                self._closing.append(self._stores.pop(name))
+                self.evicted += 1
+    
+    def _closable(self) -> List[TenantStore]:
+        """Take the dropped stores nothing uses any more; the caller holds the lock"""
+        closable = [store for store in self._closing if store.users <= 0 and not self.in_use(store.name)]
+        self._closing = [store for store in self._closing if store not in closable]
+        return closable
+    
+    def _close(self, stores: List[TenantStore]):
+        for store in stores:
+            try:
+                store.close()
+                logger.info(f"Closed vector store for tenant {store.name}")
+            except Exception as e:
+                logger.error(f"Error closing vector store for tenant {store.name}: {e}", exc_info=True)
+    
+    def stats(self) -> Dict:
+        return {
+            "open": list(self._stores),
+            "closing": [store.name for store in self._closing],
+            "max_open": self.max_open,
+            "opened": self.opened,
+            "evicted": self.evicted
+        }
@@ -0,0 +1,170 @@
+"""
+Per-request traces and per-stage timing
+
+Each pipeline stage (file save, extraction, embedding, search, LLM, ...)
+reports its duration through record() or span(). Durations always go to the
+"stage_duration_ms" histogram; when the current request has a trace, they
+are also added to it as spans. TraceMiddleware gives every HTTP request a
+trace ID, returned in the X-Trace-Id header, and recent traces can be looked
+up by ID. Traces follow the request into worker pool threads and background
+tasks through a context variable.
+"""
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+import metrics
+from config import TRACE_REQUESTS, TRACE_HISTORY_SIZE
+
+TRACE_HEADER = "x-trace-id"
+
+# Client-supplied IDs are kept only if they look like IDs
+_VALID_ID = re.compile(r"^[A-Za-z0-9_.:-]{1,128}$")
+# W3C trace context: version-traceid-parentid-flags
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-[0-9a-f]{16}-[0-9a-f]{2}$")
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+
+class Trace:
+    """Timed spans of one request, in the order they finished"""
+    
+    def __init__(self, trace_id: Optional[str] = None, name: str = ""):
+        self.id = trace_id or uuid.uuid4().hex
+        self.name = name
+        self.started_at = time.time()
+        self.status = None
+        self.duration_ms = None
+        self.spans: List[Dict] = []
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+    
+    def add(self, stage: str, duration_ms: float):
+        """Add a span that just finished after `duration_ms`"""
+        offset = (time.perf_counter() - self._start) * 1000 - duration_ms
+        with self._lock:
+            self.spans.append({"stage": stage, "start_ms": round(max(0.0, offset), 1), "duration_ms": round(duration_ms, 1)})
+    
+    def finish(self, status: Optional[int] = None):
+        self.status = status
+        self.duration_ms = round((time.perf_counter() - self._start) * 1000, 1)
+    
+    def to_dict(self) -> Dict:
+        with self._lock:
+            spans = list(self.spans)
+        totals = {}
+        for span in spans:
+            totals[span["stage"]] = round(totals.get(span["stage"], 0.0) + span["duration_ms"], 1)
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "status": self.status,
+            "duration_ms": self.duration_ms,
+            "stages_ms": totals,
+            "spans": spans
+        }
+
+_recent: "OrderedDict[str, Trace]" = OrderedDict()
+_recent_lock = threading.Lock()
+
+def start(name: str = "", trace_id: Optional[str] = None) -> Trace:
+    """Start a trace for the current context and keep it among the recent traces"""
+    trace = Trace(trace_id, name)
+    _current.set(trace)
+    with _recent_lock:
+        _recent[trace.id] = trace
+        _recent.move_to_end(trace.id)
+        while len(_recent) > TRACE_HISTORY_SIZE:
+            _recent.popitem(last=False)
+    return trace
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+def current_id() -> Optional[str]:
+    trace = _current.get()
+    return trace.id if trace else None
+
+def get(trace_id: str) -> Optional[Dict]:
+    """A recent trace by ID, None if unknown or already forgotten"""
+    trace = _recent.get(trace_id)
+    return trace.to_dict() if trace else None
+
+def record(stage: str, duration_ms: float) -> float:
+    """Record a stage duration in the stage histogram and the current trace; returns the duration"""
+    metrics.histogram(
+        "stage_duration_ms", description="Time spent per pipeline stage", labels={"stage": stage}
+    ).observe(duration_ms)
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, duration_ms)
+    return duration_ms
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the enclosed block as a stage, also when it raises"""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, (time.perf_counter() - start_time) * 1000)
+
+def incoming_trace_id(headers: Dict[str, str]) -> Optional[str]:
+    """A trace ID sent by the client, from X-Trace-Id or a W3C traceparent header"""
+    value = headers.get(TRACE_HEADER)
+    if value and _VALID_ID.match(value):
+        return value
+    match = _TRACEPARENT.match(headers.get("traceparent", ""))
+    return match.group(1) if match else None
+
+class TraceMiddleware:
+    """
+    ASGI middleware recording request counts and durations per route
+
+    With `trace_ids` each request also gets a trace, continuing the client's
+    ID when it sends one, and the ID is returned in the X-Trace-Id header.
+    Streamed responses are timed until their last chunk is sent.
+    """
+    
+    def __init__(self, app, trace_ids: bool = TRACE_REQUESTS):
+        self.app = app
+        self.trace_ids = trace_ids
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start_time = time.perf_counter()
+        trace = None
+        if self.trace_ids:
+            headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+            trace = start(f"{scope['method']} {scope['path']}", incoming_trace_id(headers))
+        status = {"code": 500}
+        
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if trace is not None:
+                    message["headers"] = list(message.get("headers", [])) + [(TRACE_HEADER.encode(), trace.id.encode())]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            # Label by route template rather than path, so IDs in paths do not explode the label set
+            route = getattr(scope.get("route"), "path", "unmatched")
+            labels = {"route": route, "method": scope["method"]}
+            metrics.histogram(
+                "http_request_duration_ms", description="Time to serve a request, streams included", labels=labels
+            ).observe((time.perf_counter() - start_time) * 1000)
+            metrics.counter(
+                "http_requests_total", description="Requests served, by status", labels={**labels, "status": str(status["code"])}
+            ).inc()
+            if trace is not None:
+                trace.finish(status["code"])
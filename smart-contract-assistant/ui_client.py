@@ -0,0 +1,160 @@
+"""
+Clients the Gradio UI uses to reach the API
+
+HTTPClient talks to a separate API server over a pooled keep-alive
+connection; LocalClient calls the API server's service functions directly
+when both run in one process. Both yield the same event dicts as the NDJSON
+endpoints, with failures reported as {"type": "error", ...} events.
+"""
+import asyncio
+import json
+import logging
+import shutil
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from config import API_URL, UI_API_TIMEOUT, UI_API_CONNECT_TIMEOUT, UI_API_MAX_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+def _error(detail: str, status_code: Optional[int] = None) -> Dict:
+    event = {"type": "error", "error": detail}
+    if status_code is not None:
+        event["status_code"] = status_code
+    return event
+
+class HTTPClient:
+    """
+    API client over one shared httpx.AsyncClient
+
+    Connections are kept alive and reused across calls and UI sessions, up
+    to `max_connections`. The client is created on first use, inside the
+    event loop that serves the UI.
+    """
+    
+    def __init__(
+        self,
+        base_url: str = API_URL,
+        timeout: float = UI_API_TIMEOUT,
+        connect_timeout: float = UI_API_CONNECT_TIMEOUT,
+        max_connections: int = UI_API_MAX_CONNECTIONS
+    ):
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+        return self._client
+    
+    async def _events(self, method: str, path: str, **kwargs) -> AsyncIterator[Dict]:
+        """Call a streaming endpoint and yield its NDJSON events"""
+        async with self.client.stream(method, path, **kwargs) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                yield _error(body.decode(errors="replace"), response.status_code)
+                return
+            async for line in response.aiter_lines():
+                if line:
+                    yield json.loads(line)
+    
+    def answer(self, question: str, history: Optional[List[Dict]] = None) -> AsyncIterator[Dict]:
+        """Stream answer events; history is a list of {"human", "assistant"} exchanges"""
+        params = {"question": question, "use_history": bool(history)}
+        return self._events("POST", "/qa/stream", params=params, json=history or [])
+    
+    def summarize(self) -> AsyncIterator[Dict]:
+        """Stream summary events for the latest document"""
+        return self._events("POST", "/summarize/stream")
+    
+    async def upload(self, path: str) -> Dict:
+        """Upload a document; returns the queued job, or an error event"""
+        name = Path(path).name
+        with open(path, "rb") as f:
+            response = await self.client.post("/upload", files={"file": (name, f)})
+        if response.status_code not in (200, 202):
+            return _error(response.text, response.status_code)
+        return response.json()
+    
+    def job_progress(self, job_id: str) -> AsyncIterator[Dict]:
+        """Job snapshots until the job finishes"""
+        return self._events("GET", f"/jobs/{job_id}/progress")
+
+class LocalClient:
+    """
+    In-process client for when the UI and the API server share a process
+
+    Calls go straight to the API server's service functions with no HTTP
+    or JSON in between. They are scheduled on the server's event loop,
+    since the ingestion queue and worker pools belong to it, and their
+    results are awaited from the UI's loop.
+    """
+    
+    def __init__(self):
+        import api_server
+        self.server = api_server
+    
+    def _loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        return getattr(self.server.app.state, "loop", None)
+    
+    async def _call(self, coro: Awaitable):
+        """Run a coroutine on the server's loop and await its result"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop()))
+    
+    def _failure(self, e: Exception) -> Dict:
+        if isinstance(e, self.server.HTTPException):
+            return _error(str(e.detail), e.status_code)
+        if isinstance(e, self.server.PoolBusyError):
+            return _error(str(e), 503)
+        raise e
+    
+    async def _events(self, open_events: Callable[[], Awaitable[AsyncIterator[Dict]]]) -> AsyncIterator[Dict]:
+        """Open an event stream on the server's loop and relay its events"""
+        if self._loop() is None:
+            yield _error("API server is starting up", 503)
+            return
+        try:
+            events = await self._call(open_events())
+        except Exception as e:
+            yield self._failure(e)
+            return
+        try:
+            while True:
+                try:
+                    event = await self._call(events.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield event
+        finally:
+            await self._call(events.aclose())
+    
+    def answer(self, question: str, history: Optional[List[Dict]] = None) -> AsyncIterator[Dict]:
+        """Stream answer events; history is a list of {"human", "assistant"} exchanges"""
+        return self._events(lambda: self.server.open_answer_stream(question, history or None))
+    
+    def summarize(self) -> AsyncIterator[Dict]:
+        """Stream summary events for the latest document"""
+        return self._events(lambda: self.server.open_summary_stream())
+    
+    async def upload(self, path: str) -> Dict:
+        """Queue a document for processing; returns the queued job, or an error event"""
+        if self._loop() is None:
+            return _error("API server is starting up", 503)
+        save = lambda target: shutil.copyfile(path, target)
+        try:
+            return await self._call(self.server.queue_upload(Path(path).name, save))
+        except Exception as e:
+            return self._failure(e)
+    
+    def job_progress(self, job_id: str) -> AsyncIterator[Dict]:
+        """Job snapshots until the job finishes"""
+        async def open_watch():
+            if self.server.ingestion_queue.get(job_id) is None:
+                raise self.server.HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+            return self.server.ingestion_queue.watch(job_id)
+        return self._events(open_watch)
@@ -0,0 +1,486 @@
+"""
+Vector store backends: Chroma, and FAISS with a SQLite docstore
+"""
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import FAISS_INDEX_TYPE, FAISS_NLIST, FAISS_NPROBE, FAISS_PQ_M, FAISS_MMAP, FAISS_EXACT_SCOPE_MAX
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of parameters per statement
+_SQL_BATCH = 500
+
+# Metadata fields filtered on during ingestion get an index in the FAISS docstore
+_INDEXED_FIELDS = ("filename", "content_hash", "document_id", "section", "heading")
+
+class VectorBackend:
+    """
+    Storage for chunk ids, texts, metadata and embeddings
+
+    `get` returns a dict of lists keyed by "ids" plus each included field
+    ("documents", "metadatas", "embeddings"), in the same shape as Chroma.
+    `where` filters are Chroma-style: {"field": value}, {"field": {"$eq"/"$in": ...}},
+    {"$and": [...]} and {"$or": [...]}.
+    """
+    
+    name = ""
+    
+    @contextmanager
+    def batch(self):
+        """Group several writes; backends that persist on write can do so once at the end"""
+        yield
+    
+    def count(self) -> int:
+        raise NotImplementedError
+    
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict]):
+        raise NotImplementedError
+    
+    def update_metadata(self, ids: List[str], metadatas: List[Dict]):
+        raise NotImplementedError
+    
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+    
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        include: Sequence[str] = ("documents", "metadatas")
+    ) -> Dict[str, list]:
+        raise NotImplementedError
+    
+    def query(self, embedding: List[float], k: int, where: Optional[Dict] = None) -> List[Tuple[str, str, Dict]]:
+        """Nearest chunks as (id, text, metadata) tuples, among those matching `where`"""
+        raise NotImplementedError
+    
+    def close(self):
+        """Release open connections; the backend cannot be used afterwards"""
+
+class ChromaBackend(VectorBackend):
+    """Chroma collection persisted in a directory"""
+    
+    name = "chroma"
+    
+    def __init__(self, persist_directory: Path, embeddings: Embeddings):
+        from langchain_community.vectorstores import Chroma
+        
+        self.persist_directory = Path(persist_directory)
+        self.store = Chroma(persist_directory=str(self.persist_directory), embedding_function=embeddings)
+        self.collection = self.store._collection
+    
+    @staticmethod
+    def exists(persist_directory: Path) -> bool:
+        return Path(persist_directory).exists()
+    
+    def count(self) -> int:
+        return self.collection.count()
+    
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+    
+    def update_metadata(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+    
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+    
+    def get(self, ids=None, where=None, limit=None, offset=0, include=("documents", "metadatas")):
+        return self.collection.get(ids=ids, where=where, limit=limit, offset=offset or None, include=list(include))
+    
+    def query(self, embedding, k, where=None):
+        result = self.collection.query(
+            query_embeddings=[embedding], n_results=k, where=where or None, include=["documents", "metadatas"]
+        )
+        return list(zip(result["ids"][0], result["documents"][0], [m or {} for m in result["metadatas"][0]]))
+    
+    def close(self):
+        # Clients on the same directory share one system, which stops with the last of them.
+        # Older chromadb clients have no close() and keep theirs until the process exits.
+        close = getattr(self.store._client, "close", None)
+        if close is not None:
+            close()
+
+def _where_sql(where: Optional[Dict]) -> Tuple[str, list]:
+    """Translate a Chroma-style metadata filter into a SQL condition"""
+    if not where:
+        return "1", []
+    clauses, params = [], []
+    for key, value in where.items():
+        if key in ("$and", "$or"):
+            parts = [_where_sql(condition) for condition in value]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(f"({sql})" for sql, _ in parts) + ")")
+            params.extend(param for _, part_params in parts for param in part_params)
+            continue
+        field = f"json_extract(metadata, '$.{key}')"
+        if isinstance(value, dict):
+            (operator, operand), = value.items()
+            if operator == "$eq":
+                clauses.append(f"{field} = ?")
+                params.append(operand)
+            elif operator == "$in":
+                clauses.append(f"{field} IN ({','.join('?' * len(operand))})")
+                params.extend(operand)
+            else:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+        else:
+            clauses.append(f"{field} = ?")
+            params.append(value)
+    return " AND ".join(clauses), params
+
+class FaissBackend(VectorBackend):
+    """
+    FAISS index plus a SQLite docstore
+
+    The docstore keeps each chunk's text, metadata and float32 vector under an
+    integer row id, which is also the chunk's id in the FAISS index. Nothing
+    but the index is held in memory, and the index itself is memory-mapped
+    read-only on load (`FAISS_MMAP`), so startup cost does not grow with the
+    corpus. Writes go to a private copy of the index that replaces the
+    searchable one on `save`, so searches never see a half-applied write.
+    
+    Without mmap the copy is cloned from memory. A mapped index is a
+    read-only view of the file, so the copy is read from disk instead, and
+    every save rewrites the whole file in both modes; `batch()` makes a
+    group of writes cost one copy and one save.
+
+    Index types:
+        flat: exact search (IndexFlatL2)
+        ivf:  inverted lists of full vectors (IndexIVFFlat)
+        pq:   inverted lists of product-quantized codes (IndexIVFPQ)
+        sq8:  inverted lists of int8-quantized vectors (IndexIVFScalarQuantizer)
+
+    IVF-based types need training, so they start as a flat index and are
+    trained from the stored vectors once there are enough of them.
+    """
+    
+    name = "faiss"
+    
+    def __init__(
+        self,
+        persist_directory: Path,
+        index_type: str = FAISS_INDEX_TYPE,
+        nlist: int = FAISS_NLIST,
+        nprobe: int = FAISS_NPROBE,
+        pq_m: int = FAISS_PQ_M,
+        mmap: bool = FAISS_MMAP
+    ):
+        import faiss
+        
+        if index_type not in ("flat", "ivf", "pq", "sq8"):
+            raise ValueError(f"Unknown FAISS index type: {index_type}")
+        self.faiss = faiss
+        self.persist_directory = Path(persist_directory)
+        self.persist_directory.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.persist_directory / "index.faiss"
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.mmap = mmap
+        self.autosave = True  # Save after every write; batch() defers this to the end
+        self._lock = threading.Lock()  # Guards the SQLite connection
+        self._write_lock = threading.RLock()  # Serializes writers; searches never take it
+        self._pending = None  # Copy of the index being written to
+        
+        self._conn = sqlite3.connect(str(self.persist_directory / "docstore.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "row INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE NOT NULL, "
+            "document TEXT NOT NULL, metadata TEXT NOT NULL, vector BLOB NOT NULL)"
+        )
+        for field in _INDEXED_FIELDS:
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS chunks_{field} ON chunks (json_extract(metadata, '$.{field}'))"
+            )
+        self._conn.commit()
+        
+        self._index = None
+        if self.index_path.exists():
+            self._index = self._read_index()
+            logger.info(f"Loaded FAISS index with {self._index.ntotal} vectors from {self.index_path}")
+    
+    @staticmethod
+    def exists(persist_directory: Path) -> bool:
+        return (Path(persist_directory) / "docstore.sqlite3").exists()
+    
+    def _read_index(self):
+        """Map the saved index read-only, or read it into memory when mmap is off"""
+        if self.mmap:
+            flags = getattr(self.faiss, "IO_FLAG_MMAP_IFC", self.faiss.IO_FLAG_MMAP) | self.faiss.IO_FLAG_READ_ONLY
+            index = self.faiss.read_index(str(self.index_path), flags)
+        else:
+            index = self.faiss.read_index(str(self.index_path))
+        self._set_nprobe(index)
+        return index
+    
+    def _set_nprobe(self, index):
+        ivf = self.faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = self.nprobe
+    
+    def _new_index(self, dimension: int, train_vectors: Optional[np.ndarray] = None):
+        """Flat index, or a trained IVF index of the configured type"""
+        faiss = self.faiss
+        if train_vectors is None:
+            return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+        quantizer = faiss.IndexFlatL2(dimension)
+        if self.index_type == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dimension, self.nlist, self.pq_m, 8)
+        elif self.index_type == "sq8":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, self.nlist, faiss.ScalarQuantizer.QT_8bit)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dimension, self.nlist)
+        index.train(train_vectors)
+        self._set_nprobe(index)
+        return index
+    
+    def _writable_index(self, dimension: int):
+        """Private, modifiable copy of the index for the current write"""
+        if self._pending is None:
+            if self._index is not None and not self.mmap:
+                # Cloned rather than written in place, since searches read the index without locking
+                self._pending = self.faiss.clone_index(self._index)
+                self._set_nprobe(self._pending)
+            elif self.index_path.exists():
+                # A mapped index is a view of the file and cannot change
+                self._pending = self.faiss.read_index(str(self.index_path))
+                self._set_nprobe(self._pending)
+            elif self._index is not None:
+                self._pending = self.faiss.clone_index(self._index)
+            else:
+                self._pending = self._new_index(dimension)
+        return self._pending
+    
+    def _centroids(self) -> int:
+        """Largest k-means run in training: the IVF lists, or the 256 codes per PQ sub-vector"""
+        return max(self.nlist, 256) if self.index_type == "pq" else self.nlist
+
+    def _needs_training(self) -> bool:
+        return (
+            self.index_type != "flat"
+            and self.faiss.try_extract_index_ivf(self._pending) is None
+            and self._pending.ntotal >= self._centroids() * 39  # FAISS wants ~39 training points per centroid
+        )
+    
+    def _iter_vectors(self, page_size: int = 10000) -> Iterable[Tuple[np.ndarray, np.ndarray]]:
+        """All stored (row ids, vectors) in pages"""
+        last_row = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT row, vector FROM chunks WHERE row > ? ORDER BY row LIMIT ?", (last_row, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_row = rows[-1][0]
+            yield (
+                np.array([row for row, _ in rows], dtype=np.int64),
+                np.vstack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+            )
+    
+    def train(self, max_training_points: int = 256):
+        """Rebuild the index as a trained IVF index from the stored vectors"""
+        with self._write_lock:
+            total = self.count()
+            if total == 0 or self.index_type == "flat":
+                return
+            sample_size = min(total, self._centroids() * max_training_points)
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT vector FROM chunks ORDER BY RANDOM() LIMIT ?", (sample_size,)
+                ).fetchall()
+            sample = np.vstack([np.frombuffer(blob, dtype=np.float32) for blob, in rows])
+            index = self._new_index(sample.shape[1], sample)
+            for row_ids, vectors in self._iter_vectors():
+                index.add_with_ids(vectors, row_ids)
+            self._pending = index
+            logger.info(f"Trained {self.index_type} FAISS index on {len(sample)} of {total} vectors")
+    
+    def save(self):
+        """Train if due, write pending changes to disk and make them searchable"""
+        with self._write_lock:
+            if self._pending is None:
+                return
+            if self._needs_training():
+                self.train()
+            tmp_path = self.index_path.with_suffix(".tmp")
+            self.faiss.write_index(self._pending, str(tmp_path))
+            tmp_path.replace(self.index_path)
+            self._index = self._read_index() if self.mmap else self._pending
+            self._pending = None
+    
+    @contextmanager
+    def batch(self):
+        with self._write_lock:
+            autosave, self.autosave = self.autosave, False
+            try:
+                yield
+            finally:
+                self.autosave = autosave
+                self.save()
+    
+    def _written(self):
+        if self.autosave:
+            self.save()
+    
+    def close(self):
+        with self._write_lock, self._lock:
+            self._conn.close()
+            self._index = self._pending = None
+    
+    def _rows_for(self, ids: List[str]) -> Dict[str, int]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(ids), _SQL_BATCH):
+                batch = ids[start:start + _SQL_BATCH]
+                found.update(self._conn.execute(
+                    f"SELECT id, row FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+        return found
+    
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+    
+    def upsert(self, ids, embeddings, documents, metadatas):
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._write_lock:
+            index = self._writable_index(vectors.shape[1])
+            existing = self._rows_for(ids)
+            if existing:
+                index.remove_ids(np.array(list(existing.values()), dtype=np.int64))
+            
+            rows = []
+            with self._lock:
+                self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in existing])
+                for chunk_id, text, metadata, vector in zip(ids, documents, metadatas, vectors):
+                    cursor = self._conn.execute(
+                        "INSERT INTO chunks (id, document, metadata, vector) VALUES (?, ?, ?, ?)",
+                        (chunk_id, text, json.dumps(metadata or {}), vector.tobytes())
+                    )
+                    rows.append(cursor.lastrowid)
+                self._conn.commit()
+            index.add_with_ids(vectors, np.array(rows, dtype=np.int64))
+            self._written()
+    
+    def update_metadata(self, ids, metadatas):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE chunks SET metadata = ? WHERE id = ?",
+                [(json.dumps(metadata or {}), chunk_id) for chunk_id, metadata in zip(ids, metadatas)]
+            )
+            self._conn.commit()
+    
+    def delete(self, ids):
+        with self._write_lock:
+            rows = self._rows_for(ids)
+            if not rows:
+                return
+            index = self._writable_index(self._index.d if self._index is not None else self._pending.d)
+            index.remove_ids(np.array(list(rows.values()), dtype=np.int64))
+            with self._lock:
+                self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in rows])
+                self._conn.commit()
+            self._written()
+    
+    def get(self, ids=None, where=None, limit=None, offset=0, include=("documents", "metadatas")):
+        condition, params = _where_sql(where)
+        if ids is not None:
+            if not ids:
+                return {"ids": [], **{field: [] for field in include}}
+            condition += f" AND id IN ({','.join('?' * len(ids))})"
+            params = params + list(ids)
+        sql = f"SELECT id, document, metadata, vector FROM chunks WHERE {condition} ORDER BY row"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params = params + [limit if limit is not None else -1, offset]
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        
+        result = {"ids": [row[0] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [row[1] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(row[2]) for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [np.frombuffer(row[3], dtype=np.float32).tolist() for row in rows]
+        return result
+    
+    def _scoped_rows(self, index, query: np.ndarray, k: int, where: Dict) -> List[int]:
+        """
+        Nearest rows among those matching a filter
+        
+        Scopes of up to `FAISS_EXACT_SCOPE_MAX` chunks are searched exactly
+        from their stored vectors, so the cost follows the scope rather than
+        the index; larger ones search the index restricted to their rows.
+        """
+        condition, params = _where_sql(where)
+        with self._lock:
+            scoped = self._conn.execute(
+                f"SELECT row, vector FROM chunks WHERE {condition} LIMIT ?", params + [FAISS_EXACT_SCOPE_MAX + 1]
+            ).fetchall()
+            if len(scoped) > FAISS_EXACT_SCOPE_MAX:
+                scoped_rows = [row for row, in self._conn.execute(f"SELECT row FROM chunks WHERE {condition}", params)]
+        if not scoped:
+            return []
+        
+        if len(scoped) <= FAISS_EXACT_SCOPE_MAX:
+            vectors = np.frombuffer(b"".join(vector for _, vector in scoped), dtype=np.float32).reshape(len(scoped), -1)
+            distances = ((vectors - query) ** 2).sum(axis=1)
+            nearest = np.argsort(distances)[:k]
+            return [scoped[i][0] for i in nearest]
+        
+        selector = self.faiss.IDSelectorBatch(np.array(scoped_rows, dtype=np.int64))
+        if self.faiss.try_extract_index_ivf(index) is not None:
+            search_params = self.faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        else:
+            search_params = self.faiss.SearchParameters(sel=selector)
+        _, found = index.search(query, k, params=search_params)
+        return [int(row) for row in found[0] if row >= 0]
+    
+    def query(self, embedding, k, where=None):
+        index = self._index
+        if index is None or index.ntotal == 0:
+            return []
+        query = np.asarray([embedding], dtype=np.float32)
+        if where:
+            rows = self._scoped_rows(index, query, k, where)
+        else:
+            _, found = index.search(query, k)
+            rows = [int(row) for row in found[0] if row >= 0]
+        if not rows:
+            return []
+        with self._lock:
+            records = {
+                row: (chunk_id, text, json.loads(metadata))
+                for row, chunk_id, text, metadata in self._conn.execute(
+                    f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(rows))})", rows
+                )
+            }
+        return [records[row] for row in rows if row in records]
+
+def migrate(source: VectorBackend, target: VectorBackend, page_size: int = 1000) -> int:
+    """Copy every chunk, with its stored embedding, from one backend to another"""
+    total = source.count()
+    with target.batch():
+        for offset in range(0, total, page_size):
+            page = source.get(limit=page_size, offset=offset, include=("documents", "metadatas", "embeddings"))
+            target.upsert(page["ids"], [list(vector) for vector in page["embeddings"]], page["documents"], page["metadatas"])
+            logger.info(f"Migrated {min(offset + page_size, total)}/{total} chunks")
+    return total
@@ -1,62 +1,419 @@
 """
-Simple vector store manager using Chroma
+Simple vector store manager (Chroma or FAISS backend)
 """
+import json
 import logging
+import time
+import uuid
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-# BaseRetriever is not needed for this simple version
+from langchain_core.retrievers import BaseRetriever
 
-from config import EMBEDDING_MODEL, VECTOR_STORE_DIR, VECTOR_STORE_NAME
+from config import (
+    EMBEDDING_MODEL, VECTOR_STORE_DIR, VECTOR_STORE_NAME, VECTOR_STORE_TYPE, TOP_K, EMBED_BATCH_SIZE,
+    EMBEDDING_CACHE_ENABLED, QUERY_BATCHING_ENABLED, RETRIEVAL_MODE, HYBRID_CANDIDATES, RRF_K, TENANT_STORE_DIR
+)
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from embedding_cache import CachedEmbeddings
+from model_registry import get_embeddings
+from query_batcher import BatchingEmbeddings
+from vector_backends import ChromaBackend, FaissBackend, VectorBackend, migrate
 
 logger = logging.getLogger(__name__)
 
+class StoreRetriever(BaseRetriever):
+    """Retriever that exposes the embed and search steps separately
+    
+    RAGChain calls embed_query and search directly so it can time each step
+    and feed the same documents to the prompt and the returned sources.
+    """
+    
+    manager: Any
+    k: int = TOP_K
+    mode: str = RETRIEVAL_MODE  # dense or hybrid
+    where: Optional[Dict] = None  # Default metadata filter, see scope_filter
+    
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query with the store's embedding model"""
+        return self.manager.embeddings.embed_query(query)
+    
+    def search(
+        self, embedding: List[float], k: Optional[int] = None, query: Optional[str] = None, where: Optional[Dict] = None
+    ) -> List[Document]:
+        """
+        Search with a precomputed query embedding
+        
+        In hybrid mode the query text is also matched against the BM25 index
+        and both rankings are fused. `where` limits both to matching chunks.
+        """
+        k = k or self.k
+        where = where or self.where
+        if self.mode == "hybrid" and query:
+            return self.manager.hybrid_search(query, embedding, k, where=where)
+        return [doc for _, doc in self.manager.dense_search(embedding, k, where=where)]
+    
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.search(self.embed_query(query), query=query)
+
+class AmbiguousDocumentError(ValueError):
+    """A filename that several indexed documents share"""
+
+def _check_unambiguous(filename: str, metadatas: List[Optional[Dict]]):
+    """Raise AmbiguousDocumentError when chunks named `filename` belong to more than one document"""
+    document_ids = sorted({(metadata or {}).get("document_id") or filename for metadata in metadatas})
+    if len(document_ids) > 1:
+        raise AmbiguousDocumentError(
+            f"{len(document_ids)} documents are named {filename}; pass one of their document_id values: "
+            + ", ".join(document_ids)
+        )
+
+def chunk_ids(documents: List[Document]) -> List[str]:
+    """Ids for documents, using their deterministic chunk_id when present"""
+    return [doc.metadata.get("chunk_id") or str(uuid.uuid4()) for doc in documents]
+
+def scope_filter(
+    filename: Optional[str] = None, document_id: Optional[str] = None, section: Optional[str] = None
+) -> Optional[Dict]:
+    """
+    Metadata filter limiting retrieval to a document and/or section; None when unscoped
+    
+    `section` matches either the full section path ("ARTICLE IV > 4.1 Insurance")
+    or its last heading ("4.1 Insurance").
+    """
+    conditions = [{field: value} for field, value in (("filename", filename), ("document_id", document_id)) if value]
+    if section:
+        conditions.append({"$or": [{"section": section}, {"heading": section}]})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+def store_directory(backend_type: str, tenant: Optional[str] = None) -> Path:
+    """Where a backend keeps its data; each tenant has its own directory"""
+    base = TENANT_STORE_DIR / tenant if tenant else VECTOR_STORE_DIR
+    if backend_type == "faiss":
+        return base / f"{VECTOR_STORE_NAME}_faiss"
+    return base / VECTOR_STORE_NAME
+
 class VectorStoreManager:
     """Manage vector store for document embeddings"""
     
-    def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-        self.vector_store: Optional[Chroma] = None
-        self.persist_directory = VECTOR_STORE_DIR / VECTOR_STORE_NAME
+    def __init__(self, backend_type: str = VECTOR_STORE_TYPE, tenant: Optional[str] = None, shared_with=None):
+        if backend_type not in ("chroma", "faiss"):
+            raise ValueError(f"Unknown vector store type: {backend_type}")
+        if shared_with is not None:
+            # Tenant stores reuse the embedding stack (batcher thread, cache connection) of the main store
+            self.embeddings, self.query_batcher = shared_with.embeddings, shared_with.query_batcher
+        else:
+            self.embeddings = get_embeddings(EMBEDDING_MODEL)
+            self.query_batcher = None
+            if QUERY_BATCHING_ENABLED:
+                # Below the cache, so only cache misses are batched
+                self.embeddings = self.query_batcher = BatchingEmbeddings(self.embeddings)
+            if EMBEDDING_CACHE_ENABLED:
+                self.embeddings = CachedEmbeddings(self.embeddings, EMBEDDING_MODEL)
+        self.backend_type = backend_type
+        self.tenant = tenant
+        self.vector_store: Optional[VectorBackend] = None
+        self.version = 0  # Bumped on every write, so caches can tell when results go stale
+        self.persist_directory = store_directory(backend_type, tenant)
+        bm25_dir = TENANT_STORE_DIR / tenant if tenant else VECTOR_STORE_DIR
+        self.bm25 = BM25Index(bm25_dir / f"{VECTOR_STORE_NAME}_bm25.sqlite3")
+        # document_id and filename of the document written last, kept on disk next to the BM25 table
+        self._latest: Optional[Dict] = None
+        self._latest_path = bm25_dir / f"{VECTOR_STORE_NAME}_latest.json"
+    
+    def _update_lexical_index(self, added: List[Document] = (), ids: List[str] = (), removed_ids: List[str] = ()):
+        """Keep the BM25 index in step with the vector store"""
+        self.bm25.add(zip(ids, (doc.page_content for doc in added)))
+        self.bm25.remove(removed_ids)
+    
+    def _open_backend(self) -> VectorBackend:
+        if self.backend_type == "faiss":
+            return FaissBackend(self.persist_directory)
+        return ChromaBackend(self.persist_directory, self.embeddings)
+    
+    def rebuild_lexical_index(self, page_size: int = 1000):
+        """Rebuild the BM25 index from the chunks in the vector store"""
+        self.bm25.close()
+        self.bm25 = BM25Index(self.bm25.path)
+        self.bm25.clear()
+        for offset in range(0, self.vector_store.count(), page_size):
+            page = self.vector_store.get(include=["documents"], limit=page_size, offset=offset)
+            self.bm25.add(zip(page["ids"], page["documents"]))
+        logger.info(f"Rebuilt BM25 index with {len(self.bm25)} chunks")
     
     def create_vector_store(self, documents: List[Document], store_name: str = None):
         """Create a new vector store from documents"""
         logger.info(f"Creating vector store with {len(documents)} documents")
-        self.vector_store = Chroma.from_documents(
-            documents=documents,
-            embedding=self.embeddings,
-            persist_directory=str(self.persist_directory)
-        )
+        self.index_documents(documents, self.embed_documents(documents))
+        self._record_latest(documents)
         logger.info("Vector store created successfully")
     
     def add_documents(self, documents: List[Document]):
         """Add documents to existing vector store"""
         if self.vector_store is None:
             raise ValueError("Vector store not initialized")
-        self.vector_store.add_documents(documents)
+        self.index_documents(documents, self.embed_documents(documents))
+        self._record_latest(documents)
         logger.info(f"Added {len(documents)} documents to vector store")
     
+    def embed_documents(
+        self,
+        documents: List[Document],
+        batch_size: int = EMBED_BATCH_SIZE,
+        progress_callback: Optional[Callable[[int], None]] = None
+    ) -> List[List[float]]:
+        """Embed documents in batches, reporting how many are done after each batch"""
+        texts = [doc.page_content for doc in documents]
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            embeddings.extend(self.embeddings.embed_documents(texts[start:start + batch_size]))
+            if progress_callback:
+                progress_callback(len(embeddings))
+        return embeddings
+    
+    def index_documents(self, documents: List[Document], embeddings: List[List[float]]):
+        """Insert documents with precomputed embeddings, creating the store if needed"""
+        if self.vector_store is None:
+            self.vector_store = self._open_backend()
+        if not documents:
+            return
+        ids = chunk_ids(documents)
+        self.vector_store.upsert(
+            ids, embeddings, [doc.page_content for doc in documents], [doc.metadata for doc in documents]
+        )
+        self._update_lexical_index(documents, ids)
+        self.version += 1
+        logger.info(f"Indexed {len(documents)} documents in vector store")
+    
+    def find_by_content_hash(self, content_hash: str) -> Optional[str]:
+        """Filename of an indexed document with this content hash, if any"""
+        if self.vector_store is None:
+            return None
+        result = self.vector_store.get(where={"content_hash": content_hash}, limit=1, include=["metadatas"])
+        if result["metadatas"]:
+            return result["metadatas"][0].get("filename")
+        return None
+    
+    def diff_document(self, chunks: List[Document]) -> Tuple[List[Document], List[Document], List[str]]:
+        """
+        Compare a document's chunks with what is indexed for the same document
+        
+        Returns:
+            Tuple of (new chunks to embed, unchanged chunks, ids of stale chunks)
+        """
+        if self.vector_store is None or not chunks:
+            return list(chunks), [], []
+        
+        document_id = chunks[0].metadata["document_id"]
+        existing = set(self.vector_store.get(where={"document_id": document_id}, include=[])["ids"])
+        current = {chunk.metadata["chunk_id"] for chunk in chunks}
+        
+        new = [chunk for chunk in chunks if chunk.metadata["chunk_id"] not in existing]
+        unchanged = [chunk for chunk in chunks if chunk.metadata["chunk_id"] in existing]
+        stale = [chunk_id for chunk_id in existing if chunk_id not in current]
+        return new, unchanged, stale
+    
+    def apply_document_update(
+        self,
+        new_chunks: List[Document],
+        embeddings: List[List[float]],
+        unchanged_chunks: List[Document],
+        stale_ids: List[str]
+    ):
+        """Insert new chunks, refresh metadata of unchanged chunks and delete stale chunks"""
+        indexed_at = time.time()
+        for chunk in list(new_chunks) + list(unchanged_chunks):
+            chunk.metadata["indexed_at"] = indexed_at
+        if self.vector_store is None:
+            self.vector_store = self._open_backend()
+        with self.vector_store.batch():
+            self.index_documents(new_chunks, embeddings)
+            if unchanged_chunks:
+                # Chunk positions and the content hash change even when the text does not
+                self.vector_store.update_metadata(
+                    chunk_ids(unchanged_chunks), [chunk.metadata for chunk in unchanged_chunks]
+                )
+            if stale_ids:
+                self.vector_store.delete(stale_ids)
+        if stale_ids:
+            self._update_lexical_index(removed_ids=stale_ids)
+        self._record_latest(list(new_chunks) + list(unchanged_chunks))
+        self.version += 1
+        logger.info(
+            f"Document update: {len(new_chunks)} added, {len(unchanged_chunks)} unchanged, {len(stale_ids)} removed"
+        )
+    
+    def _set_latest(self, metadata: Dict):
+        self._latest = {"document_id": metadata.get("document_id"), "filename": metadata.get("filename")}
+        try:
+            self._latest_path.parent.mkdir(parents=True, exist_ok=True)
+            self._latest_path.write_text(json.dumps(self._latest))
+        except OSError as e:
+            logger.error(f"Error recording the latest document: {e}", exc_info=True)
+    
+    def _record_latest(self, chunks: List[Document]):
+        """Remember the document written last, so finding the default document needs no scan"""
+        if chunks:
+            self._set_latest(chunks[-1].metadata)
+    
+    def latest_document(self) -> Optional[Dict]:
+        """
+        document_id and filename of the most recently indexed document; None when nothing is indexed
+        
+        Recorded on every write. A store written before that is scanned once.
+        """
+        if self._latest is None and self.vector_store is not None:
+            metadatas = self.vector_store.get(include=["metadatas"])["metadatas"]
+            if metadatas:
+                self._set_latest(max(metadatas, key=lambda metadata: (metadata or {}).get("indexed_at", 0)) or {})
+        return self._latest
+    
+    def has_chunks(self, where: Optional[Dict] = None) -> bool:
+        """Whether any chunk matches a metadata filter"""
+        if self.vector_store is None:
+            return False
+        return bool(self.vector_store.get(where=where, limit=1, include=[])["ids"])
+    
+    def check_unambiguous(self, filename: str):
+        """Raise AmbiguousDocumentError when a filename matches more than one document"""
+        if self.vector_store is not None:
+            _check_unambiguous(filename, self.vector_store.get(where={"filename": filename}, include=["metadatas"])["metadatas"])
+    
+    def resolve_document_id(self, filename: Optional[str] = None) -> Optional[str]:
+        """
+        Id of the document with a filename, or of the most recently indexed document
+        
+        None for legacy chunks without an id. Raises ValueError when nothing
+        matches and AmbiguousDocumentError when several documents do.
+        """
+        if self.vector_store is None:
+            raise ValueError("Vector store not initialized")
+        if not filename:
+            latest = self.latest_document()
+            if latest is None:
+                raise ValueError("No documents indexed")
+            if latest["document_id"]:
+                return latest["document_id"]
+            filename = latest["filename"]
+        metadatas = self.vector_store.get(where={"filename": filename}, include=["metadatas"])["metadatas"]
+        if not metadatas:
+            raise ValueError(f"No indexed document named {filename}")
+        _check_unambiguous(filename, metadatas)
+        return (metadatas[0] or {}).get("document_id")
+    
+    def get_document_chunks(self, filename: Optional[str] = None, document_id: Optional[str] = None) -> List[Document]:
+        """
+        All chunks of a document in order; defaults to the most recently indexed document
+        
+        Raises AmbiguousDocumentError when a filename matches several documents.
+        """
+        if self.vector_store is None:
+            raise ValueError("Vector store not initialized")
+        if not filename and not document_id:
+            latest = self.latest_document()
+            if latest is None:
+                raise ValueError("No documents indexed")
+            document_id, filename = latest["document_id"], latest["filename"]
+        if document_id:
+            where, name = {"document_id": document_id}, f"with id {document_id}"
+        else:
+            where, name = {"filename": filename}, f"named {filename}"
+        result = self.vector_store.get(where=where, include=["documents", "metadatas"])
+        if not result["ids"]:
+            raise ValueError(f"No indexed document {name}")
+        if not document_id:
+            _check_unambiguous(filename, result["metadatas"])
+        chunks = [
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(result["documents"], result["metadatas"])
+        ]
+        return sorted(chunks, key=lambda chunk: chunk.metadata.get("chunk_index", 0))
+    
     def load_vector_store(self):
         """Load existing vector store"""
-        if not self.persist_directory.exists():
+        backend_class = FaissBackend if self.backend_type == "faiss" else ChromaBackend
+        if not backend_class.exists(self.persist_directory):
             logger.warning(f"Vector store not found at {self.persist_directory}")
             return False
         
         try:
-            self.vector_store = Chroma(
-                persist_directory=str(self.persist_directory),
-                embedding_function=self.embeddings
-            )
+            self.vector_store = self._open_backend()
+            if not self.bm25.load() or len(self.bm25) != self.vector_store.count():
+                self.rebuild_lexical_index()
+            if self._latest_path.exists():
+                self._latest = json.loads(self._latest_path.read_text())
             logger.info("Vector store loaded successfully")
             return True
         except Exception as e:
             logger.error(f"Error loading vector store: {e}")
             return False
     
-    def get_retriever(self, k: int = 5):
-        """Get a retriever from the vector store"""
+    def close(self):
+        """Close the backend and BM25 connections, e.g. when a tenant store is evicted"""
+        if self.vector_store is not None:
+            self.vector_store.close()
+            self.vector_store = None
+        self.bm25.close()
+    
+    def dense_search(self, embedding: List[float], k: int, where: Optional[Dict] = None) -> List[Tuple[str, Document]]:
+        """Nearest chunks to an embedding, as (chunk id, document) pairs"""
+        if self.vector_store is None:
+            raise ValueError("Vector store not initialized")
+        return [
+            (chunk_id, Document(page_content=text, metadata=metadata))
+            for chunk_id, text, metadata in self.vector_store.query(embedding, k, where=where)
+        ]
+    
+    def get_documents(self, ids: List[str]) -> Dict[str, Document]:
+        """Fetch chunks by id"""
+        if not ids:
+            return {}
+        result = self.vector_store.get(ids=ids, include=["documents", "metadatas"])
+        return {
+            chunk_id: Document(page_content=text, metadata=metadata or {})
+            for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+        }
+    
+    def get_chunk_embeddings(self, ids: List[str]) -> Dict[str, List[float]]:
+        """Stored embeddings of chunks by id; unknown ids are left out"""
+        result = self.vector_store.get(ids=ids, include=["embeddings"])
+        return {chunk_id: list(vector) for chunk_id, vector in zip(result["ids"], result["embeddings"])}
+    
+    def hybrid_search(
+        self, query: str, embedding: List[float], k: int, candidates: int = HYBRID_CANDIDATES, where: Optional[Dict] = None
+    ) -> List[Document]:
+        """Fuse dense and BM25 rankings with reciprocal rank fusion and keep the top k"""
+        dense = self.dense_search(embedding, candidates, where=where)
+        allowed = set(self.vector_store.get(where=where, include=[])["ids"]) if where else None
+        lexical = self.bm25.search(query, candidates, allowed=allowed)
+        fused = reciprocal_rank_fusion(
+            [[chunk_id for chunk_id, _ in dense], [chunk_id for chunk_id, _ in lexical]], k=RRF_K
+        )[:k]
+        
+        docs = dict(dense)
+        docs.update(self.get_documents([chunk_id for chunk_id in fused if chunk_id not in docs]))
+        return [docs[chunk_id] for chunk_id in fused if chunk_id in docs]
+    
+    def migrate_from(self, source_type: str, page_size: int = 1000) -> int:
+        """Copy every chunk and its embedding from another backend's store into this one"""
+        source = VectorStoreManager(source_type)
+        if not source.load_vector_store():
+            raise ValueError(f"No {source_type} vector store to migrate")
+        if self.vector_store is None:
+            self.vector_store = self._open_backend()
+        total = migrate(source.vector_store, self.vector_store, page_size)
+        self.rebuild_lexical_index()
+        self.version += 1
+        logger.info(f"Migrated {total} chunks from {source_type} to {self.backend_type}")
+        return total
+    
+    def get_retriever(self, k: int = TOP_K, mode: str = RETRIEVAL_MODE, where: Optional[Dict] = None) -> StoreRetriever:
+        """Get a retriever from the vector store, optionally limited by a metadata filter"""
         if self.vector_store is None:
             raise ValueError("Vector store not initialized")
-        return self.vector_store.as_retriever(search_kwargs={"k": k})
+        return StoreRetriever(manager=self, k=k, mode=mode, where=where)
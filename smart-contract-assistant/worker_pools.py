@@ -0,0 +1,153 @@
+"""
+Bounded worker pools for running blocking work off the event loop
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Callable, Dict, Iterator
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+class PoolBusyError(Exception):
+    """Raised when a pool already has its maximum amount of pending work"""
+
+class WorkerPool:
+    """Thread or process pool with a limit on pending work for back-pressure"""
+    
+    def __init__(self, name: str, max_workers: int, max_pending: int, kind: str = "thread"):
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.executor = self._create_executor()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.wait_time = metrics.histogram(
+            "worker_pool_wait_ms", description="Time work waited for a free worker (thread pools)", labels={"pool": name}
+        )
+    
+    def _create_executor(self) -> Executor:
+        """Create the underlying executor"""
+        if self.kind == "thread":
+            return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        elif self.kind == "process":
+            return ProcessPoolExecutor(max_workers=self.max_workers)
+        else:
+            raise ValueError(f"Unknown pool kind: {self.kind}")
+    
+    def check_capacity(self):
+        """Raise PoolBusyError if no more work can be queued right now"""
+        if self._pending >= self.max_pending:
+            raise PoolBusyError(f"{self.name} pool is busy ({self._pending} pending), try again later")
+    
+    def _acquire(self):
+        with self._lock:
+            self.check_capacity()
+            self._pending += 1
+    
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+    
+    def _timed(self, func: Callable, submitted: float, *args):
+        """Call func in a worker thread, recording how long it waited for the worker"""
+        self.wait_time.observe((time.perf_counter() - submitted) * 1000)
+        return func(*args)
+    
+    async def run(self, func: Callable, *args, **kwargs):
+        """
+        Run a blocking function in the pool and await its result
+        
+        Thread pools run it in a copy of the caller's context, so context
+        variables such as the request's trace carry over.
+        """
+        self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            call = partial(func, *args, **kwargs)
+            if self.kind == "thread":
+                call = partial(contextvars.copy_context().run, self._timed, call, time.perf_counter())
+            return await loop.run_in_executor(self.executor, call)
+        finally:
+            self._release()
+    
+    def call(self, func: Callable, *args, **kwargs):
+        """
+        Run a blocking function in the pool from a thread outside it and wait for the result
+        
+        For long-running jobs that share the pool's workers with requests:
+        the call is never refused, it queues behind the pending work.
+        """
+        with self._lock:
+            self._pending += 1
+        try:
+            call = partial(func, *args, **kwargs)
+            if self.kind == "thread":
+                call = partial(contextvars.copy_context().run, self._timed, call, time.perf_counter())
+            return self.executor.submit(call).result()
+        finally:
+            self._release()
+    
+    async def iterate(self, iterator: Iterator) -> AsyncIterator:
+        """
+        Consume a blocking iterator in the pool
+
+        The iterator holds one pending slot until it is exhausted or closed.
+        If the consumer stops early (e.g. the client disconnected), the
+        iterator is closed as soon as its current step finishes, so a
+        half-read LLM stream gives its connection back right away rather
+        than at garbage collection. Only thread pools can iterate, since
+        iterators cannot be sent to another process.
+        """
+        if self.kind != "thread":
+            raise ValueError("Only thread pools can iterate")
+        self._acquire()
+        context = contextvars.copy_context()
+        step = None
+        try:
+            while True:
+                step = self.executor.submit(context.run, self._timed, next, time.perf_counter(), iterator, _DONE)
+                item = await asyncio.wrap_future(step)
+                if item is _DONE:
+                    step = None
+                    break
+                yield item
+        finally:
+            if step is not None:
+                # Runs in the worker still executing the step, or here if it is done.
+                # Not submitted to the pool: its workers may be blocked waiting for
+                # the very connections the abandoned iterators hold.
+                step.add_done_callback(lambda _: self._close(iterator))
+            self._release()
+    
+    def _close(self, iterator: Iterator):
+        """Close an abandoned iterator"""
+        close = getattr(iterator, "close", None)
+        if close is None:
+            return
+        try:
+            close()
+        except Exception:
+            logger.warning(f"Failed to close an abandoned {self.name} iterator", exc_info=True)
+    
+    def stats(self) -> Dict:
+        """Current load of the pool"""
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending
+        }
+    
+    def shutdown(self):
+        """Shut down the pool without waiting for queued work"""
+        logger.info(f"Shutting down {self.name} pool")
+        self.executor.shutdown(wait=False, cancel_futures=True)